@@ -21,6 +21,8 @@ def main():
     parser.add_argument("--abundance-col", type=str, default="Abundance_RPKs",
                         help="Column name for abundance")
     parser.add_argument("--all-food", action="store_true", help="Enable use of all foods from foodb")
+    parser.add_argument("--cohort", type=str, default="",
+                        help="Also store graph results in this cohort directory for the graph comparison scripts")
 
     # Snakemake execution options
     parser.add_argument("--cores", type=int, default=1, help="Number of cores to use")
@@ -48,7 +50,8 @@ def main():
         "n_weights": args.n_weights,
         "include_orgs": args.include_orgs,
         "abundance_col": args.abundance_col,
-        "all_food": args.all_food
+        "all_food": args.all_food,
+        "cohort": args.cohort
     }
 
     # Write config to a temporary JSON file
@@ -1,22 +1,33 @@
 from __future__ import annotations
 import argparse
-import ast
 import logging
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from scipy.cluster.hierarchy import linkage, dendrogram, leaves_list
 from scipy.spatial.distance import squareform
-from skbio import DistanceMatrix
-from skbio.stats.distance import permanova
 from statsmodels.stats.multitest import multipletests
 
+from dietmicrobenet import cohort
+from dietmicrobenet.comparestore import update_stores
+from dietmicrobenet.kos import ko_union
+from dietmicrobenet.patterns import key_origins
+from dietmicrobenet.permanova import PERMANOVA_ENGINES, permanova_many
+from dietmicrobenet.results import load_results
+from dietmicrobenet.similarity import SimilarityCache, jaccard_similarity, subset_matrix
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
+# Columns subset_graphs splits on
+ORIGIN_COLS = ["compound1_origin", "compound2_origin"]
+
+# Compared pattern subsets, in output order
+PATTERN_NAMES = ["Food to Microbe", "Least Restrictive Patterns"]
+
 
 def csv_to_inputs(metadata: str, paths_col: str, names_col: str) -> Tuple[List[str], List[str]]:
     """Read metadata CSV and return paths and names"""
@@ -34,22 +45,37 @@ def csv_to_inputs(metadata: str, paths_col: str, names_col: str) -> Tuple[List[s
     return paths_list, names_list
 
 
-def get_graphs(paths: List[str], names: List[str]) -> Dict[str, pd.DataFrame]:
-    """Read each CSV path into a dataframe keyed by the corresponding name."""
+def get_graphs(
+    paths: List[str],
+    names: List[str],
+    columns: Optional[List[str]] = None,
+    workers: int = 1,
+) -> Dict[str, pd.DataFrame]:
+    """Read each result file (CSV or parquet, compact or not) into a dataframe keyed by the corresponding name.
+
+    Args:
+        paths: Result file paths.
+        names: Sample name of each path.
+        columns: Only read these columns, as categoricals (default: every column).
+        workers: Number of files read concurrently.
+
+    Returns:
+        Dict mapping sample name to its results dataframe.
+    """
     if len(paths) != len(names):
         raise ValueError("Number of names not equal to the number of paths provided.")
+    if len(set(names)) != len(names):
+        duplicate = next(n for n in names if names.count(n) > 1)
+        raise ValueError(f"Duplicate name detected: '{duplicate}'. Names must be unique.")
+    for name, p in zip(names, paths):
+        if not Path(p).exists():
+            raise FileNotFoundError(f"Graph CSV not found for sample '{name}': {p}")
 
     graph_dict: Dict[str, pd.DataFrame] = {}
-    for idx, p in enumerate(paths):
-        name = names[idx]
-        if name in graph_dict:
-            raise ValueError(f"Duplicate name detected: '{name}'. Names must be unique.")
-        pth = Path(p)
-        if not pth.exists():
-            raise FileNotFoundError(f"Graph CSV not found for sample '{name}': {p}")
-        df = pd.read_csv(pth)
+    loaded = load_results(paths, columns=columns, categorical=columns or (), workers=workers)
+    for name, (df, seconds) in zip(names, loaded):
+        logging.info(f"Loaded '{name}' ({len(df)} rows) in {seconds:.2f} s")
         graph_dict[name] = df
-
     return graph_dict
 
 
@@ -73,29 +99,19 @@ def subset_graphs(graph_dict: Dict[str, pd.DataFrame]) -> Tuple[Dict[str, pd.Dat
     return food_microbe, least_restrictive
 
 
-def _safe_literal_eval(item):
-    """Try to parse a string representation of a list; return empty list on failure."""
-    if item is None or (isinstance(item, float) and np.isnan(item)):
-        return []
-    # If it's already a list/tuple, return as list
-    if isinstance(item, (list, tuple, set)):
-        return list(item)
-    # Strings: try literal_eval, fallback to simple parsing
-    s = str(item).strip()
-    if s == "":
-        return []
-    try:
-        parsed = ast.literal_eval(s)
-        if isinstance(parsed, (list, tuple, set)):
-            return list(parsed)
-        # if a single value (str) returned, wrap in list
-        return [parsed]
-    except Exception:
-        # fallback: remove outer brackets/quotes and split on commas
-        trimmed = s.strip("[](){} ")
-        if trimmed == "":
-            return []
-        return [x.strip().strip("'\"") for x in trimmed.split(",") if x.strip()]
+def cohort_subsets(cohort_dir: str, names: List[str], ko_column: str = "KOs") -> Tuple[Dict[str, pd.DataFrame], Dict[str, pd.DataFrame]]:
+    """subset_graphs read from a cohort store instead of per-sample files.
+
+    Only the pattern partitions of each subset are opened and only the KO
+    column is read from them.
+    """
+    keys = cohort.stored_patterns(cohort_dir, names)
+    food_microbe_keys = [k for k in keys if key_origins(k)[:2] == ("food", "microbe")]
+    least_restrictive_keys = [k for k in keys if key_origins(k)[0] != "food" and key_origins(k)[1] != "microbe"]
+
+    food_microbe = cohort.read_cohort(cohort_dir, names, patterns=food_microbe_keys, columns=[ko_column])
+    least_restrictive = cohort.read_cohort(cohort_dir, names, patterns=least_restrictive_keys, columns=[ko_column])
+    return food_microbe, least_restrictive
 
 
 def get_kos(graph_dict: Dict[str, pd.DataFrame], ko_column_name: str = "KOs") -> Dict[str, List[str]]:
@@ -110,19 +126,39 @@ def get_kos(graph_dict: Dict[str, pd.DataFrame], ko_column_name: str = "KOs") ->
             kos_dict[name] = []
             continue
 
-        ko_series = df[ko_column_name].tolist()
-        parsed_lists = []
-        for entry in ko_series:
-            parsed = _safe_literal_eval(entry)
-            parsed_lists.extend(parsed)
-
-        # unique and sorted
-        ko_set_sorted = sorted(set(parsed_lists))
-        kos_dict[name] = ko_set_sorted
+        # each distinct list string is parsed once (dietmicrobenet.kos)
+        kos_dict[name] = ko_union(df[ko_column_name])
 
     return kos_dict
 
 
+def load_pattern_kos(names: List[str],
+                     paths: Optional[List[str]] = None,
+                     cohort_dir: Optional[str] = None,
+                     ko_column: str = "KOs",
+                     workers: int = 1) -> Dict[str, Dict[str, List[str]]]:
+    """KO sets of the named samples for each compared pattern subset.
+
+    Args:
+        names: Sample names.
+        paths: Result file of each sample (not needed with cohort_dir).
+        cohort_dir: Cohort store to read the samples from instead.
+        ko_column: Name of the KOs column.
+        workers: Number of result files read at the same time.
+
+    Returns:
+        Pattern name (PATTERN_NAMES) → {sample: sorted KOs}.
+    """
+    if cohort_dir:
+        food_microbe_dict, least_restrictive_dict = cohort_subsets(cohort_dir, names, ko_column=ko_column)
+    else:
+        # only the origin and KO columns are parsed
+        graphs_dict = get_graphs(paths=paths, names=names, columns=ORIGIN_COLS + [ko_column], workers=workers)
+        food_microbe_dict, least_restrictive_dict = subset_graphs(graph_dict=graphs_dict)
+    subsets = [food_microbe_dict, least_restrictive_dict]
+    return {name: get_kos(subset, ko_column_name=ko_column) for name, subset in zip(PATTERN_NAMES, subsets)}
+
+
 def jaccard(a: set, b: set) -> float:
     """Jaccard similarity for sets. Returns 1.0 when both empty (by convention)."""
     union = a | b
@@ -134,20 +170,22 @@ def jaccard(a: set, b: set) -> float:
 def calculate_similarity_matrix(pattern_kos: Dict[str, List[str]]) -> Tuple[np.ndarray, List[str]]:
     """Return Jaccard similarity matrix (square) and labels.
 
-    Internally converts lists to sets once for speed.
+    Samples are encoded as a sparse sample x KO matrix, so all intersections come
+    from one matrix product (see dietmicrobenet.similarity); same values as jaccard().
     """
     labels = list(pattern_kos.keys())
-    n = len(labels)
-    sets = {name: set(kos) for name, kos in pattern_kos.items()}
-    matrix = np.zeros((n, n), dtype=float)
+    matrix = jaccard_similarity([pattern_kos[name] for name in labels])
+    return matrix, labels
 
-    for i, name_i in enumerate(labels):
-        si = sets[name_i]
-        for j, name_j in enumerate(labels):
-            sj = sets[name_j]
-            matrix[i, j] = jaccard(si, sj)
 
-    return matrix, labels
+def similarity_matrix(pattern_kos: Dict[str, List[str]], cache: Optional[SimilarityCache] = None, key: Optional[str] = None) -> Tuple[np.ndarray, List[str]]:
+    """calculate_similarity_matrix, computed once per key when a run-wide cache is given.
+
+    The returned matrix may be shared with other callers; do not modify it in place.
+    """
+    if cache is None:
+        return calculate_similarity_matrix(pattern_kos)
+    return cache.matrix(key, pattern_kos)
 
 
 def cluster_matrix(matrix: np.ndarray, labels: List[str]) -> Tuple[np.ndarray, List[str], np.ndarray]:
@@ -176,21 +214,23 @@ def cluster_matrix(matrix: np.ndarray, labels: List[str]) -> Tuple[np.ndarray, L
     return clustered_matrix, clustered_labels, Z
 
 
-def stat_test(pattern_dict: Dict[str, List[str]],
-              metadata: pd.DataFrame,
-              group_col: str,
-              permutations: int = 5000,
-              seed: int = 5):
-
+def prepare_stat_test(pattern_dict: Dict[str, List[str]],
+                      metadata: pd.DataFrame,
+                      group_col: str,
+                      cache: Optional[SimilarityCache] = None,
+                      cache_key: Optional[str] = None) -> Tuple[np.ndarray, pd.Series]:
     """
-    Run PERMANOVA on the Jaccard distance matrix for the given pattern.
+    Distance matrix and grouping for a PERMANOVA of one metadata column.
 
     Automatically:
     - Removes groups with < 2 samples
-    - Skips test if fewer than 2 valid groups remain
+    - Raises if fewer than 2 valid groups remain
+
+    With a cache, the pattern's matrix is reused (cache_key names the pattern)
+    and group filtering slices it instead of recomputing.
     """
 
-    matrix, labels = calculate_similarity_matrix(pattern_dict)
+    matrix, labels = similarity_matrix(pattern_dict, cache, cache_key)
 
     if len(labels) < 2:
         raise ValueError("Need at least 2 samples to run PERMANOVA.")
@@ -226,8 +266,7 @@ def stat_test(pattern_dict: Dict[str, List[str]],
 
         # subset matrix to remaining samples
         valid_labels = group_series.index.tolist()
-        idx = [labels.index(lab) for lab in valid_labels]
-        matrix = matrix[np.ix_(idx, idx)]
+        matrix = subset_matrix(matrix, labels, valid_labels)
         labels = valid_labels
 
     # ---- Check if enough groups remain ----
@@ -240,16 +279,12 @@ def stat_test(pattern_dict: Dict[str, List[str]],
             f"Remaining groups: {remaining_counts.to_dict()}"
         )
 
-    dm = DistanceMatrix(1.0 - matrix, labels)
+    return 1.0 - matrix, group_series
 
-    res = permanova(
-        distance_matrix=dm,
-        grouping=group_series,
-        permutations=permutations,
-        seed=seed
-    )
 
-    # Extract values 
+def stat_results(res: pd.Series, group_series: pd.Series) -> dict:
+    """pseudo-F, p-value, R², group sizes and sample count of a PERMANOVA result."""
+    # Extract values
     pseudo_f = res.get("test statistic", np.nan)
     p_value = res.get("p-value", np.nan)
 
@@ -270,6 +305,83 @@ def stat_test(pattern_dict: Dict[str, List[str]],
         "n_samples": len(group_series)
     }
 
+
+def stat_test(pattern_dict: Dict[str, List[str]],
+              metadata: pd.DataFrame,
+              group_col: str,
+              permutations: int = 5000,
+              seed: int = 5,
+              cache: Optional[SimilarityCache] = None,
+              cache_key: Optional[str] = None,
+              engine: str = "skbio"):
+    """Run PERMANOVA on the Jaccard distance matrix for the given pattern (see prepare_stat_test).
+
+    ``engine`` is "skbio" (skbio.stats.distance.permanova) or "native" (the
+    block-scored dietmicrobenet.permanova).
+    """
+    distances, group_series = prepare_stat_test(pattern_dict, metadata, group_col, cache, cache_key)
+    res, = permanova_many([(distances, group_series.to_numpy())], permutations=permutations, seed=seed,
+                          engine=engine)
+    return stat_results(res, group_series)
+
+
+def run_stat_tests(pattern_dicts: Dict[str, Dict[str, List[str]]],
+                   metadata: pd.DataFrame,
+                   groups: List[str],
+                   permutations: int = 5000,
+                   seed: int = 5,
+                   workers: int = 1,
+                   cache: Optional[SimilarityCache] = None,
+                   early_stop: bool = False,
+                   engine: str = "skbio") -> Dict[str, List[Tuple[str, dict]]]:
+    """PERMANOVA of every pattern against every group column, ``workers`` tests at a time.
+
+    Each (pattern, group) test draws its permutations from ``seed``, exactly
+    as stat_test does, so the results are the same for any number of
+    workers.  Tests that cannot run are logged and left out.
+
+    Args:
+        pattern_dicts: Pattern name → {sample: KOs}.
+        metadata: Sample metadata indexed by sample name.
+        groups: Metadata columns to test.
+        permutations: Permutations per test.
+        seed: Seed of every test's permutations.
+        workers: Number of processes running tests.
+        cache: Similarity matrices shared with plotting (keyed by pattern name).
+        early_stop: Stop each test's permutations once its p-value is clearly
+            above or below 0.05 (dietmicrobenet.permanova); the results then
+            also hold the ``permutations`` used.  Needs the native engine.
+        engine: "skbio" (skbio.stats.distance.permanova, the default) or
+            "native" (the block-scored dietmicrobenet.permanova).
+
+    Returns:
+        Pattern name → [(group, stat_test-style results)] in ``groups`` order.
+    """
+    plan, tests = [], []
+    for pattern_name, pattern_dict in pattern_dicts.items():
+        for group in groups:
+            try:
+                distances, group_series = prepare_stat_test(pattern_dict, metadata, group, cache, pattern_name)
+            except Exception as e:
+                logging.warning(f"PERMANOVA failed for pattern '{pattern_name}', group '{group}': {e}")
+                continue
+            plan.append((pattern_name, group, group_series))
+            tests.append((distances, group_series.to_numpy()))
+
+    results = permanova_many(tests, permutations=permutations, seed=seed, workers=workers,
+                             engine=engine, early_stop=early_stop)
+    by_pattern: Dict[str, List[Tuple[str, dict]]] = {name: [] for name in pattern_dicts}
+    for (pattern_name, group, group_series), res in zip(plan, results):
+        values = stat_results(res, group_series)
+        if early_stop:
+            values["permutations"] = int(res["number of permutations"])
+        by_pattern[pattern_name].append((group, values))
+    if early_stop and results:
+        used = sum(int(res["number of permutations"]) for res in results)
+        logging.info(f"PERMANOVA early stopping used {used} of {permutations * len(results)} permutations")
+    return by_pattern
+
+
 def fdr_correction(pvalues: List[float]):
     """Benjamini-Hochberg FDR correction."""
     if len(pvalues) == 0:
@@ -283,12 +395,12 @@ def fdr_correction(pvalues: List[float]):
 
     return corrected
 
-def plotting(pattern_dict: Dict[str, List[str]], pattern_name: str, output: str):
+def plotting(pattern_dict: Dict[str, List[str]], pattern_name: str, output: str, cache: Optional[SimilarityCache] = None):
     """Create and save heatmap and dendrogram for the given pattern."""
     output_dir = Path(output)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    matrix, labels = calculate_similarity_matrix(pattern_dict)
+    matrix, labels = similarity_matrix(pattern_dict, cache, pattern_name)
 
     if len(labels) == 0:
         logging.info(f"No samples for pattern '{pattern_name}'; skipping plots.")
@@ -329,8 +441,13 @@ def plotting(pattern_dict: Dict[str, List[str]], pattern_name: str, output: str)
     df.to_csv(f"{output_dir}/SimilarityMatrix_{pattern_name}.csv", index=False)
 
 
-def summary(pattern_dict: Dict[str, List[str]], pattern_name: str, stat: bool, metadata: pd.DataFrame, groups:list, output: str):
-    """Write a summary file including intersection KOs, unique KOs per sample, and optional PERMANOVA results."""
+def summary(pattern_dict: Dict[str, List[str]], pattern_name: str, stat: bool, metadata: pd.DataFrame, groups:list, output: str,
+            cache: Optional[SimilarityCache] = None, permanova_tests: Optional[List[Tuple[str, dict]]] = None):
+    """Write a summary file including intersection KOs, unique KOs per sample, and optional PERMANOVA results.
+
+    permanova_tests are this pattern's run_stat_tests results when the tests were
+    run beforehand (e.g. in parallel for all patterns); otherwise they are run here.
+    """
     output_dir = Path(output)
     output_dir.mkdir(parents=True, exist_ok=True)
 
@@ -352,22 +469,10 @@ def summary(pattern_dict: Dict[str, List[str]], pattern_name: str, stat: bool, m
         fh.write(f"Number of KOs shared: {len(intersection_set)}\n")
 
         if stat:
-            permanova_results = []
-            permanova_groups = []
-
-            for group in groups:
-                try:
-                    stat_results = stat_test(
-                        pattern_dict=pattern_dict,
-                        metadata=metadata,
-                        group_col=group
-                    )
-
-                    permanova_results.append(stat_results)
-                    permanova_groups.append(group)
-
-                except Exception as e:
-                    logging.warning(f"PERMANOVA failed for pattern '{pattern_name}', group '{group}': {e}")
+            if permanova_tests is None:
+                permanova_tests = run_stat_tests({pattern_name: pattern_dict}, metadata, groups, cache=cache)[pattern_name]
+            permanova_groups = [group for group, _ in permanova_tests]
+            permanova_results = [res for _, res in permanova_tests]
 
             # ---- Write Raw Results ----
             fh.write("\n##### PERMANOVA RESULTS #####\n")
@@ -381,6 +486,8 @@ def summary(pattern_dict: Dict[str, List[str]], pattern_name: str, stat: bool, m
                 fh.write(f"Pseudo-F: {res['pseudo_F']:.4f}\n")
                 fh.write(f"R²: {res['R2']:.4f}\n")
                 fh.write(f"P-value (raw): {res['p_value']:.6f}\n")
+                if "permutations" in res:
+                    fh.write(f"Permutations used: {res['permutations']}\n")
 
                 raw_pvalues.append(res["p_value"])
 
@@ -412,31 +519,66 @@ def summary(pattern_dict: Dict[str, List[str]], pattern_name: str, stat: bool, m
 def main():
     parser = argparse.ArgumentParser(description="Compare graph results across samples using KOs and Jaccard similarity.")
     parser.add_argument("-m", "--metadata", required=True, help="Metadata CSV containing file paths and names")
-    parser.add_argument("-p", "--paths", required=True, help="Name of column containing file paths")
+    parser.add_argument("-p", "--paths", help="Name of column containing file paths (not needed with --cohort)")
     parser.add_argument("-n", "--names", required=True, help="Name of column containing names of graphs (e.g., sampleID)")
     parser.add_argument("-s", "--stat_test", action="store_true", help="If statistical test for group comparison wanted include this parameter")
     parser.add_argument("-g", "--groups", help="Names of columns for use in PERMANOVA, if multiple separate by a comma e.g., cohort,diet,location", default="")
     parser.add_argument("-o", "--output", required=True, help="Output directory for plots and summary files")
     parser.add_argument("--ko_column", help="Name of KOs column in graph CSVs (default: 'KOs')", default="KOs")
+    parser.add_argument("--cohort", help="Cohort store written by run_graph.py --cohort; read instead of the per-sample paths", default=None)
+    parser.add_argument("--workers", type=int, help="Number of result files read, and of PERMANOVA tests run, at the same time (default: 1)", default=1)
+    parser.add_argument("--store", help="Comparison store directory: samples already in it are not read again and only new samples' similarities are computed (a store built with another --ko_column, --cohort or sample file is rejected)", default=None)
+    parser.add_argument("--early_stop", action="store_true", help="Stop each PERMANOVA's permutations once its p-value is clearly above or below 0.05 and report the permutations used (needs --permanova_engine native)")
+    parser.add_argument("--permanova_engine", choices=PERMANOVA_ENGINES, default="skbio", help="PERMANOVA implementation: scikit-bio's (default) or the pipeline's block-scored one, whose p-values can differ from scikit-bio's when permutations tie the observed pseudo-F")
     args = parser.parse_args()
+    if not args.paths and not args.cohort:
+        parser.error("one of -p/--paths or --cohort is required")
+    if args.early_stop and args.permanova_engine != "native":
+        parser.error("--early_stop needs --permanova_engine native")
 
     md = pd.read_csv(args.metadata)
     md = md.set_index(args.names) # must index by names 
-    paths, names = csv_to_inputs(metadata=args.metadata, paths_col=args.paths, names_col=args.names)
 
-    graphs_dict = get_graphs(paths=paths, names=names)
-    food_microbe_dict, least_restrictive_dict = subset_graphs(graph_dict=graphs_dict)
-
-    food_microbe_kos = get_kos(food_microbe_dict, ko_column_name=args.ko_column)
-    rest_patterns_kos = get_kos(least_restrictive_dict, ko_column_name=args.ko_column)
+    if args.cohort:
+        names, path_of = md.index.astype(str).tolist(), {}
+    else:
+        paths, names = csv_to_inputs(metadata=args.metadata, paths_col=args.paths, names_col=args.names)
+        path_of = dict(zip(names, paths))
 
-    patterns = [food_microbe_kos, rest_patterns_kos]
-    pattern_names = ["Food to Microbe", "Least Restrictive Patterns"]
+    def load(samples: List[str]) -> Dict[str, Dict[str, List[str]]]:
+        return load_pattern_kos(samples, [path_of[s] for s in samples] if path_of else None,
+                                cohort_dir=args.cohort, ko_column=args.ko_column, workers=args.workers)
 
     groups = [g.strip() for g in args.groups.split(',') if g.strip()]
+    cache = SimilarityCache()  # each pattern's matrix is built once for plots and every PERMANOVA
+
+    if args.store:
+        # only samples the store does not have yet are read; their similarity block is appended
+        # a store only holds KO sets read one way: same KO column, cohort and per-sample files
+        source = {"ko_column": args.ko_column, "cohort": str(Path(args.cohort).resolve()) if args.cohort else None}
+        inputs = {n: str(Path(path).resolve()) for n, path in path_of.items()}
+        stores = update_stores(args.store, PATTERN_NAMES, names, load, source=source, inputs=inputs)
+        stored = [n for n in names if all(n in store for store in stores.values())]
+        pattern_kos = {}
+        for pat_name, store in stores.items():
+            pattern_kos[pat_name] = store.ko_sets(stored)
+            cache.put(pat_name, *store.similarity(stored))
+    else:
+        pattern_kos = load(names)
+
+    patterns = [pattern_kos[pat_name] for pat_name in PATTERN_NAMES]
+    pattern_names = PATTERN_NAMES
+
+    # every pattern x group PERMANOVA at once, so --workers can run them side by side
+    stats = {}
+    if args.stat_test:
+        stats = run_stat_tests(dict(zip(pattern_names, patterns)), md, groups, workers=args.workers, cache=cache,
+                               early_stop=args.early_stop, engine=args.permanova_engine)
+
     for pat_dict, pat_name in zip(patterns, pattern_names):
-        plotting(pat_dict, pat_name, args.output)
-        summary(pattern_dict=pat_dict, pattern_name=pat_name, stat=args.stat_test, metadata=md, groups=groups, output=args.output)
+        plotting(pat_dict, pat_name, args.output, cache=cache)
+        summary(pattern_dict=pat_dict, pattern_name=pat_name, stat=args.stat_test, metadata=md, groups=groups, output=args.output,
+                cache=cache, permanova_tests=stats.get(pat_name))
 
 
 if __name__ == "__main__":
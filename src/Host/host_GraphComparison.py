@@ -1,62 +1,31 @@
 from __future__ import annotations
 import argparse
-import ast
 import logging
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from scipy.cluster.hierarchy import linkage, dendrogram, leaves_list
 from scipy.spatial.distance import squareform
-from skbio import DistanceMatrix
-from skbio.stats.distance import permanova
 from statsmodels.stats.multitest import multipletests
 
+from dietmicrobenet import cohort
+from dietmicrobenet.comparestore import update_stores
+from dietmicrobenet.kos import KOIncidence, ko_union
+from dietmicrobenet.patterns import HOST_PATTERN, PATTERN_COLUMN, expand_pattern, pattern_key, pattern_label
+from dietmicrobenet.permanova import PERMANOVA_ENGINES, permanova_many
+from dietmicrobenet.results import load_results
+from dietmicrobenet.similarity import SimilarityCache, jaccard_similarity, subset_matrix
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
+# All 36 (node1, node2, node3, key) patterns, expanded in order from the spec
+# "diet|microbediet|all -> microbe|microbediet|all -> host|hostdiet|hostmicrobe|all"
 PATTERNS: List[Tuple[str, str, str, str]] = [
-    # --- diet as position 1 (12 patterns) ---
-    ("diet",        "microbe",      "host",         "diet_microbe_host"),
-    ("diet",        "microbe",      "hostdiet",     "diet_microbe_hostdiet"),
-    ("diet",        "microbe",      "hostmicrobe",  "diet_microbe_hostmicrobe"),
-    ("diet",        "microbe",      "all",          "diet_microbe_all"),
-    ("diet",        "microbediet",  "host",         "diet_microbediet_host"),
-    ("diet",        "microbediet",  "hostdiet",     "diet_microbediet_hostdiet"),
-    ("diet",        "microbediet",  "hostmicrobe",  "diet_microbediet_hostmicrobe"),
-    ("diet",        "microbediet",  "all",          "diet_microbediet_all"),
-    ("diet",        "all",          "host",         "diet_all_host"),
-    ("diet",        "all",          "hostdiet",     "diet_all_hostdiet"),
-    ("diet",        "all",          "hostmicrobe",  "diet_all_hostmicrobe"),
-    ("diet",        "all",          "all",          "diet_all_all"),
-    # --- microbediet as position 1 (12 patterns) ---
-    ("microbediet", "microbe",      "host",         "microbediet_microbe_host"),
-    ("microbediet", "microbe",      "hostdiet",     "microbediet_microbe_hostdiet"),
-    ("microbediet", "microbe",      "hostmicrobe",  "microbediet_microbe_hostmicrobe"),
-    ("microbediet", "microbe",      "all",          "microbediet_microbe_all"),
-    ("microbediet", "microbediet",  "host",         "microbediet_microbediet_host"),
-    ("microbediet", "microbediet",  "hostdiet",     "microbediet_microbediet_hostdiet"),
-    ("microbediet", "microbediet",  "hostmicrobe",  "microbediet_microbediet_hostmicrobe"),
-    ("microbediet", "microbediet",  "all",          "microbediet_microbediet_all"),
-    ("microbediet", "all",          "host",         "microbediet_all_host"),
-    ("microbediet", "all",          "hostdiet",     "microbediet_all_hostdiet"),
-    ("microbediet", "all",          "hostmicrobe",  "microbediet_all_hostmicrobe"),
-    ("microbediet", "all",          "all",          "microbediet_all_all"),
-    # --- all as position 1 (12 patterns) ---
-    ("all",         "microbe",      "host",         "all_microbe_host"),
-    ("all",         "microbe",      "hostdiet",     "all_microbe_hostdiet"),
-    ("all",         "microbe",      "hostmicrobe",  "all_microbe_hostmicrobe"),
-    ("all",         "microbe",      "all",          "all_microbe_all"),
-    ("all",         "microbediet",  "host",         "all_microbediet_host"),
-    ("all",         "microbediet",  "hostdiet",     "all_microbediet_hostdiet"),
-    ("all",         "microbediet",  "hostmicrobe",  "all_microbediet_hostmicrobe"),
-    ("all",         "microbediet",  "all",          "all_microbediet_all"),
-    ("all",         "all",          "host",         "all_all_host"),
-    ("all",         "all",          "hostdiet",     "all_all_hostdiet"),
-    ("all",         "all",          "hostmicrobe",  "all_all_hostmicrobe"),
-    ("all",         "all",          "all",          "all_all_all"),
+    (*origins, pattern_key(origins)) for origins in expand_pattern(HOST_PATTERN)
 ]
 
 # The single focal pattern processed individually per edge
@@ -65,53 +34,30 @@ FOCAL_PATTERN_KEY = "diet_microbe_host"
 # The 35 remaining patterns whose KOs are pooled (per edge) into an aggregate
 AGGREGATE_PATTERN_KEYS = [key for _, _, _, key in PATTERNS if key != FOCAL_PATTERN_KEY]
 
-# Human-readable label for each pattern
+# Human-readable label for each pattern, e.g. "diet → microbe → host"
 PATTERN_LABELS: Dict[str, str] = {
-    # diet as position 1
-    "diet_microbe_host":                    "diet → microbe → host",
-    "diet_microbe_hostdiet":                "diet → microbe → hostdiet",
-    "diet_microbe_hostmicrobe":             "diet → microbe → hostmicrobe",
-    "diet_microbe_all":                     "diet → microbe → all",
-    "diet_microbediet_host":                "diet → microbediet → host",
-    "diet_microbediet_hostdiet":            "diet → microbediet → hostdiet",
-    "diet_microbediet_hostmicrobe":         "diet → microbediet → hostmicrobe",
-    "diet_microbediet_all":                 "diet → microbediet → all",
-    "diet_all_host":                        "diet → all → host",
-    "diet_all_hostdiet":                    "diet → all → hostdiet",
-    "diet_all_hostmicrobe":                 "diet → all → hostmicrobe",
-    "diet_all_all":                         "diet → all → all",
-    # microbediet as position 1
-    "microbediet_microbe_host":             "microbediet → microbe → host",
-    "microbediet_microbe_hostdiet":         "microbediet → microbe → hostdiet",
-    "microbediet_microbe_hostmicrobe":      "microbediet → microbe → hostmicrobe",
-    "microbediet_microbe_all":              "microbediet → microbe → all",
-    "microbediet_microbediet_host":         "microbediet → microbediet → host",
-    "microbediet_microbediet_hostdiet":     "microbediet → microbediet → hostdiet",
-    "microbediet_microbediet_hostmicrobe":  "microbediet → microbediet → hostmicrobe",
-    "microbediet_microbediet_all":          "microbediet → microbediet → all",
-    "microbediet_all_host":                 "microbediet → all → host",
-    "microbediet_all_hostdiet":             "microbediet → all → hostdiet",
-    "microbediet_all_hostmicrobe":          "microbediet → all → hostmicrobe",
-    "microbediet_all_all":                  "microbediet → all → all",
-    # all as position 1
-    "all_microbe_host":                     "all → microbe → host",
-    "all_microbe_hostdiet":                 "all → microbe → hostdiet",
-    "all_microbe_hostmicrobe":              "all → microbe → hostmicrobe",
-    "all_microbe_all":                      "all → microbe → all",
-    "all_microbediet_host":                 "all → microbediet → host",
-    "all_microbediet_hostdiet":             "all → microbediet → hostdiet",
-    "all_microbediet_hostmicrobe":          "all → microbediet → hostmicrobe",
-    "all_microbediet_all":                  "all → microbediet → all",
-    "all_all_host":                         "all → all → host",
-    "all_all_hostdiet":                     "all → all → hostdiet",
-    "all_all_hostmicrobe":                  "all → all → hostmicrobe",
-    "all_all_all":                          "all → all → all",
+    key: pattern_label((c1, c2, c3)) for c1, c2, c3, key in PATTERNS
 }
 
 # Edge column names present in the graph CSVs
 EDGE_COLS = ("edge1_KOs", "edge2_KOs")
 EDGE_LABELS = ("edge1", "edge2")
 
+# Origin columns of the three compounds on a path
+ORIGIN_COLS = ["compound1_origin", "compound2_origin", "compound3_origin"]
+
+# Columns read from the graph CSVs: what subset_graphs splits on plus the KOs
+LOAD_COLS = [*ORIGIN_COLS, PATTERN_COLUMN, *EDGE_COLS]
+
+# (title, file stem, pattern keys, edge column) of every comparison:
+# the focal pattern per edge, then the 35 pooled patterns per edge
+COMPARISONS: List[Tuple[str, str, List[str], str]] = [
+    *((f"{PATTERN_LABELS[FOCAL_PATTERN_KEY]} | {edge_label}", f"{FOCAL_PATTERN_KEY}_{edge_label}",
+       [FOCAL_PATTERN_KEY], edge_col) for edge_col, edge_label in zip(EDGE_COLS, EDGE_LABELS)),
+    *((f"Aggregated (35 patterns) | {edge_label}", f"aggregated_35patterns_{edge_label}",
+       AGGREGATE_PATTERN_KEYS, edge_col) for edge_col, edge_label in zip(EDGE_COLS, EDGE_LABELS)),
+]
+
 
 # ---------------------------------------------------------------------------
 # I/O helpers
@@ -133,30 +79,90 @@ def csv_to_inputs(metadata: str, paths_col: str, names_col: str) -> Tuple[List[s
     return paths_list, names_list
 
 
-def get_graphs(paths: List[str], names: List[str]) -> Dict[str, pd.DataFrame]:
-    """Read each CSV path into a dataframe keyed by the corresponding name."""
+def get_graphs(
+    paths: List[str],
+    names: List[str],
+    columns: Optional[List[str]] = None,
+    workers: int = 1,
+) -> Dict[str, pd.DataFrame]:
+    """Read each result file (CSV or parquet, compact or not) into a dataframe keyed by the corresponding name.
+
+    Args:
+        paths: Result file paths.
+        names: Sample name of each path.
+        columns: Only read these columns, as categoricals (default: every column).
+        workers: Number of files read concurrently.
+
+    Returns:
+        Dict mapping sample name to its results dataframe.
+    """
     if len(paths) != len(names):
         raise ValueError("Number of names not equal to the number of paths provided.")
-    graph_dict: Dict[str, pd.DataFrame] = {}
-    for idx, p in enumerate(paths):
-        name = names[idx]
-        if name in graph_dict:
-            raise ValueError(f"Duplicate name detected: '{name}'. Names must be unique.")
-        pth = Path(p)
-        if not pth.exists():
+    if len(set(names)) != len(names):
+        duplicate = next(n for n in names if names.count(n) > 1)
+        raise ValueError(f"Duplicate name detected: '{duplicate}'. Names must be unique.")
+    for name, p in zip(names, paths):
+        if not Path(p).exists():
             raise FileNotFoundError(f"Graph CSV not found for sample '{name}': {p}")
-        graph_dict[name] = pd.read_csv(pth)
+
+    graph_dict: Dict[str, pd.DataFrame] = {}
+    loaded = load_results(paths, columns=columns, categorical=columns or (), workers=workers)
+    for name, (df, seconds) in zip(names, loaded):
+        logging.info(f"Loaded '{name}' ({len(df)} rows) in {seconds:.2f} s")
+        graph_dict[name] = df
     return graph_dict
 
 
+# Position in PATTERNS of each origin triple and of each pattern key
+_PATTERN_POSITIONS = {(c1, c2, c3): i for i, (c1, c2, c3, _) in enumerate(PATTERNS)}
+_KEY_POSITIONS = {key: i for i, (_, _, _, key) in enumerate(PATTERNS)}
+
+
+def _pattern_codes(df: pd.DataFrame) -> np.ndarray:
+    """Position in PATTERNS of every row's pattern, -1 for rows in none of them.
+
+    Without a pattern column, rows are grouped on their (compound1, compound2,
+    compound3) origin codes combined into one integer, and each group is
+    mapped to its PATTERNS entry through a lookup table of all combinations.
+    """
+    if PATTERN_COLUMN in df.columns:
+        keys = df[PATTERN_COLUMN].astype("category").cat
+        lookup = np.array([_KEY_POSITIONS.get(k, -1) for k in keys.categories] + [-1], dtype=np.int64)
+        return lookup[keys.codes.to_numpy()]  # code -1 (missing) picks the trailing -1
+
+    combined = np.zeros(len(df), dtype=np.int64)
+    uniques = []
+    for col in ORIGIN_COLS:
+        origins = df[col].astype("category").cat
+        n = len(origins.categories) + 1  # last code stands for a missing origin
+        codes = origins.codes.to_numpy().astype(np.int64)
+        combined = combined * n + np.where(codes < 0, n - 1, codes)
+        uniques.append(pd.Index(origins.categories))
+
+    table = np.full(int(np.prod([len(u) + 1 for u in uniques])), -1, dtype=np.int64)
+    for origins, position in _PATTERN_POSITIONS.items():
+        idx = [u.get_indexer([o])[0] for u, o in zip(uniques, origins)]
+        if min(idx) >= 0:
+            table[np.ravel_multi_index(idx, [len(u) + 1 for u in uniques])] = position
+    return table[combined]
+
+
 def subset_graphs(
     graph_dict: Dict[str, pd.DataFrame]
 ) -> Dict[str, Dict[str, pd.DataFrame]]:
-    """Split each sample's graph dataframe into the 12 pattern subsets."""
-    required_cols = {"compound1_origin", "compound2_origin", "compound3_origin"}
+    """Split each sample's graph dataframe into the 36 pattern subsets.
+
+    Graphs written by host_run_graph.py carry each path's pattern key in a
+    'pattern' column; older graphs are grouped on the three origin columns
+    in one pass.  Each sample is then reordered once so that every
+    pattern is a contiguous block, and the subsets are slices (views) of
+    that block rather than 36 filtered copies.  Rows keep their original
+    order and index within a pattern.
+    """
+    required_cols = set(ORIGIN_COLS)
     for name, df in graph_dict.items():
         missing = required_cols - set(df.columns)
-        if missing:
+        if PATTERN_COLUMN not in df.columns and missing:
             raise ValueError(
                 f"Missing required columns in graph dataframe for sample '{name}': "
                 f"{missing}. Found: {set(df.columns)}"
@@ -167,13 +173,12 @@ def subset_graphs(
     }
 
     for name, df in graph_dict.items():
-        for c1_origin, c2_origin, c3_origin, key in PATTERNS:
-            mask = (
-                (df["compound1_origin"] == c1_origin) &
-                (df["compound2_origin"] == c2_origin) &
-                (df["compound3_origin"] == c3_origin)
-            )
-            pattern_dicts[key][name] = df[mask]
+        codes = _pattern_codes(df)
+        order = np.argsort(codes, kind="stable")
+        grouped = df.take(order)
+        bounds = np.searchsorted(codes[order], np.arange(len(PATTERNS) + 1))
+        for i, (_, _, _, key) in enumerate(PATTERNS):
+            pattern_dicts[key][name] = grouped.iloc[bounds[i]:bounds[i + 1]]
 
     return pattern_dicts
 
@@ -182,27 +187,6 @@ def subset_graphs(
 # KO extraction — now per-edge
 # ---------------------------------------------------------------------------
 
-def _safe_literal_eval(item) -> List[str]:
-    """Parse a string representation of a list; return empty list on failure."""
-    if item is None or (isinstance(item, float) and np.isnan(item)):
-        return []
-    if isinstance(item, (list, tuple, set)):
-        return list(item)
-    s = str(item).strip()
-    if s == "":
-        return []
-    try:
-        parsed = ast.literal_eval(s)
-        if isinstance(parsed, (list, tuple, set)):
-            return list(parsed)
-        return [parsed]
-    except Exception:
-        trimmed = s.strip("[](){} ")
-        if trimmed == "":
-            return []
-        return [x.strip().strip("'\"") for x in trimmed.split(",") if x.strip()]
-
-
 def get_kos_per_edge(
     graph_dict: Dict[str, pd.DataFrame],
     edge_col: str,
@@ -222,16 +206,15 @@ def get_kos_per_edge(
     """
     kos_dict: Dict[str, List[str]] = {}
     for name, df in graph_dict.items():
-        parsed: List[str] = []
         if edge_col in df.columns:
-            for entry in df[edge_col].tolist():
-                parsed.extend(_safe_literal_eval(entry))
+            # each distinct list string is parsed once (dietmicrobenet.kos)
+            kos_dict[name] = ko_union(df[edge_col])
         else:
             logging.warning(
                 f"Edge column '{edge_col}' not found in dataframe for '{name}'. "
                 f"Using empty list."
             )
-        kos_dict[name] = sorted(set(parsed))
+            kos_dict[name] = []
     return kos_dict
 
 
@@ -273,6 +256,74 @@ def aggregate_kos_across_patterns(
     return {name: sorted(kos) for name, kos in pooled.items()}
 
 
+def ko_incidence(graph_dict: Dict[str, pd.DataFrame]) -> KOIncidence:
+    """Parse both edge KO columns of every sample once, split by pattern.
+
+    The KO set of any group of patterns is then read off without parsing
+    again, e.g. ``ko_incidence(graphs).ko_sets(AGGREGATE_PATTERN_KEYS,
+    "edge1_KOs")`` equals ``aggregate_kos_across_patterns`` on the
+    ``subset_graphs`` split.
+
+    Parameters
+    ----------
+    graph_dict:
+        Mapping of sample name → full (unsplit) graph DataFrame.
+
+    Returns
+    -------
+    KOIncidence over the samples, the 36 pattern keys and EDGE_COLS.
+    """
+    for name, df in graph_dict.items():
+        for edge_col in EDGE_COLS:
+            if edge_col not in df.columns:
+                logging.warning(
+                    f"Edge column '{edge_col}' not found in dataframe for '{name}'. "
+                    f"Using empty list."
+                )
+    return KOIncidence.from_frames(
+        graph_dict, _pattern_codes, [key for _, _, _, key in PATTERNS], EDGE_COLS
+    )
+
+
+def load_comparison_kos(
+    names: List[str],
+    paths: Optional[List[str]] = None,
+    cohort_dir: Optional[str] = None,
+    workers: int = 1,
+) -> Dict[str, Dict[str, List[str]]]:
+    """KO sets of the named samples for every comparison in COMPARISONS.
+
+    Parameters
+    ----------
+    names:
+        Sample names.
+    paths:
+        Result file of each sample (not needed with ``cohort_dir``).
+    cohort_dir:
+        Cohort store to read the samples from instead.
+    workers:
+        Number of result files read at the same time.
+
+    Returns
+    -------
+    Dict mapping comparison file stem → {sample: sorted KOs}.
+    """
+    if cohort_dir:
+        # only the two KO columns are read; rows carry their pattern key
+        graphs_dict = cohort.read_cohort(
+            cohort_dir, names, patterns=[key for _, _, _, key in PATTERNS], columns=list(EDGE_COLS)
+        )
+    else:
+        # only the columns subset_graphs and the KO extraction use are parsed
+        graphs_dict = get_graphs(paths=paths, names=names, columns=LOAD_COLS, workers=workers)
+    # KO columns are parsed once; every pattern/edge KO set is sliced from it
+    incidence = ko_incidence(graphs_dict)
+    return {
+        file_stem: incidence.ko_sets(pattern_keys, edge_col)
+        for _, file_stem, pattern_keys, edge_col in COMPARISONS
+    }
+
+
 # ---------------------------------------------------------------------------
 # Similarity / clustering
 # ---------------------------------------------------------------------------
@@ -288,17 +339,30 @@ def jaccard(a: set, b: set) -> float:
 def calculate_similarity_matrix(
     pattern_kos: Dict[str, List[str]]
 ) -> Tuple[np.ndarray, List[str]]:
-    """Return square Jaccard similarity matrix and ordered labels."""
+    """Return square Jaccard similarity matrix and ordered labels.
+
+    All pairs come from one sparse sample × KO matrix product
+    (:mod:`dietmicrobenet.similarity`), with the same values as :func:`jaccard`.
+    """
     labels = list(pattern_kos.keys())
-    n = len(labels)
-    sets = {name: set(kos) for name, kos in pattern_kos.items()}
-    matrix = np.zeros((n, n), dtype=float)
-    for i, ni in enumerate(labels):
-        for j, nj in enumerate(labels):
-            matrix[i, j] = jaccard(sets[ni], sets[nj])
+    matrix = jaccard_similarity([pattern_kos[name] for name in labels])
     return matrix, labels
 
 
+def similarity_matrix(
+    pattern_kos: Dict[str, List[str]],
+    cache: Optional[SimilarityCache] = None,
+    key: Optional[str] = None,
+) -> Tuple[np.ndarray, List[str]]:
+    """calculate_similarity_matrix, built once per key when a run-wide cache is given.
+
+    The matrix may be shared through the cache; do not modify it in place.
+    """
+    if cache is None:
+        return calculate_similarity_matrix(pattern_kos)
+    return cache.matrix(key, pattern_kos)
+
+
 def cluster_matrix(
     matrix: np.ndarray, labels: List[str]
 ) -> Tuple[np.ndarray, List[str], np.ndarray]:
@@ -323,15 +387,20 @@ def cluster_matrix(
 # Statistical testing
 # ---------------------------------------------------------------------------
 
-def stat_test(
+def prepare_stat_test(
     pattern_kos: Dict[str, List[str]],
     metadata: pd.DataFrame,
     group_col: str,
-    permutations: int = 5000,
-    seed: int = 5,
-) -> dict:
-    """PERMANOVA on the Jaccard distance matrix."""
-    matrix, labels = calculate_similarity_matrix(pattern_kos)
+    cache: Optional[SimilarityCache] = None,
+    cache_key: Optional[str] = None,
+) -> Tuple[np.ndarray, pd.Series]:
+    """Distance matrix and grouping for a PERMANOVA of one metadata column.
+
+    Groups with < 2 samples are dropped; raises if fewer than 2 groups
+    remain.  With a cache the matrix of ``cache_key`` (pattern and edge) is
+    reused and groups are dropped by slicing it.
+    """
+    matrix, labels = similarity_matrix(pattern_kos, cache, cache_key)
 
     if len(labels) < 2:
         raise ValueError("Need at least 2 samples to run PERMANOVA.")
@@ -357,8 +426,7 @@ def stat_test(
         valid_groups = counts[counts >= 2].index
         group_series = group_series[group_series.isin(valid_groups)]
         valid_labels = group_series.index.tolist()
-        idx = [labels.index(lab) for lab in valid_labels]
-        matrix = matrix[np.ix_(idx, idx)]
+        matrix = subset_matrix(matrix, labels, valid_labels)
         labels = valid_labels
 
     remaining_counts = group_series.value_counts()
@@ -367,15 +435,11 @@ def stat_test(
             f"After filtering small groups, fewer than 2 groups remain in '{group_col}'. "
             f"Remaining: {remaining_counts.to_dict()}"
         )
+    return 1.0 - matrix, group_series
 
-    dm = DistanceMatrix(1.0 - matrix, labels)
-    res = permanova(
-        distance_matrix=dm,
-        grouping=group_series,
-        permutations=permutations,
-        seed=seed,
-    )
 
+def stat_results(res: pd.Series, group_series: pd.Series) -> dict:
+    """pseudo-F, p-value, R², group sizes and sample count of a PERMANOVA result."""
     pseudo_f = res["test statistic"]
     p_value = res.get("p-value", np.nan)
     n = len(group_series)
@@ -391,6 +455,96 @@ def stat_test(
     }
 
 
+def stat_test(
+    pattern_kos: Dict[str, List[str]],
+    metadata: pd.DataFrame,
+    group_col: str,
+    permutations: int = 5000,
+    seed: int = 5,
+    cache: Optional[SimilarityCache] = None,
+    cache_key: Optional[str] = None,
+    engine: str = "skbio",
+) -> dict:
+    """PERMANOVA on the Jaccard distance matrix (see prepare_stat_test).
+
+    ``engine`` is ``"skbio"`` (``skbio.stats.distance.permanova``) or
+    ``"native"`` (the block-scored ``dietmicrobenet.permanova``).
+    """
+    distances, group_series = prepare_stat_test(pattern_kos, metadata, group_col, cache, cache_key)
+    res, = permanova_many([(distances, group_series.to_numpy())], permutations=permutations, seed=seed,
+                          engine=engine)
+    return stat_results(res, group_series)
+
+
+def run_stat_tests(
+    pattern_sets: Dict[str, Dict[str, List[str]]],
+    metadata: pd.DataFrame,
+    groups: List[str],
+    permutations: int = 5000,
+    seed: int = 5,
+    workers: int = 1,
+    cache: Optional[SimilarityCache] = None,
+    early_stop: bool = False,
+    engine: str = "skbio",
+) -> Dict[str, List[Tuple[str, dict]]]:
+    """PERMANOVA of every KO-set collection against every group column.
+
+    Tests run ``workers`` at a time.  Each (file stem, group) test draws its
+    permutations from ``seed``, exactly as ``stat_test`` does, so the results
+    are the same for any number of workers.  Tests that cannot run are
+    logged and left out.
+
+    Parameters
+    ----------
+    pattern_sets:
+        Mapping of file stem (also the cache key) → {sample: KOs}.
+    metadata, groups:
+        Sample metadata and the columns to test.
+    permutations, seed:
+        Permutations per test and the seed of every test's permutations.
+    workers:
+        Number of processes running tests.
+    cache:
+        Similarity matrices shared with plotting.
+    early_stop:
+        Stop each test's permutations once its p-value is clearly above or
+        below 0.05 (``dietmicrobenet.permanova``); the results then also hold
+        the ``permutations`` used.  Needs the native engine.
+    engine:
+        ``"skbio"`` (``skbio.stats.distance.permanova``, the default) or
+        ``"native"`` (the block-scored ``dietmicrobenet.permanova``).
+
+    Returns
+    -------
+    Dict mapping file stem → [(group, stat_test results)] in ``groups`` order.
+    """
+    plan, tests = [], []
+    for file_stem, pattern_kos in pattern_sets.items():
+        for group in groups:
+            try:
+                distances, group_series = prepare_stat_test(
+                    pattern_kos, metadata, group, cache, file_stem
+                )
+            except Exception as e:
+                logging.warning(f"PERMANOVA failed for '{file_stem}', group '{group}': {e}")
+                continue
+            plan.append((file_stem, group, group_series))
+            tests.append((distances, group_series.to_numpy()))
+
+    results = permanova_many(tests, permutations=permutations, seed=seed, workers=workers,
+                             engine=engine, early_stop=early_stop)
+    by_stem: Dict[str, List[Tuple[str, dict]]] = {stem: [] for stem in pattern_sets}
+    for (file_stem, group, group_series), res in zip(plan, results):
+        values = stat_results(res, group_series)
+        if early_stop:
+            values["permutations"] = int(res["number of permutations"])
+        by_stem[file_stem].append((group, values))
+    if early_stop and results:
+        used = sum(int(res["number of permutations"]) for res in results)
+        logging.info(f"PERMANOVA early stopping used {used} of {permutations * len(results)} permutations")
+    return by_stem
+
+
 def fdr_correction(pvalues: List[float]) -> List[float]:
     """Benjamini-Hochberg FDR correction."""
     if len(pvalues) == 0:
@@ -408,12 +562,13 @@ def plotting(
     title: str,
     file_stem: str,
     output: str,
+    cache: Optional[SimilarityCache] = None,
 ) -> None:
     """Create and save heatmap, dendrogram, and similarity matrix CSV."""
     output_dir = Path(output)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    matrix, labels = calculate_similarity_matrix(pattern_kos)
+    matrix, labels = similarity_matrix(pattern_kos, cache, file_stem)
 
     if len(labels) == 0:
         logging.info(f"No samples for '{title}'; skipping plots.")
@@ -467,8 +622,15 @@ def summary(
     metadata: pd.DataFrame,
     groups: List[str],
     output: str,
+    cache: Optional[SimilarityCache] = None,
+    permanova_tests: Optional[List[Tuple[str, dict]]] = None,
 ) -> None:
-    """Write a summary file with shared/unique KOs and optional PERMANOVA results."""
+    """Write a summary file with shared/unique KOs and optional PERMANOVA results.
+
+    ``permanova_tests`` are this file stem's ``run_stat_tests`` results when the
+    tests were run beforehand (e.g. in parallel for every pattern and edge);
+    otherwise they are run here.
+    """
     output_dir = Path(output)
     output_dir.mkdir(parents=True, exist_ok=True)
 
@@ -486,22 +648,12 @@ def summary(
         fh.write(f"Number of KOs shared across all samples: {len(intersection_set)}\n")
 
         if stat:
-            permanova_results = []
-            permanova_groups = []
-
-            for group in groups:
-                try:
-                    res = stat_test(
-                        pattern_kos=pattern_kos,
-                        metadata=metadata,
-                        group_col=group,
-                    )
-                    permanova_results.append(res)
-                    permanova_groups.append(group)
-                except Exception as e:
-                    logging.warning(
-                        f"PERMANOVA failed for '{title}', group '{group}': {e}"
-                    )
+            if permanova_tests is None:
+                permanova_tests = run_stat_tests(
+                    {file_stem: pattern_kos}, metadata, groups, cache=cache
+                )[file_stem]
+            permanova_groups = [group for group, _ in permanova_tests]
+            permanova_results = [res for _, res in permanova_tests]
 
             fh.write("\n##### PERMANOVA RESULTS #####\n")
             raw_pvalues = []
@@ -512,6 +664,8 @@ def summary(
                 fh.write(f"Pseudo-F: {res['pseudo_F']:.4f}\n")
                 fh.write(f"R²: {res['R2']:.4f}\n")
                 fh.write(f"P-value (raw): {res['p_value']:.6f}\n")
+                if "permutations" in res:
+                    fh.write(f"Permutations used: {res['permutations']}\n")
                 raw_pvalues.append(res["p_value"])
 
             if raw_pvalues:
@@ -550,8 +704,8 @@ def main():
     )
     parser.add_argument("-m", "--metadata", required=True,
                         help="Metadata CSV containing file paths and sample names")
-    parser.add_argument("-p", "--paths", required=True,
-                        help="Column name containing file paths")
+    parser.add_argument("-p", "--paths",
+                        help="Column name containing file paths (not needed with --cohort)")
     parser.add_argument("-n", "--names", required=True,
                         help="Column name containing sample names")
     parser.add_argument("-s", "--stat_test", action="store_true",
@@ -561,72 +715,97 @@ def main():
                              "(e.g. cohort,diet,location)")
     parser.add_argument("-o", "--output", required=True,
                         help="Output directory for plots and summary files")
+    parser.add_argument("--cohort", default=None,
+                        help="Cohort store written by host_run_graph.py --cohort; read instead of "
+                             "the per-sample paths")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of result files read, and of PERMANOVA tests run, "
+                             "at the same time (default: 1)")
+    parser.add_argument("--store", default=None,
+                        help="Comparison store directory: samples already in it are not read "
+                             "again and only new samples' similarities are computed (a store "
+                             "built with another --cohort or sample file is rejected)")
+    parser.add_argument("--early_stop", action="store_true",
+                        help="Stop each PERMANOVA's permutations once its p-value is clearly "
+                             "above or below 0.05 and report the permutations used "
+                             "(needs --permanova_engine native)")
+    parser.add_argument("--permanova_engine", choices=PERMANOVA_ENGINES, default="skbio",
+                        help="PERMANOVA implementation: scikit-bio's (default) or the pipeline's "
+                             "block-scored one, whose p-values can differ from scikit-bio's when "
+                             "permutations tie the observed pseudo-F")
     args = parser.parse_args()
+    if not args.paths and not args.cohort:
+        parser.error("one of -p/--paths or --cohort is required")
+    if args.early_stop and args.permanova_engine != "native":
+        parser.error("--early_stop needs --permanova_engine native")
 
     # ---- Load metadata ----
     md = pd.read_csv(args.metadata).set_index(args.names)
 
-    # ---- Load and subset graphs ----
-    paths, names = csv_to_inputs(
-        metadata=args.metadata, paths_col=args.paths, names_col=args.names
-    )
-    graphs_dict = get_graphs(paths=paths, names=names)
-    pattern_dicts = subset_graphs(graph_dict=graphs_dict)
-
-    groups = [g.strip() for g in args.groups.split(",") if g.strip()]
-
-    # ================================================================
-    # BLOCK 1 — Focal pattern: diet → microbe → host, per edge
-    # ================================================================
-    focal_df_dict = pattern_dicts[FOCAL_PATTERN_KEY]   # dict[sample -> DataFrame]
-    focal_label   = PATTERN_LABELS[FOCAL_PATTERN_KEY]  # "diet → microbe → host"
+    # ---- Load graphs and parse their KOs ----
+    if args.cohort:
+        names, path_of = md.index.astype(str).tolist(), {}
+    else:
+        paths, names = csv_to_inputs(
+            metadata=args.metadata, paths_col=args.paths, names_col=args.names
+        )
+        path_of = dict(zip(names, paths))
 
-    for edge_col, edge_label in zip(EDGE_COLS, EDGE_LABELS):
-        focal_kos = get_kos_per_edge(focal_df_dict, edge_col=edge_col)
+    def load(samples: List[str]) -> Dict[str, Dict[str, List[str]]]:
+        return load_comparison_kos(
+            samples, [path_of[s] for s in samples] if path_of else None,
+            cohort_dir=args.cohort, workers=args.workers,
+        )
 
-        title     = f"{focal_label} | {edge_label}"
-        file_stem = f"{FOCAL_PATTERN_KEY}_{edge_label}"
+    groups = [g.strip() for g in args.groups.split(",") if g.strip()]
 
-        logging.info(f"Processing: {title}")
-        plotting(focal_kos, title=title, file_stem=file_stem, output=args.output)
-        summary(
-            pattern_kos=focal_kos,
-            title=title,
-            file_stem=file_stem,
-            stat=args.stat_test,
-            metadata=md,
-            groups=groups,
-            output=args.output,
-        )
+    # each pattern/edge matrix is built once for its plots and every PERMANOVA
+    cache = SimilarityCache()
 
-    # ================================================================
-    # BLOCK 2 — Aggregate: 11 remaining patterns pooled, per edge
-    # ================================================================
-    agg_pattern_names = " | ".join(PATTERN_LABELS[k] for k in AGGREGATE_PATTERN_KEYS)
     logging.info(
         f"Aggregating {len(AGGREGATE_PATTERN_KEYS)} patterns: {AGGREGATE_PATTERN_KEYS}"
     )
-
-    for edge_col, edge_label in zip(EDGE_COLS, EDGE_LABELS):
-        agg_kos = aggregate_kos_across_patterns(
-            pattern_dicts=pattern_dicts,
-            pattern_keys=AGGREGATE_PATTERN_KEYS,
-            edge_col=edge_col,
+    file_stems = [file_stem for _, file_stem, _, _ in COMPARISONS]
+    if args.store:
+        # only samples the store does not have yet are read; their similarity block is appended
+        # a store only holds KO sets read one way: same KO columns, cohort and per-sample files
+        source = {"ko_columns": list(EDGE_COLS),
+                  "cohort": str(Path(args.cohort).resolve()) if args.cohort else None}
+        inputs = {n: str(Path(path).resolve()) for n, path in path_of.items()}
+        stores = update_stores(args.store, file_stems, names, load, source=source, inputs=inputs)
+        stored = [n for n in names if all(n in store for store in stores.values())]
+        kos_by_stem = {}
+        for file_stem, store in stores.items():
+            kos_by_stem[file_stem] = store.ko_sets(stored)
+            cache.put(file_stem, *store.similarity(stored))
+    else:
+        kos_by_stem = load(names)
+
+    # (title, file_stem, {sample: KOs}): focal pattern per edge, then the aggregate per edge
+    comparisons = [(title, file_stem, kos_by_stem[file_stem]) for title, file_stem, _, _ in COMPARISONS]
+
+    # every comparison x group PERMANOVA at once, so --workers can run them side by side
+    stats: Dict[str, List[Tuple[str, dict]]] = {}
+    if args.stat_test:
+        stats = run_stat_tests(
+            {file_stem: kos for _, file_stem, kos in comparisons},
+            md, groups, workers=args.workers, cache=cache, early_stop=args.early_stop,
+            engine=args.permanova_engine,
         )
 
-        title     = f"Aggregated (35 patterns) | {edge_label}"
-        file_stem = f"aggregated_35patterns_{edge_label}"
-
+    for title, file_stem, kos in comparisons:
         logging.info(f"Processing: {title}")
-        plotting(agg_kos, title=title, file_stem=file_stem, output=args.output)
+        plotting(kos, title=title, file_stem=file_stem, output=args.output, cache=cache)
         summary(
-            pattern_kos=agg_kos,
+            pattern_kos=kos,
             title=title,
             file_stem=file_stem,
             stat=args.stat_test,
             metadata=md,
             groups=groups,
             output=args.output,
+            cache=cache,
+            permanova_tests=stats.get(file_stem),
         )
 
 
@@ -48,6 +48,28 @@ import networkx as nx
 from tqdm import tqdm
 import argparse as arg
 
+from dietmicrobenet import patterns, reachability, rungraph
+from dietmicrobenet.results import DEFAULT_CHUNK_SIZE, FORMATS, ResultWriter
+from dietmicrobenet.rungraph import append_to_cohort, load_csvs, load_snapshot
+
+
+# origin pattern queried (see dietmicrobenet.patterns for the syntax); covers the 36 shapes above
+PATTERN = patterns.HOST_PATTERN
+
+# allowed origins per position (node1 → node2 → node3)
+VALID_N1, VALID_N2, VALID_N3 = (set(origins) for origins in patterns.parse_pattern(PATTERN))
+
+NODE_ATTRS = ["origin", "assoc_food", "freq"]
+EDGE_ATTRS = ["reaction", "KOs", "organisms", "m_abundance", "h_abundance"]
+
+# every path is tagged with its pattern key (e.g. diet_microbe_host), categories in PATTERN order
+PATTERN_KEYS = patterns.spec_keys([PATTERN])
+
+RESULT_COLUMNS = patterns.result_columns(2, NODE_ATTRS, EDGE_ATTRS, pattern_column=True)
+
+# default top-k path score: food frequency × microbe abundance × host abundance
+SCORE_COLUMNS = ["compound1_freq", "edge1_m_abundance", "edge2_h_abundance"]
+
 
 # ------------------------------------------------------
 # Pattern query helper
@@ -86,26 +108,156 @@ def append_result(results, c1, n1, c2, n2, edge1, c3, n3, edge2):
         "compound3_origin": n3["origin"],
         "compound3_assoc_food": n3["assoc_food"],
         "compound3_freq": n3["freq"],
+
+        "pattern": patterns.pattern_key((n1["origin"], n2["origin"], n3["origin"])),
     })
 
 # ------------------------------------------------------
-# Main
+# Join engine
 # ------------------------------------------------------
 
-def main():
-    parser = arg.ArgumentParser(description="In-memory graph builder + pattern queries")
-    parser.add_argument('--n', required=True, help='Node CSV file')
-    parser.add_argument('--e', required=True, help='Edge CSV file')
-    parser.add_argument('--o', required=True, help='Output CSV file')
-    args = parser.parse_args()
+def two_hop_patterns(nodes_df, edges_df, specs=(PATTERN,), multi_edges=False):
+    """Run the 2-hop pattern queries as joins of filtered edge sets.
+
+    First-hop edges are filtered on the (c1, c2) origins and second-hop edges
+    on the (c2, c3) origins, then the two sets are joined on c2.
+
+    Returns:
+        pandas df: matching paths, same rows and order as networkx_patterns
+    """
+    graph = patterns.GraphTables.from_frames(nodes_df, edges_df, multi_edges=multi_edges)
+    paths = patterns.match_patterns(graph, specs)
+    return patterns.materialize(graph, paths, NODE_ATTRS, EDGE_ATTRS, pattern_keys=patterns.spec_keys(specs))
+
+
+def write_patterns(nodes_df, edges_df, output, specs=(PATTERN,), chunk_size=DEFAULT_CHUNK_SIZE, fmt=None,
+                   multi_edges=False, workers=1, compact=False):
+    """Run the pattern queries and stream the matching paths to disk in chunks.
+
+    Only one chunk of result rows is held in memory; the file is the same as
+    writing two_hop_patterns(...) in one go.
+
+    Returns:
+        int: number of matching paths written
+    """
+    graph = patterns.GraphTables.from_frames(nodes_df, edges_df, multi_edges=multi_edges)
+    return write_graph_patterns(graph, output, specs, chunk_size=chunk_size, fmt=fmt, workers=workers,
+                                compact=compact)
+
+
+def write_graph_patterns(graph, output, specs=(PATTERN,), chunk_size=DEFAULT_CHUNK_SIZE, fmt=None, workers=1,
+                         compact=False):
+    """write_patterns for an already built graph (e.g. loaded from a snapshot).
+
+    See rungraph.write_graph_patterns for workers and compact.
+
+    Returns:
+        int: number of matching paths written
+    """
+    return rungraph.write_graph_patterns(graph, output, specs, NODE_ATTRS, EDGE_ATTRS, chunk_size=chunk_size,
+                                         fmt=fmt, workers=workers, compact=compact, pattern_column=True)
+
+
+def count_patterns(nodes_df, edges_df, level="pairs", spec=PATTERN, weights=None, multi_edges=False):
+    """Count matching paths with sparse matrix products instead of listing them.
+
+    Args:
+        level (str): 'pairs' for one row per (compound1, compound3) pair, 'patterns' for one row per origin pattern
+        spec (str): origin pattern to count
+        weights (list): optional edge columns (one, or one per hop) for abundance-weighted sums
+        multi_edges (bool): aggregate parallel reactions per compound pair instead of keeping the last one
+
+    Returns:
+        pandas df: count table with n_paths (and weighted_sum when weighted)
+    """
+    graph = patterns.GraphTables.from_frames(nodes_df, edges_df, multi_edges=multi_edges)
+    return count_graph_patterns(graph, level, spec, weights)
+
+
+def count_graph_patterns(graph, level="pairs", spec=PATTERN, weights=None):
+    """count_patterns for an already built graph (e.g. loaded from a snapshot).
+
+    Returns:
+        pandas df: count table with n_paths (and weighted_sum when weighted)
+    """
+    if level == "pairs":
+        return patterns.pair_counts(graph, spec, weights)
+    return patterns.pattern_counts(graph, spec, weights)
+
+
+def top_patterns(nodes_df, edges_df, k, score=SCORE_COLUMNS, spec=PATTERN, multi_edges=False):
+    """Find the k highest scoring paths without listing every path.
+
+    Args:
+        k (int): number of paths to return
+        score (list): result columns multiplied into each path's score (must be non-negative);
+            paths with a missing score column are skipped
+        spec (str): origin pattern to search
+        multi_edges (bool): aggregate parallel reactions per compound pair instead of keeping the last one
+
+    Returns:
+        pandas df: the k best paths with the usual result columns plus score, best first
+    """
+    graph = patterns.GraphTables.from_frames(nodes_df, edges_df, multi_edges=multi_edges)
+    return top_graph_patterns(graph, k, score, spec)
+
 
-    # Load CSVs
-    print("📄 Loading CSV files...")
-    nodes_df = pd.read_csv(args.n)
-    edges_df = pd.read_csv(args.e)
-    print(f" → Loaded {len(nodes_df)} nodes and {len(edges_df)} edges")
+def top_graph_patterns(graph, k, score=SCORE_COLUMNS, spec=PATTERN):
+    """top_patterns for an already built graph (e.g. loaded from a snapshot).
 
-    # Create a directed graph
+    Returns:
+        pandas df: the k best paths with the usual result columns plus score, best first
+    """
+    paths, scores = patterns.top_paths(graph, spec, k, score)
+    df = patterns.materialize(graph, paths, NODE_ATTRS, EDGE_ATTRS, pattern_keys=patterns.spec_keys([spec]))
+    df["score"] = scores
+    return df
+
+
+def reach_patterns(nodes_df, edges_df, max_hops, spec=PATTERN, multi_edges=False):
+    """Find every compound reachable from each source within max_hops edges.
+
+    The pattern reads source → via → target: paths start at a first-position compound,
+    only pass through second-position compounds and end at a third-position compound.
+
+    Args:
+        max_hops (int): longest path considered
+        spec (str): origin pattern (two or three positions)
+        multi_edges (bool): aggregate parallel reactions per compound pair instead of keeping the last one
+
+    Returns:
+        pandas df: source_id, source_origin, target_id, target_origin, min_hops and n_paths (shortest paths)
+    """
+    graph = patterns.GraphTables.from_frames(nodes_df, edges_df, multi_edges=multi_edges)
+    return reachability.reachable(graph, spec, max_hops)
+
+
+# ------------------------------------------------------
+# SQLite engine
+# ------------------------------------------------------
+
+def sqlite_patterns(nodes_csv, edges_csv, output, db=None, specs=(PATTERN,), chunk_size=DEFAULT_CHUNK_SIZE, fmt=None):
+    """Run the pattern queries as indexed SQL joins in an on-disk SQLite database.
+
+    See rungraph.sqlite_patterns.
+
+    Returns:
+        int: number of matching rows written, same file as write_patterns
+    """
+    return rungraph.sqlite_patterns(nodes_csv, edges_csv, output, specs, NODE_ATTRS, EDGE_ATTRS, db=db,
+                                    chunk_size=chunk_size, fmt=fmt, pattern_column=True)
+
+
+# ------------------------------------------------------
+# networkx engine
+# ------------------------------------------------------
+
+def networkx_patterns(nodes_df, edges_df):
+    """Build the graph in memory and walk every 2-hop path edge by edge.
+
+    Returns:
+        pandas df: matching paths
+    """
     print("\n🔧 Building graph in memory...")
     G = nx.DiGraph()
 
@@ -138,31 +290,154 @@ def main():
 
     results = []
 
-    valid_n1 = {"diet", "microbediet", "all"}
-    valid_n2 = {"microbe", "microbediet", "all"}
-    valid_n3 = {"host", "hostdiet", "hostmicrobe", "all"}
-
     for c1, c2, edge1 in tqdm(G.edges(data=True), total=G.number_of_edges(), ncols=80):
 
         n1 = G.nodes[c1]
         n2 = G.nodes[c2]
 
-        if n1["origin"] not in valid_n1 or n2["origin"] not in valid_n2:
+        if n1["origin"] not in VALID_N1 or n2["origin"] not in VALID_N2:
             continue
 
         for c3 in G.successors(c2):
             n3 = G.nodes[c3]
-            if n3["origin"] in valid_n3:
+            if n3["origin"] in VALID_N3:
                 edge2 = G[c2][c3]  # fetch edge attributes between c2 and c3
                 append_result(results, c1, n1, c2, n2, edge1, c3, n3, edge2)
 
-    # Convert to DataFrame
-    df = pd.DataFrame(results)
-    print(f"\n📊 Found {len(df)} matching relationships.")
+    df = pd.DataFrame(results, columns=RESULT_COLUMNS)
+    df[patterns.PATTERN_COLUMN] = pd.Categorical(df[patterns.PATTERN_COLUMN], categories=PATTERN_KEYS)
+    return df
+
+
+# ------------------------------------------------------
+# Main
+# ------------------------------------------------------
+
+def main():
+    parser = arg.ArgumentParser(description="In-memory graph builder + pattern queries")
+    parser.add_argument('--n', required=True, help='Node CSV file')
+    parser.add_argument('--e', required=True, help='Edge CSV file')
+    parser.add_argument('--o', required=True, help='Output CSV file')
+    parser.add_argument('--engine', choices=['join', 'networkx', 'sqlite'], default='join',
+                        help='Pattern engine: sorted-key edge joins (default), networkx graph or '
+                             'indexed SQL joins in an on-disk SQLite database')
+    parser.add_argument('--pattern', action='append', default=None,
+                        help='Origin pattern to query with the join or sqlite engine (repeatable, default: the 36 diet → microbe → host shapes)')
+    parser.add_argument('--chunk_size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Result rows held in memory before they are written out; the join engine '
+                             'also holds the edge indices of one block of paths, which is larger only '
+                             'when one first-hop edge starts more paths than this')
+    parser.add_argument('--format', choices=FORMATS, default=None,
+                        help='Output format (default: from the --o suffix, .parquet or CSV)')
+    parser.add_argument('--multi_edges', action='store_true',
+                        help='Keep every reaction between a compound pair: reactions, KOs and organisms are '
+                             'pooled and abundances summed per pair (default: last reaction per pair, as networkx)')
+    parser.add_argument('--counts', choices=['pairs', 'patterns'], default=None,
+                        help='Write path counts per (compound1, compound3) pair or per pattern instead of every path')
+    parser.add_argument('--weights', nargs='+', default=None,
+                        help='Edge columns to weight --counts path counts by, one for all hops or one per hop '
+                             '(e.g. m_abundance h_abundance)')
+    parser.add_argument('--top', type=int, default=None,
+                        help='Only write the TOP highest scoring paths (scored by --score)')
+    parser.add_argument('--score', nargs='+', default=None,
+                        help='Result columns multiplied into the --top path score '
+                             '(default: compound1_freq edge1_m_abundance edge2_h_abundance)')
+    parser.add_argument('--reach', type=int, default=None, metavar='MAX_HOPS',
+                        help='Write every (source, target) pair connected within MAX_HOPS edges through '
+                             'compounds of the middle pattern position, with min hops and shortest path counts')
+    parser.add_argument('--compact', action='store_true',
+                        help='Write compound IDs only in the results plus one node attribute table '
+                             '(<output>.nodes.<ext>) instead of repeating compound attributes on every row')
+    parser.add_argument('--db', default=None,
+                        help='SQLite database for --engine sqlite (default: the edge CSV path with a .sqlite suffix)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes used by the join engine to find and write matching paths; '
+                             '--counts, --top and --reach run in one process (output is the same for any number)')
+    parser.add_argument('--cohort', default=None,
+                        help='Also store the results in this cohort directory (Parquet partitioned by sample and '
+                             'pattern) for the graph comparison scripts; needs --sample')
+    parser.add_argument('--sample', default=None,
+                        help='Sample name the results are stored under in --cohort')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Cache the parsed graph as a binary snapshot next to the edge CSV and reuse it '
+                             'on later runs with the same CSV contents')
+    args = parser.parse_args()
+
+    if sum(mode is not None for mode in (args.counts, args.top, args.reach)) > 1:
+        parser.error("--counts, --top and --reach cannot be combined")
+    if args.top is not None and args.top < 1:
+        parser.error("--top must be at least 1")
+    if args.reach is not None and args.reach < 1:
+        parser.error("--reach must be at least 1")
+    if args.weights is not None and args.counts is None:
+        parser.error("--weights needs --counts")
+    if args.score is not None and args.top is None:
+        parser.error("--score needs --top")
+    query_mode = any(mode is not None for mode in (args.counts, args.top, args.reach))
+    if args.cohort and (query_mode or not args.sample):
+        parser.error("--cohort needs --sample and cannot be combined with --counts, --top or --reach")
+
+    if args.engine != 'join' and (query_mode or args.multi_edges or args.snapshot or args.compact):
+        parser.error("--counts, --top, --reach, --multi_edges, --snapshot and --compact need the join engine")
+    if args.engine != 'join' and args.workers > 1:
+        parser.error("--workers needs the join engine")
+    if args.engine == 'networkx' and args.pattern:
+        parser.error("--engine networkx only runs the built-in host pattern; use the join or sqlite engine for --pattern")
+
+    if args.engine == 'sqlite':
+        n_found = sqlite_patterns(args.n, args.e, args.o, args.db, args.pattern or [PATTERN],
+                                  chunk_size=args.chunk_size, fmt=args.format)
+    elif args.engine == 'networkx':
+        nodes_df, edges_df = load_csvs(args.n, args.e)
+        df = networkx_patterns(nodes_df, edges_df)
+        with ResultWriter(args.o, fmt=args.format, columns=RESULT_COLUMNS) as writer:
+            writer.write(df)
+        n_found = len(df)
+    else:
+        specs = args.pattern or [PATTERN]
+        if query_mode and len(specs) > 1:
+            parser.error("--counts, --top and --reach take a single --pattern")
+
+        if args.snapshot:
+            graph = load_snapshot(args.n, args.e, args.multi_edges)
+        else:
+            nodes_df, edges_df = load_csvs(args.n, args.e)
+            graph = patterns.GraphTables.from_frames(nodes_df, edges_df, multi_edges=args.multi_edges)
+
+        if args.counts is not None:
+            print("\n🔢 Counting paths...")
+            df = count_graph_patterns(graph, args.counts, specs[0], args.weights)
+            with ResultWriter(args.o, fmt=args.format) as writer:
+                writer.write(df)
+            print(f"\n📊 Found {int(df['n_paths'].sum())} matching relationships.")
+            print(f"\n💾 Saved counts to: {args.o}")
+            return
+
+        if args.reach is not None:
+            print(f"\n🧭 Searching paths of up to {args.reach} hops...")
+            df = reachability.reachable(graph, specs[0], args.reach)
+            with ResultWriter(args.o, fmt=args.format, columns=reachability.REACH_COLUMNS) as writer:
+                writer.write(df)
+            print(f"\n📊 Found {len(df)} reachable compound pairs.")
+            print(f"\n💾 Saved results to: {args.o}")
+            return
+
+        if args.top is not None:
+            print(f"\n🏆 Searching for the {args.top} highest scoring paths...")
+            df = top_graph_patterns(graph, args.top, args.score or SCORE_COLUMNS, specs[0])
+            with ResultWriter(args.o, fmt=args.format) as writer:
+                writer.write(df)
+            print(f"\n📊 Found {len(df)} top paths.")
+            print(f"\n💾 Saved results to: {args.o}")
+            return
 
-    # Save output
-    df.to_csv(args.o, index=False)
+        print("\n🔍 Running pattern queries...")
+        n_found = write_graph_patterns(graph, args.o, specs, chunk_size=args.chunk_size, fmt=args.format,
+                                       workers=args.workers, compact=args.compact)
+    print(f"\n📊 Found {n_found} matching relationships.")
     print(f"\n💾 Saved results to: {args.o}")
+    if args.cohort:
+        append_to_cohort(args.cohort, args.sample, args.o, chunk_size=args.chunk_size)
 
 
 if __name__ == "__main__":
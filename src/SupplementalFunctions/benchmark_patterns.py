@@ -0,0 +1,91 @@
+# Times the host 2-hop pattern engines on synthetic graphs with hub compounds
+# usage: python src/SupplementalFunctions/benchmark_patterns.py --nodes 2000 --edges 20000 --hubs 5
+
+import os
+import sys
+import time
+import argparse as arg
+import numpy as np
+import pandas as pd
+
+# the engines live in src/Host and src/dietmicrobenet: put src on the path when run as a script
+src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, src_dir)
+
+from Host import host_run_graph as hrg
+
+
+ORIGINS = ["diet", "microbe", "microbediet", "host", "hostdiet", "hostmicrobe", "all", "none"]
+
+
+def synthetic_graph(n_nodes:int, n_edges:int, n_hubs:int, hub_weight:float, seed:int):
+    """create node and edge dataframes where a few hub compounds take part in most reactions
+
+    Args:
+        n_nodes (int): number of compounds
+        n_edges (int): number of edges (compound pairs may repeat)
+        n_hubs (int): number of hub compounds
+        hub_weight (float): how much more likely a hub is picked as an edge endpoint
+        seed (int): random seed
+
+    Returns:
+        two pandas dataframes: nodes and edges in the format written by main_host.py
+    """
+    rng = np.random.default_rng(seed)
+    compounds = np.array([f"C{i:06d}" for i in range(n_nodes)])
+
+    nodes_df = pd.DataFrame({
+        "compound": compounds,
+        "origin": rng.choice(ORIGINS, size=n_nodes),
+        "assoc_food": rng.choice(["['apple']", "['apple', 'pear']", None], size=n_nodes),
+        "freq": rng.integers(0, 100, size=n_nodes).astype(float),
+    })
+
+    weights = np.ones(n_nodes)
+    weights[rng.choice(n_nodes, size=n_hubs, replace=False)] = hub_weight
+    weights /= weights.sum()
+
+    edges_df = pd.DataFrame({
+        "compound1": rng.choice(compounds, size=n_edges, p=weights),
+        "compound2": rng.choice(compounds, size=n_edges, p=weights),
+        "reaction": [f"R{i:05d}" for i in range(n_edges)],
+        "KOs": [f"['K{i % 20000:05d}']" for i in range(n_edges)],
+        "organisms": rng.choice(["org1", "org1, org2"], size=n_edges),
+        "m_abundance": rng.random(n_edges),
+        "h_abundance": rng.random(n_edges),
+    })
+    return nodes_df, edges_df
+
+
+def time_engine(engine, nodes_df, edges_df):
+    """run one engine and return (seconds, result dataframe)"""
+    start = time.perf_counter()
+    res = engine(nodes_df, edges_df)
+    return time.perf_counter() - start, res
+
+
+def main():
+    parser = arg.ArgumentParser(description="Benchmark networkx vs join pattern engines for host graphs")
+    parser.add_argument('--nodes', type=int, default=2000, help='number of compounds')
+    parser.add_argument('--edges', type=int, default=20000, help='number of edges')
+    parser.add_argument('--hubs', type=int, default=5, help='number of hub compounds')
+    parser.add_argument('--hub_weight', type=float, default=200.0, help='relative chance of a hub being an endpoint')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--skip_networkx', action='store_true', help='only time the join engine')
+    args = parser.parse_args()
+
+    nodes_df, edges_df = synthetic_graph(args.nodes, args.edges, args.hubs, args.hub_weight, args.seed)
+    print(f"Graph: {args.nodes} nodes, {args.edges} edges, {args.hubs} hubs")
+
+    join_time, join_res = time_engine(hrg.two_hop_patterns, nodes_df, edges_df)
+    print(f"join engine:     {join_time:8.2f} s  ({len(join_res)} paths)")
+
+    if not args.skip_networkx:
+        nx_time, nx_res = time_engine(hrg.networkx_patterns, nodes_df, edges_df)
+        print(f"networkx engine: {nx_time:8.2f} s  ({len(nx_res)} paths)")
+        pd.testing.assert_frame_equal(join_res, nx_res, check_dtype=False)
+        print(f"results identical, speedup {nx_time / join_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,36 @@
 # better for graphs >1M nodes, so far they have been smaller 
 # can replace run_graph.py if needed 
 # requires neo4j desktop 
+#
+# --export writes neo4j-admin import CSVs offline (no server or driver needed), --verify checks them
 
-from neo4j import GraphDatabase
+import os
+import re
 import pandas as pd
 from tqdm import tqdm
 import argparse as arg
 
+from dietmicrobenet.kos import parse_ko_cell
+
+try:
+    from neo4j import GraphDatabase
+except ImportError:  # only needed to talk to a live server
+    GraphDatabase = None
+
+# rows sent per UNWIND statement by the batched loader
+BATCH_SIZE = 10000
+
+# neo4j-admin import settings used by the exporter
+NODE_FILE = "compounds.csv"
+EDGE_FILE = "becomes.csv"
+ARRAY_DELIMITER = ";"
+
+NODE_HEADER = ["c_id:ID(Compound)", "origin", "assoc_food", "freq:float", ":LABEL"]
+EDGE_HEADER = [":START_ID(Compound)", ":END_ID(Compound)", "reaction", "KOs:string[]", "organisms",
+               "abundance:float", ":TYPE"]
+
+KO_PATTERN = re.compile(r"^K\d{5}$")
+
 # === Define Neo4j write functions ===
 def clear_database(tx):
     """Delete all nodes and relationships."""
@@ -42,6 +66,159 @@ def create_edges(tx, df):
              organisms=row["organisms"],
              abundance=row["abundance"])
 
+# === Batched loader ===
+CONSTRAINT = "CREATE CONSTRAINT compound_c_id IF NOT EXISTS FOR (c:Compound) REQUIRE c.c_id IS UNIQUE"
+
+NODE_BATCH = """
+UNWIND $rows AS row
+MERGE (p:Compound {c_id: row.compound})
+SET p.origin = row.origin,
+    p.assoc_food = row.assoc_food,
+    p.freq = row.freq
+"""
+
+EDGE_BATCH = """
+UNWIND $rows AS row
+MATCH (c1:Compound {c_id: row.compound1})
+MATCH (c2:Compound {c_id: row.compound2})
+MERGE (c1)-[r:BECOMES]->(c2)
+SET r.reaction = row.reaction,
+    r.KOs = row.KOs,
+    r.organisms = row.organisms,
+    r.abundance = row.abundance
+"""
+
+def create_constraint(tx):
+    """Unique Compound.c_id; also gives the index every MERGE/MATCH below looks nodes up with."""
+    tx.run(CONSTRAINT)
+
+def write_batch(tx, query, rows):
+    tx.run(query, rows=rows)
+
+def to_rows(df, columns):
+    """DataFrame rows as dicts of plain Python values, NaN as None (null in Neo4j)."""
+    df = df[columns]
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+def load_batched(session, nodes_df, edges_df, batch_size=BATCH_SIZE):
+    """Create the constraint, then MERGE nodes and edges with one UNWIND statement per batch.
+
+    Rows keep their CSV order, so repeated compounds or compound pairs end up
+    with their last attributes as with create_nodes/create_edges.
+    """
+    session.execute_write(create_constraint)
+    for df, query, columns, desc in (
+        (nodes_df, NODE_BATCH, ["compound", "origin", "assoc_food", "freq"], "Creating nodes"),
+        (edges_df, EDGE_BATCH, ["compound1", "compound2", "reaction", "KOs", "organisms", "abundance"], "Creating edges"),
+    ):
+        for start in tqdm(range(0, len(df), batch_size), desc=desc, ncols=80):
+            session.execute_write(write_batch, query, to_rows(df.iloc[start:start + batch_size], columns))
+
+# === neo4j-admin import bundle ===
+def parse_kos(value):
+    """KO list cell ("['K00001', 'K00002']") as a neo4j-admin array field ("K00001;K00002").
+
+    Parsed with the pipeline's KO list parser, so items that are not KO IDs are
+    kept whole (and reported by verify_admin_import).
+    """
+    return ARRAY_DELIMITER.join(str(k) for k in parse_ko_cell(value))
+
+def export_admin_import(nodes_df, edges_df, out_dir):
+    """Write node and relationship CSVs for `neo4j-admin database import full`.
+
+    The bundle holds the same graph the loaders build: one node per compound and
+    one BECOMES relationship per (compound1, compound2) pair, both with their last
+    attributes, and no relationship to a compound missing from the node table.
+
+    Args:
+        nodes_df (pandas df): node table (compound, origin, assoc_food, freq)
+        edges_df (pandas df): edge table (compound1, compound2, reaction, KOs, organisms, abundance)
+        out_dir (str): directory for the bundle
+
+    Returns:
+        str: the neo4j-admin command to import the bundle
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    nodes = nodes_df.drop_duplicates(subset="compound", keep="last")
+    node_out = pd.DataFrame({
+        NODE_HEADER[0]: nodes["compound"],
+        "origin": nodes["origin"],
+        "assoc_food": nodes["assoc_food"],
+        "freq:float": nodes["freq"],
+        ":LABEL": "Compound",
+    })
+
+    edges = edges_df.drop_duplicates(subset=["compound1", "compound2"], keep="last")
+    known = set(nodes["compound"])
+    edges = edges[edges["compound1"].isin(known) & edges["compound2"].isin(known)]
+    edge_out = pd.DataFrame({
+        EDGE_HEADER[0]: edges["compound1"],
+        EDGE_HEADER[1]: edges["compound2"],
+        "reaction": edges["reaction"],
+        "KOs:string[]": edges["KOs"].map(parse_kos),
+        "organisms": edges["organisms"],
+        "abundance:float": edges["abundance"],
+        ":TYPE": "BECOMES",
+    })
+
+    node_out.to_csv(os.path.join(out_dir, NODE_FILE), index=False)
+    edge_out.to_csv(os.path.join(out_dir, EDGE_FILE), index=False)
+
+    return (f"neo4j-admin database import full --array-delimiter=\"{ARRAY_DELIMITER}\" "
+            f"--nodes=Compound={os.path.join(out_dir, NODE_FILE)} "
+            f"--relationships=BECOMES={os.path.join(out_dir, EDGE_FILE)} neo4j")
+
+def verify_admin_import(out_dir):
+    """Check an exported bundle without Neo4j.
+
+    Checks the typed headers, unique non-empty node IDs, that every relationship
+    endpoint is a node, one relationship per compound pair, numeric float columns
+    and that every KOs array item looks like a KO (K + 5 digits).
+
+    Returns:
+        list: problems found (empty when the bundle is importable)
+    """
+    problems = []
+    nodes = pd.read_csv(os.path.join(out_dir, NODE_FILE), dtype=str, keep_default_na=False)
+    edges = pd.read_csv(os.path.join(out_dir, EDGE_FILE), dtype=str, keep_default_na=False)
+
+    if list(nodes.columns) != NODE_HEADER:
+        problems.append(f"{NODE_FILE}: header {list(nodes.columns)} != {NODE_HEADER}")
+    if list(edges.columns) != EDGE_HEADER:
+        problems.append(f"{EDGE_FILE}: header {list(edges.columns)} != {EDGE_HEADER}")
+    if problems:
+        return problems
+
+    ids = nodes[NODE_HEADER[0]]
+    if (ids == "").any():
+        problems.append(f"{NODE_FILE}: {(ids == '').sum()} nodes without an ID")
+    if ids.duplicated().any():
+        problems.append(f"{NODE_FILE}: duplicate IDs {sorted(ids[ids.duplicated()].unique())[:5]}")
+
+    for col in (EDGE_HEADER[0], EDGE_HEADER[1]):
+        missing = ~edges[col].isin(set(ids))
+        if missing.any():
+            problems.append(f"{EDGE_FILE}: {missing.sum()} {col} values are not nodes, e.g. {edges[col][missing].iloc[0]}")
+    if edges.duplicated(subset=[EDGE_HEADER[0], EDGE_HEADER[1]]).any():
+        problems.append(f"{EDGE_FILE}: repeated compound pairs")
+
+    for df, name, col in ((nodes, NODE_FILE, "freq:float"), (edges, EDGE_FILE, "abundance:float")):
+        values = df[col][df[col] != ""]
+        bad = pd.to_numeric(values, errors="coerce").isna()
+        if bad.any():
+            problems.append(f"{name}: {bad.sum()} non-numeric {col} values, e.g. {values[bad].iloc[0]}")
+
+    kos = edges["KOs:string[]"].str.split(ARRAY_DELIMITER).explode()
+    kos = kos[kos.notna() & (kos != "")]
+    bad = ~kos.str.match(KO_PATTERN)
+    if bad.any():
+        problems.append(f"{EDGE_FILE}: {bad.sum()} KOs array items are not KO IDs, e.g. {kos[bad].iloc[0]}")
+
+    if (nodes[":LABEL"] != "Compound").any() or (edges[":TYPE"] != "BECOMES").any():
+        problems.append("unexpected :LABEL or :TYPE values")
+    return problems
+
 # === Pattern queries ===
 cypher1 = """
 MATCH (c1:Compound {origin:"food"})-[r:BECOMES]->(c2:Compound {origin:"microbe"})
@@ -96,14 +273,45 @@ RETURN
 # === define main ===
 def main(): 
     parser = arg.ArgumentParser(description='Connect to Neo4j, create and query graph')
-    parser.add_argument('--n', type=str, required=True, help='node file path')
-    parser.add_argument('--e', type=str, required=True, help='edge file path')
-    parser.add_argument('--uri', type=str, required=True, help='Neo4j URI instance')
-    parser.add_argument('--user', type=str, required=True, help='Neo4j username for instance')
-    parser.add_argument('--p', type=str, required=True, help='Neo4j password for instance')
-    parser.add_argument('--o', type=str, required=True, help='output file path')
+    parser.add_argument('--n', type=str, help='node file path')
+    parser.add_argument('--e', type=str, help='edge file path')
+    parser.add_argument('--uri', type=str, help='Neo4j URI instance')
+    parser.add_argument('--user', type=str, help='Neo4j username for instance')
+    parser.add_argument('--p', type=str, help='Neo4j password for instance')
+    parser.add_argument('--o', type=str, help='output file path')
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE, help='rows per UNWIND batch when loading')
+    parser.add_argument('--row_by_row', action='store_true', help='load with one MERGE per row (previous loader)')
+    parser.add_argument('--export', type=str, default=None,
+                        help='write neo4j-admin import CSVs to this directory instead of connecting')
+    parser.add_argument('--verify', type=str, default=None, help='check an exported neo4j-admin bundle and exit')
     args = parser.parse_args()
 
+    # === Offline bundle ===
+    if args.verify:
+        problems = verify_admin_import(args.verify)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            raise SystemExit(1)
+        print(f"✅ {args.verify} is ready for neo4j-admin import.")
+        return
+
+    if not (args.n and args.e):
+        parser.error("--n and --e are required")
+
+    if args.export:
+        nodes_df = pd.read_csv(args.n)
+        edges_df = pd.read_csv(args.e)
+        command = export_admin_import(nodes_df, edges_df, args.export)
+        print(f"📁 Wrote {NODE_FILE} and {EDGE_FILE} to: {args.export}")
+        print(f"\nImport with (server stopped):\n  {command}")
+        return
+
+    if not (args.uri and args.user and args.p and args.o):
+        parser.error("--uri, --user, --p and --o are required to load and query a server")
+    if GraphDatabase is None:
+        parser.error("connecting to Neo4j needs the neo4j driver (pip install neo4j)")
+
     # === Create Neo4j driver ===
     driver = GraphDatabase.driver(
         args.uri,
@@ -123,8 +331,11 @@ def main():
         session.execute_write(clear_database)
 
         print("🧩 Creating graph in Neo4j...\n")
-        session.execute_write(create_nodes, nodes_df)
-        session.execute_write(create_edges, edges_df)
+        if args.row_by_row:
+            session.execute_write(create_nodes, nodes_df)
+            session.execute_write(create_edges, edges_df)
+        else:
+            load_batched(session, nodes_df, edges_df, args.batch_size)
 
         print("\n🔍 Running pattern query 1: food -> microbe...")
         result1 = session.run(cypher1)
@@ -0,0 +1,192 @@
+"""Cohort store: the pattern results of many samples in one partitioned Parquet dataset.
+
+Each sample's results file is split by pattern key and stored under Hive-style
+partition directories::
+
+    <root>/sample=<name>/pattern=<key>/part-00000.parquet
+
+Readers only open the partitions of the samples and patterns they ask for
+(partition pruning) and only decode the columns they ask for (column
+projection), so comparing many samples on one KO column reads a small part
+of the data.  Partition values are percent-encoded, so any sample name is a
+valid directory name.
+
+A sample is written to a hidden temporary directory and swapped in when
+complete; re-appending a sample replaces what was stored for it.  Different
+samples live in different directories, so pipeline jobs can append to the
+same cohort concurrently.  Writing and reading need ``pyarrow``.
+"""
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote
+
+import pandas as pd
+
+from dietmicrobenet.patterns import PATTERN_COLUMN, pattern_key
+from dietmicrobenet.results import DEFAULT_CHUNK_SIZE, iter_results
+
+SAMPLE_PARTITION = "sample"
+PATTERN_PARTITION = PATTERN_COLUMN
+
+_PART = "part-{:05d}.parquet"
+
+# Pattern key part of a missing compound origin
+MISSING_ORIGIN = "missing"
+
+
+# ---------------------------------------------------------------------------
+# Layout
+# ---------------------------------------------------------------------------
+
+def _partition(name: str, value: str) -> str:
+    return f"{name}={quote(str(value), safe='')}"
+
+
+def _partitions(directory: Path, name: str) -> Dict[str, Path]:
+    """Partition value → directory for the ``name=...`` subdirectories, sorted by value."""
+    if not directory.is_dir():
+        return {}
+    found = {unquote(d.name.split("=", 1)[1]): d for d in directory.iterdir()
+             if d.is_dir() and d.name.startswith(f"{name}=")}
+    return dict(sorted(found.items()))
+
+
+def sample_path(root: str, sample: str) -> Path:
+    """Partition directory of ``sample``."""
+    return Path(root) / _partition(SAMPLE_PARTITION, sample)
+
+
+def stored_samples(root: str) -> List[str]:
+    """Names of the samples stored in the cohort, sorted."""
+    return list(_partitions(Path(root), SAMPLE_PARTITION))
+
+
+def stored_patterns(root: str, samples: Optional[Sequence[str]] = None) -> List[str]:
+    """Pattern keys stored for any of ``samples`` (default: all samples), sorted."""
+    samples = stored_samples(root) if samples is None else samples
+    keys = set()
+    for sample in samples:
+        keys.update(_partitions(sample_path(root, sample), PATTERN_PARTITION))
+    return sorted(keys)
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+def _pattern_groups(df: pd.DataFrame) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """(pattern key, rows) for each pattern in a results chunk.
+
+    Uses the pattern column when the results have one, otherwise the
+    ``compound{p}_origin`` columns.  A missing origin is keyed as
+    ``MISSING_ORIGIN``, so those rows are kept as the per-file readers keep
+    them (they match no origin).
+    """
+    if PATTERN_COLUMN in df.columns:
+        rows = df.drop(columns=PATTERN_COLUMN)
+        for key, group in rows.groupby(df[PATTERN_COLUMN], observed=True, sort=False):
+            yield str(key), group
+        return
+
+    origin_cols = []
+    while f"compound{len(origin_cols) + 1}_origin" in df.columns:
+        origin_cols.append(f"compound{len(origin_cols) + 1}_origin")
+    if not origin_cols:
+        raise ValueError(f"Results need a '{PATTERN_COLUMN}' column or compound origin columns. Found: {list(df.columns)}")
+    for origins, group in df.groupby(origin_cols, sort=False, dropna=False):
+        origins = origins if isinstance(origins, tuple) else (origins,)
+        yield pattern_key([MISSING_ORIGIN if pd.isna(o) else str(o) for o in origins]), group
+
+
+def append_results(root: str, sample: str, results: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Store a sample's results file (CSV or Parquet, compact or not) in the cohort.
+
+    The file is read in chunks of ``chunk_size`` rows; each chunk adds one
+    part file to every pattern partition it has rows for.  Anything stored
+    for ``sample`` before is replaced.
+
+    Returns
+    -------
+    Number of rows stored.
+    """
+    final = sample_path(root, sample)
+    tmp = final.with_name(f".{final.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    rows = 0
+    for i, chunk in enumerate(iter_results(results, chunk_size)):
+        for key, group in _pattern_groups(chunk):
+            directory = tmp / _partition(PATTERN_PARTITION, key)
+            directory.mkdir(exist_ok=True)
+            group.to_parquet(directory / _PART.format(i), index=False)
+            rows += len(group)
+
+    # swap the complete sample in; readers never see a partly written sample
+    if final.exists():
+        old = final.with_name(f".{final.name}.old")
+        shutil.rmtree(old, ignore_errors=True)
+        final.rename(old)
+        tmp.rename(final)
+        shutil.rmtree(old)
+    else:
+        tmp.rename(final)
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+def read_sample(
+    root: str,
+    sample: str,
+    patterns: Optional[Sequence[str]] = None,
+    columns: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """Rows of one sample, restricted to ``patterns`` and ``columns``.
+
+    Only the part files of the selected pattern partitions are opened and only
+    ``columns`` are decoded from them.  Rows come grouped by pattern (in key
+    order) with a categorical pattern column.
+
+    Raises
+    ------
+    FileNotFoundError
+        When the sample is not in the cohort.
+    """
+    directory = sample_path(root, sample)
+    if not directory.is_dir():
+        raise FileNotFoundError(f"Sample '{sample}' not found in cohort {root}")
+    stored = _partitions(directory, PATTERN_PARTITION)
+    keys = list(stored) if patterns is None else [k for k in patterns if k in stored]
+    columns = None if columns is None else [c for c in columns if c != PATTERN_COLUMN]
+
+    frames, labels = [], []
+    for key in keys:
+        for part in sorted(stored[key].glob("part-*.parquet")):
+            frame = pd.read_parquet(part, columns=columns)
+            frames.append(frame)
+            labels += [key] * len(frame)
+
+    categories = list(stored) if patterns is None else list(dict.fromkeys(patterns))
+    if frames:
+        df = pd.concat(frames, ignore_index=True)
+    else:
+        df = pd.DataFrame(columns=columns or [])
+    df[PATTERN_COLUMN] = pd.Categorical(labels, categories=categories)
+    return df
+
+
+def read_cohort(
+    root: str,
+    samples: Optional[Sequence[str]] = None,
+    patterns: Optional[Sequence[str]] = None,
+    columns: Optional[Sequence[str]] = None,
+) -> Dict[str, pd.DataFrame]:
+    """:func:`read_sample` for each of ``samples`` (default: every stored sample), keyed by sample name."""
+    samples = stored_samples(root) if samples is None else samples
+    return {sample: read_sample(root, sample, patterns, columns) for sample in samples}
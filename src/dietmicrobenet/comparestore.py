@@ -0,0 +1,251 @@
+"""Comparison store: KO sets and their similarity matrix, grown one batch of samples at a time.
+
+Comparing a cohort means one KO set per sample and the n × n Jaccard
+similarity matrix of those sets (clustering, heatmaps and PERMANOVA all start
+from it).  A store keeps both on disk for one comparison (a pattern, or a
+pattern/edge), so adding m samples only computes the m × (n + m) block of
+the new samples against everything stored, and the earlier results files
+are never read again::
+
+    <root>/<key>/store.json         source, sample names and inputs, KO vocabulary, entry counts
+                 indptr.int64       CSR row pointers of the sample × KO incidence
+                 indices.int32      KO ids of every sample, row after row
+                 similarity.float64 packed lower triangle, row i = sim(i, 0..i)
+
+All three arrays only ever grow at the end, and they are read through
+``numpy.memmap``.  ``store.json`` is replaced last, so a run that stops while
+appending leaves the previous state readable (the surplus bytes are cut
+before the next append).  One process should write to a store at a time.
+
+A store only holds KO sets made one way: ``source`` (e.g. the KO column and
+cohort read) is recorded when it is created and opening it with another
+source raises ``ValueError``, as does asking for a stored sample with another
+input file than the one it was read from.
+
+The stored similarities are the same values ``jaccard_similarity`` gives for
+all samples at once.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+from scipy import sparse
+
+from dietmicrobenet.similarity import jaccard_cross
+
+# Bump when the layout changes so old stores are not misread
+STORE_VERSION = 2
+
+_META = "store.json"
+_INDPTR = "indptr.int64"
+_INDICES = "indices.int32"
+_SIMILARITY = "similarity.float64"
+
+
+def _triangle(n: int) -> int:
+    """Packed lower-triangle entries of an n × n matrix (row i holds i + 1)."""
+    return n * (n + 1) // 2
+
+
+def _read(path: Path, dtype, count: int) -> np.ndarray:
+    """The first ``count`` entries of a binary array file, memory-mapped."""
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+def _append(path: Path, values: np.ndarray, dtype, count: int) -> None:
+    """Write ``values`` after the first ``count`` entries, dropping anything beyond them."""
+    with open(path, "ab") as fh:
+        fh.truncate(count * np.dtype(dtype).itemsize)
+        fh.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+
+def store_keys(root: str) -> List[str]:
+    """Keys of the comparisons kept under ``root``, sorted."""
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    return sorted(unquote(d.name) for d in root.iterdir() if (d / _META).is_file())
+
+
+class ComparisonStore:
+    """On-disk KO sets and similarity matrix of one comparison.
+
+    Open (or create) it with the store root, the comparison's key and the
+    source the KO sets come from, add samples with :meth:`add`, and read KO
+    sets and matrices for any of the stored samples with :meth:`ko_sets` and
+    :meth:`similarity`.
+    """
+
+    def __init__(self, root: str, key: str, source: Optional[dict] = None):
+        self.key = key
+        # through JSON so a fresh source compares equal to the one read back
+        self.source = json.loads(json.dumps(source))
+        self.path = Path(root) / quote(str(key), safe="")
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta_path = self.path / _META
+        if meta_path.is_file():
+            meta = json.loads(meta_path.read_text())
+            if meta.get("version") != STORE_VERSION:
+                raise ValueError(f"Comparison store {self.path} has version {meta.get('version')}, "
+                                 f"expected {STORE_VERSION}.")
+            if meta["source"] != self.source:
+                raise ValueError(f"Comparison store {self.path} was built from {meta['source']}, "
+                                 f"not {self.source}; use another store directory.")
+        else:
+            meta = {"version": STORE_VERSION, "source": self.source, "samples": [], "inputs": {}, "kos": [], "nnz": 0}
+        self.samples: List[str] = list(meta["samples"])
+        self.inputs: Dict[str, str] = dict(meta["inputs"])
+        self.kos: List[str] = list(meta["kos"])
+        self._nnz = int(meta["nnz"])
+        self._positions = {name: i for i, name in enumerate(self.samples)}
+        self._ko_ids = {ko: i for i, ko in enumerate(self.kos)}
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __contains__(self, sample: str) -> bool:
+        return sample in self._positions
+
+    # -----------------------------------------------------------------
+    # Reading
+    # -----------------------------------------------------------------
+
+    def incidence(self) -> sparse.csr_matrix:
+        """Binary sample × KO matrix (columns in ``kos`` order) over the memory-mapped rows."""
+        n = len(self.samples)
+        indptr = np.concatenate([[0], _read(self.path / _INDPTR, np.int64, n)])
+        indices = _read(self.path / _INDICES, np.int32, self._nnz)
+        data = np.ones(self._nnz, dtype=np.int64)
+        return sparse.csr_matrix((data, indices, indptr), shape=(n, len(self.kos)))
+
+    def ko_sets(self, samples: Optional[Sequence[str]] = None) -> Dict[str, List[str]]:
+        """Sample → sorted KOs, for ``samples`` (default: all, in stored order)."""
+        samples = self.samples if samples is None else samples
+        X = self.incidence()
+        kos = np.asarray(self.kos, dtype=object)
+        sets = {}
+        for name in samples:
+            i = self._position(name)
+            sets[name] = sorted(kos[X.indices[X.indptr[i]:X.indptr[i + 1]]].tolist())
+        return sets
+
+    def similarity(self, samples: Optional[Sequence[str]] = None) -> Tuple[np.ndarray, List[str]]:
+        """Square similarity matrix of ``samples`` (default: all) and its labels.
+
+        Only the entries between the requested samples are read from the
+        packed triangle.
+        """
+        samples = list(self.samples if samples is None else samples)
+        positions = np.array([self._position(name) for name in samples], dtype=np.int64)
+        packed = _read(self.path / _SIMILARITY, np.float64, _triangle(len(self.samples)))
+        matrix = np.empty((len(positions), len(positions)), dtype=np.float64)
+        for row, i in enumerate(positions):
+            high, low = np.maximum(i, positions), np.minimum(i, positions)
+            matrix[row] = packed[high * (high + 1) // 2 + low]
+        return matrix, samples
+
+    def check_inputs(self, inputs: Dict[str, str]) -> None:
+        """Raise ``ValueError`` if a stored sample was read from another input than ``inputs`` gives."""
+        for name, source in inputs.items():
+            if name in self.inputs and self.inputs[name] != source:
+                raise ValueError(f"Sample '{name}' is stored in {self.path} from {self.inputs[name]}, "
+                                 f"not {source}; use another store directory.")
+
+    def _position(self, sample: str) -> int:
+        try:
+            return self._positions[sample]
+        except KeyError:
+            raise KeyError(f"Sample '{sample}' is not in comparison store {self.path}.") from None
+
+    # -----------------------------------------------------------------
+    # Writing
+    # -----------------------------------------------------------------
+
+    def _rows(self, ko_sets: Sequence[Iterable[str]]) -> sparse.csr_matrix:
+        """Incidence rows of new KO sets, registering unseen KOs at the end of the vocabulary."""
+        rows = [sorted({self._ko_ids.setdefault(ko, len(self._ko_ids)) for ko in kos}) for kos in ko_sets]
+        self.kos = list(self._ko_ids)
+        indptr = np.concatenate([[0], np.cumsum([len(r) for r in rows])]).astype(np.int64)
+        indices = np.fromiter((k for r in rows for k in r), dtype=np.int32, count=int(indptr[-1]))
+        data = np.ones(len(indices), dtype=np.int64)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), len(self.kos)))
+
+    def add(self, pattern_kos: Dict[str, Iterable[str]], inputs: Optional[Dict[str, str]] = None) -> List[str]:
+        """Add the samples of ``pattern_kos`` that the store does not have yet.
+
+        Samples already stored with the same KOs are skipped; a stored
+        sample whose KOs changed raises ``ValueError`` (rebuild the store
+        from scratch to replace it).  ``inputs`` (sample → input file) is
+        recorded for the new samples.  Returns the names added.
+        """
+        self.check_inputs(inputs or {})
+        new, stored = {}, self.ko_sets([name for name in pattern_kos if name in self])
+        for name, kos in pattern_kos.items():
+            if name in stored:
+                if sorted(set(kos)) != stored[name]:
+                    raise ValueError(f"Sample '{name}' is stored in {self.path} with other KOs; "
+                                     f"rebuild the store to replace it.")
+            else:
+                new[name] = kos
+        if not new:
+            return []
+
+        n, m = len(self.samples), len(new)
+        old = self.incidence()
+        rows = self._rows(new.values())
+        old = sparse.csr_matrix((old.data, old.indices, old.indptr), shape=(n, len(self.kos)))
+        everything = sparse.vstack([old, rows], format="csr")
+        # the only new similarities: new samples against every stored and new sample
+        block = jaccard_cross(rows, everything)
+        packed = np.concatenate([block[a, :n + a + 1] for a in range(m)])
+
+        _append(self.path / _INDICES, rows.indices, np.int32, self._nnz)
+        _append(self.path / _INDPTR, rows.indptr[1:] + self._nnz, np.int64, n)
+        _append(self.path / _SIMILARITY, packed, np.float64, _triangle(n))
+
+        self.samples.extend(new)
+        self._positions.update((name, n + a) for a, name in enumerate(new))
+        self.inputs.update((name, inputs[name]) for name in new if inputs and name in inputs)
+        self._nnz += rows.nnz
+        self._write_meta()
+        return list(new)
+
+    def _write_meta(self) -> None:
+        meta = {"version": STORE_VERSION, "source": self.source, "samples": self.samples, "inputs": self.inputs,
+                "kos": self.kos, "nnz": self._nnz}
+        tmp = self.path / f".{_META}.tmp"
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self.path / _META)
+
+
+def update_stores(
+    root: str,
+    keys: Sequence[str],
+    samples: Sequence[str],
+    load: Callable[[List[str]], Dict[str, Dict[str, Iterable[str]]]],
+    source: Optional[dict] = None,
+    inputs: Optional[Dict[str, str]] = None,
+) -> Dict[str, ComparisonStore]:
+    """Open the stores of ``keys`` and add the ``samples`` missing from any of them.
+
+    ``load(missing)`` returns key → {sample: KOs} for just the missing
+    samples; it is not called when every store already has every sample.
+    ``source`` and ``inputs`` (sample → input file) must match what the
+    stores were built from, otherwise ``ValueError`` is raised.
+    """
+    stores = {key: ComparisonStore(root, key, source) for key in keys}
+    for store in stores.values():
+        store.check_inputs(inputs or {})
+    missing = [name for name in samples if any(name not in store for store in stores.values())]
+    if missing:
+        loaded = load(missing)
+        for key, store in stores.items():
+            store.add(loaded[key], inputs)
+    return stores
@@ -0,0 +1,186 @@
+"""Fast parsing of KO list columns.
+
+Results files store each edge's KOs as the text of a Python list, e.g.
+``"['K00001', 'K00002']"``, and a results table repeats the same few
+thousand list strings over millions of rows.  A column is therefore parsed
+per *distinct* string: the column is factorized, each distinct string is
+scanned once with the ``\\bK\\d{5}\\b`` regex (and the result memoized
+across columns and calls), and rows pick up their parsed tuple by code.
+
+The regex result is only used when the string is nothing but KO IDs and list
+syntax.  Anything else, such as hand-made items like ``"['KO1']"`` next to
+KO IDs, falls back to ``ast.literal_eval``, so no item is dropped or cut.
+
+:class:`KOIncidence` goes one step further for comparisons that look at the
+same results under several pattern groupings: every sample's KO columns are
+parsed once into a sparse (sample, pattern, column) × KO incidence matrix,
+and the KO set of any group of patterns is an OR over rows of it.
+"""
+from __future__ import annotations
+
+import ast
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+KO_PATTERN = re.compile(r"\bK\d{5}\b")
+
+# What a KO list string holds besides its KO IDs: brackets, quotes, commas, spaces
+_LIST_SYNTAX = re.compile(r"[\s\[\](){}'\",]*")
+
+# Distinct KO list strings remembered by parse_ko_list
+_CACHE_SIZE = 1 << 18
+
+
+def _literal_list(text: str) -> Tuple:
+    """Items of a list string parsed as a Python literal; bare values are one item."""
+    text = text.strip()
+    if text == "":
+        return ()
+    try:
+        parsed = ast.literal_eval(text)
+    except Exception:
+        trimmed = text.strip("[](){} ")
+        return tuple(x.strip().strip("'\"") for x in trimmed.split(",") if x.strip())
+    if isinstance(parsed, (list, tuple, set)):
+        return tuple(parsed)
+    return (parsed,)
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def parse_ko_list(text: str) -> Tuple:
+    """Items of one list string, in order (memoized per distinct string)."""
+    found = KO_PATTERN.findall(text)
+    if found and _LIST_SYNTAX.fullmatch(KO_PATTERN.sub("", text)):
+        return tuple(found)
+    return _literal_list(text)
+
+
+def parse_ko_cell(value) -> Tuple:
+    """Items of one KO list cell: a list string, a Python list, or missing (no items)."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ()
+    if isinstance(value, (list, tuple, set)):
+        return tuple(value)
+    return parse_ko_list(str(value))
+
+
+def distinct_ko_lists(values: Iterable) -> Tuple[np.ndarray, List[Tuple]]:
+    """(code per row, parsed KOs per distinct value) for a KO list column.
+
+    Missing cells get code -1.  Cells holding Python lists (not strings) are
+    parsed one by one.
+    """
+    values = pd.Series(values, dtype=object) if not isinstance(values, pd.Series) else values
+    try:
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    except TypeError:  # unhashable list cells
+        return np.arange(len(values)), [parse_ko_cell(v) for v in values]
+    return codes, [parse_ko_cell(v) for v in uniques]
+
+
+def ko_lists(values: Iterable) -> List[Tuple]:
+    """Parsed KOs of every cell of a KO list column."""
+    codes, parsed = distinct_ko_lists(values)
+    lookup = parsed + [()]  # code -1 (missing) picks the empty tuple
+    return [lookup[c] for c in codes]
+
+
+def ko_union(values: Iterable) -> List:
+    """Sorted distinct KOs of a whole KO list column."""
+    codes, parsed = distinct_ko_lists(values)
+    used = np.unique(codes[codes >= 0])
+    return sorted({ko for c in used for ko in parsed[c]})
+
+
+class KOIncidence:
+    """Which KOs occur in each (sample, pattern, KO column) of a set of results.
+
+    Stored as a boolean sparse matrix with one row per (sample, pattern,
+    column) triple, in that nesting order, and one column per KO (sorted).
+    Build it with :meth:`from_frames`; read KO sets with :meth:`ko_sets`.
+    """
+
+    def __init__(self, matrix: sparse.csr_matrix, samples: Sequence[str], patterns: Sequence[str],
+                 columns: Sequence[str], kos: Sequence[str]):
+        self.matrix = matrix
+        self.samples = list(samples)
+        self.patterns = list(patterns)
+        self.columns = list(columns)
+        self.kos = np.asarray(kos, dtype=object)
+
+    def _row(self, sample: int, pattern: int, column: int) -> int:
+        return (sample * len(self.patterns) + pattern) * len(self.columns) + column
+
+    @classmethod
+    def from_frames(
+        cls,
+        frames: Dict[str, pd.DataFrame],
+        row_patterns: Callable[[pd.DataFrame], np.ndarray],
+        patterns: Sequence[str],
+        columns: Sequence[str],
+    ) -> "KOIncidence":
+        """Parse the KO ``columns`` of every sample's results once.
+
+        ``row_patterns(df)`` gives the position in ``patterns`` of each row
+        of ``df`` (-1 for rows in none of them).  A column a sample does not
+        have contributes no KOs.
+        """
+        n_patterns, n_columns = len(patterns), len(columns)
+        ko_ids: Dict[str, int] = {}
+        rows, cols = [], []
+        for s, df in enumerate(frames.values()):
+            codes = row_patterns(df)
+            for c, col in enumerate(columns):
+                if col not in df.columns:
+                    continue
+                strings, parsed = distinct_ko_lists(df[col])
+                keep = (codes >= 0) & (strings >= 0)
+                # each (pattern, distinct string) pair once, however many rows share it
+                pairs = np.unique(codes[keep] * len(parsed) + strings[keep])
+                pattern_of, string_of = np.divmod(pairs, max(len(parsed), 1))
+                # KO ids of the strings in use, flattened, then gathered for every pair
+                used = np.unique(string_of)
+                sizes = np.zeros(len(parsed), dtype=np.int64)
+                sizes[used] = [len(parsed[i]) for i in used]
+                flat = np.fromiter((ko_ids.setdefault(ko, len(ko_ids)) for i in used for ko in parsed[i]),
+                                   dtype=np.int64, count=int(sizes.sum()))
+                starts = np.cumsum(sizes) - sizes
+                lengths = sizes[string_of]
+                first = np.cumsum(lengths) - lengths
+                gather = np.repeat(starts[string_of] - first, lengths) + np.arange(lengths.sum())
+                rows.append(np.repeat((s * n_patterns + pattern_of) * n_columns + c, lengths))
+                cols.append(flat[gather])
+
+        # columns in sorted KO order, so a row's non-zeros read out sorted
+        kos = np.array(sorted(ko_ids), dtype=object)
+        rank = np.empty(len(ko_ids), dtype=np.int64)
+        rank[[ko_ids[k] for k in kos]] = np.arange(len(kos))
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        cols = rank[np.concatenate(cols)] if cols else np.zeros(0, dtype=np.int64)
+        shape = (len(frames) * n_patterns * n_columns, len(kos))
+        matrix = sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=shape)
+        return cls(matrix, list(frames), patterns, columns, kos)
+
+    def incidence(self, patterns: Sequence[str], column: str) -> sparse.csr_matrix:
+        """Sample × KO matrix: KOs in ``column`` of any of ``patterns`` (OR over the patterns)."""
+        c = self.columns.index(column)
+        positions = [self.patterns.index(p) for p in patterns]
+        rows = [self._row(s, p, c) for s in range(len(self.samples)) for p in positions]
+        # sums the selected rows of each sample; any non-zero count means present
+        pool = sparse.csr_matrix(
+            (np.ones(len(rows)), (np.repeat(np.arange(len(self.samples)), len(positions)), np.arange(len(rows)))),
+            shape=(len(self.samples), len(rows)),
+        )
+        return (pool @ self.matrix[rows].astype(np.float64)).astype(bool).tocsr()
+
+    def ko_sets(self, patterns: Sequence[str], column: str) -> Dict[str, List[str]]:
+        """Sample → sorted KOs found in ``column`` of any of ``patterns``."""
+        X = self.incidence(patterns, column)
+        X.sort_indices()
+        return {name: self.kos[X.indices[X.indptr[i]:X.indptr[i + 1]]].tolist()
+                for i, name in enumerate(self.samples)}
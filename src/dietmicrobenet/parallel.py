@@ -0,0 +1,119 @@
+"""Multi-process evaluation of pattern queries.
+
+A query is split into blocks of consecutive first-hop edges
+(:func:`~dietmicrobenet.patterns.path_blocks`); edges are grouped by source
+compound, so this partitions the work by source compound.  Each worker joins
+its blocks and encodes the result chunk (materialized rows rendered as CSV
+text), which is where nearly all of the time goes.
+
+The graph and the block plan are handed to each worker once, when the pool
+starts.  With the ``fork`` start method (Linux) they are inherited as
+copy-on-write memory and never pickled; elsewhere they are pickled once per
+worker, not per task.  Tasks are only block numbers.
+
+Chunks are written in block order, so the output is identical to a
+single-process run whatever the number of workers.  A block whose paths
+exceed the chunk size (one hub edge) is rendered in several chunks.  At most
+a few blocks per worker are held in memory while waiting for the writer.
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+from collections import deque
+from functools import partial
+from typing import Callable, Iterator, List, Optional
+
+from dietmicrobenet import patterns
+from dietmicrobenet.patterns import GraphTables, PathBlocks
+from dietmicrobenet.results import DEFAULT_CHUNK_SIZE, ResultWriter, encode_chunk
+
+# Blocks per worker, so uneven blocks still keep every worker busy
+BLOCKS_PER_WORKER = 4
+
+# Encoded chunks per worker waiting to be written before new blocks are queued
+_PENDING_PER_WORKER = 2
+
+# Worker state set by _init_worker
+_worker = {}
+
+
+def pool_context():
+    """``fork`` where available, so pool initializer arguments (graphs, PERMANOVA tests) are inherited, not pickled."""
+    methods = mp.get_all_start_methods()
+    return mp.get_context("fork" if "fork" in methods else None)
+
+
+def _init_worker(graph: GraphTables, blocks: PathBlocks, render: Callable) -> None:
+    _worker.update(graph=graph, blocks=blocks, render=render)
+
+
+def _run_block(i: int):
+    return _render_block(_worker["graph"], _worker["blocks"], _worker["render"], i)
+
+
+def _render_block(graph: GraphTables, blocks: PathBlocks, render: Callable, i: int) -> List:
+    paths = patterns.block_paths(graph, blocks, i)
+    return [render(graph, chunk) for chunk in patterns.split_paths(paths, blocks.chunk_size)]
+
+
+def map_blocks(graph: GraphTables, blocks: PathBlocks, render: Callable, workers: int = 1) -> Iterator:
+    """Yield ``render(graph, paths)`` for every chunk of at most ``blocks.chunk_size`` paths, in block order.
+
+    ``render`` must be picklable (a module-level function or a ``partial`` of
+    one) when ``workers`` > 1.
+    """
+    if workers <= 1 or len(blocks) <= 1:
+        for i in range(len(blocks)):
+            yield from _render_block(graph, blocks, render, i)
+        return
+
+    with pool_context().Pool(workers, initializer=_init_worker, initargs=(graph, blocks, render)) as pool:
+        pending = deque()
+        for i in range(len(blocks)):
+            pending.append(pool.apply_async(_run_block, (i,)))
+            if len(pending) >= _PENDING_PER_WORKER * workers:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def encode_paths(
+    graph: GraphTables,
+    paths,
+    node_attrs: List[str],
+    edge_attrs: List[str],
+    edge_prefixes: Optional[List[str]],
+    fmt: str,
+    pattern_keys: Optional[List[str]] = None,
+):
+    """Materialize paths and encode them for ``ResultWriter.write_encoded``."""
+    return encode_chunk(patterns.materialize(graph, paths, node_attrs, edge_attrs, edge_prefixes, pattern_keys), fmt)
+
+
+def write_paths(
+    graph: GraphTables,
+    specs,
+    writer: ResultWriter,
+    node_attrs: List[str],
+    edge_attrs: List[str],
+    edge_prefixes: Optional[List[str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 1,
+    pattern_keys: Optional[List[str]] = None,
+) -> int:
+    """Stream every path matching ``specs`` to ``writer`` using ``workers`` processes.
+
+    ``pattern_keys`` tags every path with its pattern key (see
+    :func:`~dietmicrobenet.patterns.materialize`).
+
+    Returns
+    -------
+    Number of rows written.
+    """
+    min_blocks = BLOCKS_PER_WORKER * workers if workers > 1 else 1
+    blocks = patterns.path_blocks(graph, specs, chunk_size, min_blocks=min_blocks)
+    render = partial(encode_paths, node_attrs=node_attrs, edge_attrs=edge_attrs,
+                     edge_prefixes=edge_prefixes, fmt=writer.fmt, pattern_keys=pattern_keys)
+    for chunk in map_blocks(graph, blocks, render, workers):
+        writer.write_encoded(chunk)
+    return writer.rows
@@ -0,0 +1,875 @@
+"""Origin-pattern queries over DietMicrobeNet node and edge tables.
+
+A pattern is written as a chain of origin sets, one per compound position::
+
+    diet|microbediet|all -> microbe|microbediet|all -> host|hostdiet|hostmicrobe|all
+
+Each ``->`` is one edge (hop).  A pattern of any length is compiled into one
+filtered edge set per hop, and the filtered sets are chained together with
+sorted-key joins on the shared compound.  The join order is chosen from the
+origin-pair histogram of the edge table so the smallest sets are joined first.
+"""
+from __future__ import annotations
+
+import heapq
+import re
+from dataclasses import dataclass, field
+from itertools import product
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from dietmicrobenet.kos import parse_ko_cell
+
+# ---------------------------------------------------------------------------
+# Patterns used by the pipeline
+# ---------------------------------------------------------------------------
+
+# run_graph.py: food → microbe, food → both, both → both
+MICROBE_PATTERNS: List[str] = [
+    "food -> microbe|both",
+    "both -> both",
+]
+
+# host_run_graph.py / host_GraphComparison.py: the 36 diet → microbe → host shapes
+HOST_PATTERN: str = "diet|microbediet|all -> microbe|microbediet|all -> host|hostdiet|hostmicrobe|all"
+
+ARROW = "->"
+ALTERNATIVE = "|"
+
+# Result column holding each path's concrete origin pattern (see pattern_key)
+PATTERN_COLUMN = "pattern"
+
+
+# ---------------------------------------------------------------------------
+# Pattern language
+# ---------------------------------------------------------------------------
+
+def parse_pattern(spec: str) -> Tuple[Tuple[str, ...], ...]:
+    """Parse a pattern spec into one tuple of allowed origins per position.
+
+    Order within each position is kept so expanded patterns are reproducible.
+
+    Raises
+    ------
+    ValueError
+        When the spec has fewer than two positions or an empty position.
+    """
+    positions = []
+    for part in spec.split(ARROW):
+        origins = tuple(dict.fromkeys(o.strip() for o in part.split(ALTERNATIVE) if o.strip()))
+        if not origins:
+            raise ValueError(f"Empty position in pattern '{spec}'.")
+        positions.append(origins)
+    if len(positions) < 2:
+        raise ValueError(f"Pattern '{spec}' needs at least two positions separated by '{ARROW}'.")
+    return tuple(positions)
+
+
+def expand_pattern(spec: str) -> List[Tuple[str, ...]]:
+    """Expand a spec into every concrete origin tuple it matches, in spec order."""
+    return list(product(*parse_pattern(spec)))
+
+
+def pattern_key(origins: Sequence[str]) -> str:
+    """Key for a concrete origin tuple, e.g. ``diet_microbe_host``."""
+    return "_".join(origins)
+
+
+def key_origins(key: str) -> Tuple[str, ...]:
+    """Origin tuple of a pattern key (inverse of ``pattern_key``; origins never contain ``_``)."""
+    return tuple(key.split("_"))
+
+
+def spec_keys(specs: Sequence[str]) -> List[str]:
+    """Keys of every concrete origin tuple matched by ``specs``, in spec order and without repeats."""
+    return list(dict.fromkeys(pattern_key(origins) for spec in specs for origins in expand_pattern(spec)))
+
+
+def pattern_label(origins: Sequence[str]) -> str:
+    """Human-readable label for a concrete origin tuple, e.g. ``diet → microbe → host``."""
+    return " → ".join(origins)
+
+
+# ---------------------------------------------------------------------------
+# Graph tables
+# ---------------------------------------------------------------------------
+
+def _parse_list(value) -> List[str]:
+    """Items of a list cell as written to the edge CSVs (e.g. "['K00001', 'K00002']").
+
+    Split with ``kos.parse_ko_cell``, the parser of the comparison scripts and
+    the Neo4j exporter, so every consumer reads a cell the same way.
+    """
+    return [str(v) for v in parse_ko_cell(value)]
+
+
+def _union_lists(values: pd.Series, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """Sorted union of the list items of ``values`` within each group, as list strings.
+
+    Each distinct cell string is parsed once; items are then gathered with
+    array indexing, so no Python object is created per parallel edge.
+    Groups without items get NaN.
+    """
+    # in-memory tables may hold real lists, which are not hashable
+    keys = values.map(lambda v: tuple(v) if isinstance(v, (list, set)) else v)
+    codes, uniques = pd.factorize(keys, use_na_sentinel=True)
+    parsed = [_parse_list(u) for u in uniques] + [[]]  # last entry stands for missing cells
+    codes = np.where(codes < 0, len(uniques), codes)
+
+    lengths = np.array([len(p) for p in parsed], dtype=np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    flat = np.array([item for p in parsed for item in p], dtype=object)
+
+    row_lengths = lengths[codes]
+    starts = np.repeat(offsets[codes], row_lengths)
+    within = np.arange(row_lengths.sum()) - np.repeat(np.cumsum(row_lengths) - row_lengths, row_lengths)
+    items = pd.DataFrame({"group": np.repeat(groups, row_lengths), "item": flat[starts + within]})
+
+    merged = (items.drop_duplicates()
+                   .sort_values(["group", "item"])
+                   .groupby("group", sort=True)["item"]
+                   .agg(list))
+    out = np.full(n_groups, np.nan, dtype=object)
+    out[merged.index.to_numpy()] = [str(v) for v in merged.to_numpy()]
+    return out
+
+
+def aggregate_parallel_edges(edges_df: pd.DataFrame, keys: Sequence[str] = ("compound1", "compound2")) -> pd.DataFrame:
+    """Collapse parallel edges (several reactions per compound pair) into one edge per pair.
+
+    Numeric columns (abundances) are summed over the parallel reactions and
+    every other column (reaction, KOs, organisms) becomes the sorted union of
+    its list items, e.g. reaction "['R00001', 'R00002']".  A pair with a
+    single reaction keeps its cells unchanged, so its row reads as it does
+    without aggregation.  Pairs keep the position of their first occurrence.
+    """
+    keys = list(keys)
+    edges = edges_df.reset_index(drop=True)
+    groups = edges.groupby(keys, sort=False, dropna=False).ngroup().to_numpy()
+    n_groups = int(groups.max()) + 1 if len(groups) else 0
+    parallel = np.bincount(groups, minlength=n_groups) > 1
+    in_parallel = parallel[groups]
+
+    first = edges.drop_duplicates(subset=keys, keep="first")[keys].reset_index(drop=True)
+    out = {k: first[k].to_numpy() for k in keys}
+    for col in edges.columns:
+        if col in keys:
+            continue
+        if pd.api.types.is_numeric_dtype(edges[col]):
+            out[col] = edges[col].groupby(groups).sum(min_count=1).reindex(range(n_groups)).to_numpy()
+        else:
+            values = np.empty(n_groups, dtype=object)
+            values[groups[~in_parallel]] = edges[col].to_numpy()[~in_parallel]
+            values[parallel] = _union_lists(edges[col][in_parallel], groups[in_parallel], n_groups)[parallel]
+            out[col] = values
+    return pd.DataFrame(out, columns=list(edges.columns))
+
+
+def prepare_edges(
+    nodes_df: pd.DataFrame,
+    edges_df: pd.DataFrame,
+    multi_edges: bool = False,
+) -> Tuple[pd.DataFrame, pd.Index]:
+    """Collapse edges the way nx.DiGraph would and order them like G.edges().
+
+    A DiGraph keeps one edge per (compound1, compound2): the attributes of the
+    last row win, but the edge keeps the position of its first occurrence.
+    With ``multi_edges`` the parallel reactions are aggregated instead (see
+    ``aggregate_parallel_edges``).  Edges are iterated grouped by source node,
+    in node insertion order.
+
+    Returns
+    -------
+    Unique edges in networkx iteration order, and every compound in node
+    insertion order (its position is the node code).
+    """
+    keys = ["compound1", "compound2"]
+    if multi_edges:
+        edges = aggregate_parallel_edges(edges_df, keys)
+        edges["_first_seen"] = np.arange(len(edges))
+    else:
+        edges = edges_df.reset_index(drop=True)
+        edges = edges.assign(_first_seen=edges.groupby(keys, sort=False, dropna=False).ngroup())
+        edges = edges.drop_duplicates(subset=keys, keep="last")
+
+    # node insertion order: node table first, then endpoints only found in edges
+    endpoints = edges_df[keys].to_numpy().ravel()
+    node_order = pd.Index(pd.unique(np.concatenate([nodes_df["compound"].to_numpy(), endpoints])))
+    edges["_source_rank"] = node_order.get_indexer(edges["compound1"])
+
+    edges = edges.sort_values(["_source_rank", "_first_seen"], kind="stable")
+    edges = edges.drop(columns=["_first_seen", "_source_rank"]).reset_index(drop=True)
+    return edges, node_order
+
+
+@dataclass
+class GraphTables:
+    """Column-oriented graph: node attributes and edges addressed by integer codes.
+
+    ``source``/``target`` hold the node code of each edge endpoint and
+    ``origin_codes`` the categorical code of each node's origin (-1 when
+    missing), so every pattern filter is a vectorized lookup.
+    """
+    edges: pd.DataFrame
+    node_ids: np.ndarray
+    node_table: pd.DataFrame
+    source: np.ndarray
+    target: np.ndarray
+    origins: pd.Index
+    origin_codes: np.ndarray
+
+    @classmethod
+    def from_frames(cls, nodes_df: pd.DataFrame, edges_df: pd.DataFrame, multi_edges: bool = False) -> "GraphTables":
+        """Build the tables from the node/edge CSV dataframes.
+
+        With ``multi_edges`` parallel reactions are aggregated per compound
+        pair rather than overwritten.
+        """
+        edges, node_order = prepare_edges(nodes_df, edges_df, multi_edges=multi_edges)
+
+        # duplicated node rows keep their last attributes, matching G.add_node updates;
+        # compounds only found in the edge table get NA attributes
+        nodes = nodes_df.drop_duplicates(subset="compound", keep="last").set_index("compound")
+        node_table = nodes.reindex(node_order).reset_index(drop=True)
+
+        origin_cat = pd.Categorical(node_table["origin"])
+        return cls(
+            edges=edges,
+            node_ids=node_order.to_numpy(),
+            node_table=node_table,
+            source=node_order.get_indexer(edges["compound1"]),
+            target=node_order.get_indexer(edges["compound2"]),
+            origins=pd.Index(origin_cat.categories),
+            origin_codes=np.asarray(origin_cat.codes, dtype=np.int64),
+        )
+
+    def codes_for(self, origins: Sequence[str]) -> np.ndarray:
+        """Categorical codes of the given origins; origins absent from the graph are dropped."""
+        codes = self.origins.get_indexer(list(origins))
+        return codes[codes >= 0]
+
+    def hop_mask(self, source_origins: Sequence[str], target_origins: Sequence[str]) -> np.ndarray:
+        """Boolean mask of edges whose endpoint origins fall in the given sets."""
+        return (np.isin(self.origin_codes[self.source], self.codes_for(source_origins))
+                & np.isin(self.origin_codes[self.target], self.codes_for(target_origins)))
+
+    def node_count(self, origins: Sequence[str]) -> int:
+        """Number of compounds whose origin is in the given set."""
+        return int(np.isin(self.origin_codes, self.codes_for(origins)).sum())
+
+    def origin_pair_counts(self) -> np.ndarray:
+        """Histogram of edges per (source origin, target origin) code pair."""
+        n = len(self.origins) + 1  # last row/column collects missing origins
+        src = np.where(self.origin_codes[self.source] < 0, n - 1, self.origin_codes[self.source])
+        dst = np.where(self.origin_codes[self.target] < 0, n - 1, self.origin_codes[self.target])
+        return np.bincount(src * n + dst, minlength=n * n).reshape(n, n)
+
+
+# ---------------------------------------------------------------------------
+# Planning
+# ---------------------------------------------------------------------------
+
+@dataclass
+class JoinPlan:
+    """Compiled pattern: per-hop origin filters and the order hops are joined in.
+
+    ``order`` starts with the hop the join begins from; every later hop is
+    adjacent to the hops already joined, so each step extends the partial
+    paths by one edge on the left or the right.
+    """
+    positions: Tuple[Tuple[str, ...], ...]
+    order: List[int]
+    estimates: List[int] = field(default_factory=list)
+
+    @property
+    def hops(self) -> List[Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+        return [(self.positions[h], self.positions[h + 1]) for h in range(len(self.positions) - 1)]
+
+
+def estimate_hop_sizes(graph: GraphTables, positions: Tuple[Tuple[str, ...], ...]) -> List[int]:
+    """Number of edges passing each hop's origin filter, read off the origin-pair histogram."""
+    counts = graph.origin_pair_counts()
+    sizes = []
+    for h in range(len(positions) - 1):
+        src = graph.codes_for(positions[h])
+        dst = graph.codes_for(positions[h + 1])
+        sizes.append(int(counts[np.ix_(src, dst)].sum()))
+    return sizes
+
+
+def plan_pattern(graph: GraphTables, spec: str) -> JoinPlan:
+    """Compile a pattern spec into a join plan.
+
+    The plan starts from the most selective hop and greedily extends to the
+    neighbouring hop with the smallest estimated join output, using the usual
+    ``|A| * |B| / distinct join keys`` estimate.
+    """
+    positions = parse_pattern(spec)
+    sizes = estimate_hop_sizes(graph, positions)
+    n_hops = len(sizes)
+
+    start = int(np.argmin(sizes))
+    order = [start]
+    lo, hi = start, start
+    partial = sizes[start]
+    while len(order) < n_hops:
+        candidates = []
+        if lo > 0:
+            keys = max(graph.node_count(positions[lo]), 1)
+            candidates.append((partial * sizes[lo - 1] / keys, lo - 1))
+        if hi < n_hops - 1:
+            keys = max(graph.node_count(positions[hi + 1]), 1)
+            candidates.append((partial * sizes[hi + 1] / keys, hi + 1))
+        estimate, hop = min(candidates)
+        order.append(hop)
+        lo, hi = min(lo, hop), max(hi, hop)
+        partial = estimate
+
+    return JoinPlan(positions=positions, order=order, estimates=sizes)
+
+
+# ---------------------------------------------------------------------------
+# Execution
+# ---------------------------------------------------------------------------
+
+def sort_keys(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Stable sort order of a key array and the sorted keys, for ``join_sorted``."""
+    order = np.argsort(keys, kind="stable")
+    return order, keys[order]
+
+
+def join_on_keys(left_keys: np.ndarray, right_keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Equi-join two integer key arrays using sorted keys and searchsorted.
+
+    Returns index pairs (i, j) with left_keys[i] == right_keys[j], ordered by
+    i and then by j.
+    """
+    return join_sorted(left_keys, *sort_keys(right_keys))
+
+
+def join_sorted(left_keys: np.ndarray, order: np.ndarray, sorted_keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """``join_on_keys`` against a right side already sorted with ``sort_keys``.
+
+    Only ``left_keys`` is searched, so joining many small left sides against
+    the same right side does not re-sort it.
+    """
+    lo = np.searchsorted(sorted_keys, left_keys, side="left")
+    hi = np.searchsorted(sorted_keys, left_keys, side="right")
+    counts = hi - lo
+
+    i = np.repeat(np.arange(len(left_keys)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    j = order[np.repeat(lo, counts) + offsets]
+    return i, j
+
+
+def _reduce_hops(graph: GraphTables, hop_edges: List[np.ndarray]) -> List[np.ndarray]:
+    """Semi-join pass: drop hop edges whose shared compound has no partner in a neighbouring hop."""
+    for h in range(1, len(hop_edges)):
+        keep = np.isin(graph.source[hop_edges[h]], graph.target[hop_edges[h - 1]])
+        hop_edges[h] = hop_edges[h][keep]
+    for h in range(len(hop_edges) - 2, -1, -1):
+        keep = np.isin(graph.target[hop_edges[h]], graph.source[hop_edges[h + 1]])
+        hop_edges[h] = hop_edges[h][keep]
+    return hop_edges
+
+
+def filter_hops(graph: GraphTables, plan: JoinPlan) -> List[np.ndarray]:
+    """Edge indices passing each hop's origin filter, after semi-join reduction."""
+    hop_edges = [np.flatnonzero(graph.hop_mask(src, dst)) for src, dst in plan.hops]
+    return _reduce_hops(graph, hop_edges)
+
+
+def execute_plan(
+    graph: GraphTables,
+    plan: JoinPlan,
+    hop_edges: Optional[List[np.ndarray]] = None,
+) -> np.ndarray:
+    """Run a join plan and return matched paths as edge indices.
+
+    ``hop_edges`` can pass pre-filtered (e.g. partitioned) hop edge sets; by
+    default they are computed with ``filter_hops``.
+
+    Returns
+    -------
+    Integer array of shape (n_paths, n_hops); column h is the row of
+    ``graph.edges`` used for hop h.  Rows are in nested-loop order.
+    """
+    if hop_edges is None:
+        hop_edges = filter_hops(graph, plan)
+
+    start = plan.order[0]
+    paths = hop_edges[start][:, None]
+    lo, hi = start, start
+    for hop in plan.order[1:]:
+        if hop == hi + 1:
+            i, j = join_on_keys(graph.target[paths[:, -1]], graph.source[hop_edges[hop]])
+            paths = np.column_stack([paths[i], hop_edges[hop][j]])
+            hi = hop
+        else:
+            i, j = join_on_keys(graph.source[paths[:, 0]], graph.target[hop_edges[hop]])
+            paths = np.column_stack([hop_edges[hop][j], paths[i]])
+            lo = hop
+
+    # canonical order: lexicographic by edge position, i.e. the nested networkx loop
+    return paths[np.lexsort(paths[:, ::-1].T)] if len(paths) else paths
+
+
+def _check_lengths(specs: Sequence[str]) -> None:
+    lengths = {len(parse_pattern(spec)) for spec in specs}
+    if len(lengths) != 1:
+        raise ValueError(f"All patterns in one query must have the same length. Got: {list(specs)}")
+
+
+def match_patterns(graph: GraphTables, specs: Sequence[str]) -> np.ndarray:
+    """Union of the paths matched by several specs of the same length, in nested-loop order."""
+    _check_lengths(specs)
+    paths = [execute_plan(graph, plan_pattern(graph, spec)) for spec in specs]
+    if len(paths) == 1:
+        return paths[0]
+    return np.unique(np.vstack(paths), axis=0)
+
+
+def count_completions(graph: GraphTables, hop_edges: List[np.ndarray]) -> np.ndarray:
+    """Number of matching paths that start with each first-hop edge.
+
+    Counts are propagated backwards hop by hop with ``np.bincount`` so no path
+    is built.  Returned values line up with ``hop_edges[0]``.
+    """
+    n_nodes = len(graph.node_ids)
+    completions = np.ones(len(hop_edges[-1]))
+    for h in range(len(hop_edges) - 1, 0, -1):
+        per_node = np.bincount(graph.source[hop_edges[h]], weights=completions, minlength=n_nodes)
+        completions = per_node[graph.target[hop_edges[h - 1]]]
+    return completions
+
+
+@dataclass
+class PathBlocks:
+    """A query split into blocks of consecutive first-hop edges.
+
+    Edges are grouped by source compound, so each block covers a run of
+    source compounds (a hub whose paths exceed the block size is split over
+    several blocks).  Block ``i`` spans first-hop edges ``bounds[i]`` up to
+    ``bounds[i + 1]``; the blocks' paths concatenated in order are exactly
+    the ``match_patterns`` result.  ``keys`` holds, per spec, the
+    ``sort_keys`` of every later hop's source compounds, so blocks only
+    search them.
+    """
+    plans: List[JoinPlan]
+    hops: List[List[np.ndarray]]
+    keys: List[List[Tuple[np.ndarray, np.ndarray]]]
+    bounds: np.ndarray
+    chunk_size: int
+
+    def __len__(self) -> int:
+        return max(len(self.bounds) - 1, 0)
+
+
+def path_blocks(graph: GraphTables, specs: Sequence[str], chunk_size: int, min_blocks: int = 1) -> PathBlocks:
+    """Split a query into blocks of about ``chunk_size`` paths each.
+
+    Block sizes come from ``count_completions``, so no path is built here.
+    ``min_blocks`` shrinks the blocks so at least that many are made when
+    there are enough paths (used to spread work over several processes).
+    A single first-hop edge with more than ``chunk_size`` paths is its own
+    block; its paths are still handed out ``chunk_size`` at a time (``split_paths``).
+
+    The hops are filtered and reduced once here; blocks only restrict hop 0.
+    """
+    _check_lengths(specs)
+    plans = [plan_pattern(graph, spec) for spec in specs]
+    hops = [filter_hops(graph, plan) for plan in plans]
+    keys = [[sort_keys(graph.source[edges]) for edges in h[1:]] for h in hops]
+
+    firsts = np.concatenate([h[0] for h in hops])
+    weights = np.concatenate([count_completions(graph, h) for h in hops])
+    order = np.argsort(firsts, kind="stable")
+    firsts, weights = firsts[order], weights[order]
+    if len(firsts) == 0:
+        return PathBlocks(plans, hops, keys, np.empty(0, dtype=np.int64), chunk_size)
+
+    size = max(min(chunk_size, int(np.ceil(weights.sum() / max(min_blocks, 1)))), 1)
+
+    # cut at the first-hop edge where the running total passes each multiple of size
+    block_ids = np.floor_divide(np.cumsum(weights) - weights, size)
+    starts = firsts[np.flatnonzero(np.r_[True, np.diff(block_ids) > 0])]
+    return PathBlocks(plans, hops, keys, np.r_[starts, firsts[-1] + 1], chunk_size)
+
+
+def block_paths(graph: GraphTables, blocks: PathBlocks, i: int) -> np.ndarray:
+    """Paths of block ``i``, in nested-loop order.
+
+    The block's first-hop edges are joined forwards hop by hop.  The hops
+    were fully reduced in ``path_blocks``, so every partial path completes
+    and the work is proportional to the block's paths, not to the graph.
+    """
+    lo, hi = blocks.bounds[i], blocks.bounds[i + 1]
+    chunk = []
+    for hop_edges, hop_keys in zip(blocks.hops, blocks.keys):
+        paths = hop_edges[0][np.searchsorted(hop_edges[0], lo):np.searchsorted(hop_edges[0], hi)][:, None]
+        for edges, (order, sorted_keys) in zip(hop_edges[1:], hop_keys):
+            # rows stay in nested-loop order: by partial path, then by edge position
+            left, right = join_sorted(graph.target[paths[:, -1]], order, sorted_keys)
+            paths = np.column_stack([paths[left], edges[right]])
+        chunk.append(paths)
+    return chunk[0] if len(chunk) == 1 else np.unique(np.vstack(chunk), axis=0)
+
+
+def split_paths(paths: np.ndarray, chunk_size: int) -> Iterator[np.ndarray]:
+    """Consecutive slices of at most ``chunk_size`` paths (none for no paths)."""
+    for start in range(0, len(paths), max(chunk_size, 1)):
+        yield paths[start:start + chunk_size]
+
+
+def iter_paths(graph: GraphTables, specs: Sequence[str], chunk_size: int) -> Iterator[np.ndarray]:
+    """Yield the paths of ``match_patterns`` in consecutive chunks of at most ``chunk_size``.
+
+    Chunks come from one ``path_blocks`` block at a time, so only one block
+    of edge indices is in memory; empty blocks are skipped.
+    """
+    blocks = path_blocks(graph, specs, chunk_size)
+    for i in range(len(blocks)):
+        yield from split_paths(block_paths(graph, blocks, i), chunk_size)
+
+
+def path_nodes(graph: GraphTables, paths: np.ndarray) -> np.ndarray:
+    """Node codes along each path, shape (n_paths, n_hops + 1)."""
+    return np.column_stack([graph.source[paths], graph.target[paths[:, -1]]])
+
+
+def result_columns(
+    n_hops: int,
+    node_attrs: Sequence[str],
+    edge_attrs: Sequence[str],
+    edge_prefixes: Optional[Sequence[str]] = None,
+    pattern_column: bool = False,
+) -> List[str]:
+    """Column names of the wide results table for paths with ``n_hops`` edges.
+
+    ``pattern_column`` appends ``PATTERN_COLUMN``.
+    """
+    if edge_prefixes is None:
+        edge_prefixes = [f"edge{h + 1}_" for h in range(n_hops)]
+    columns = []
+    for p in range(n_hops + 1):
+        columns += [f"compound{p + 1}_id"] + [f"compound{p + 1}_{a}" for a in node_attrs]
+        if p < n_hops:
+            columns += [f"{edge_prefixes[p]}{a}" for a in edge_attrs]
+    if pattern_column:
+        columns.append(PATTERN_COLUMN)
+    return columns
+
+
+def path_pattern_keys(graph: GraphTables, paths: np.ndarray, keys: Sequence[str]) -> pd.Categorical:
+    """Pattern key of each path (e.g. ``diet_microbe_host``) as a categorical with categories ``keys``.
+
+    Paths are grouped by their tuple of origin codes, so each distinct origin
+    tuple is turned into a key once.  Keys not in ``keys`` become missing.
+    """
+    nodes = path_nodes(graph, paths)
+    n_origins = len(graph.origins) + 1  # last code stands for a missing origin
+    codes = np.where(graph.origin_codes[nodes] < 0, n_origins - 1, graph.origin_codes[nodes])
+    combined = np.zeros(len(paths), dtype=np.int64)
+    for p in range(codes.shape[1]):
+        combined = combined * n_origins + codes[:, p]
+    _, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+
+    origins = np.array(list(graph.origins) + [""], dtype=object)
+    shape_codes = pd.Index(list(keys)).get_indexer([pattern_key(origins[codes[i]]) for i in first])
+    return pd.Categorical.from_codes(shape_codes[inverse.reshape(-1)], categories=list(keys))
+
+
+def materialize(
+    graph: GraphTables,
+    paths: np.ndarray,
+    node_attrs: Sequence[str],
+    edge_attrs: Sequence[str],
+    edge_prefixes: Optional[Sequence[str]] = None,
+    pattern_keys: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """Build the wide results table: compound{p}_* and edge columns for every path.
+
+    ``edge_prefixes`` sets the column prefix of each hop's edge attributes;
+    it defaults to ``edge1_``, ``edge2_``, ...  With ``pattern_keys`` (e.g.
+    ``spec_keys(specs)``) every path is also tagged with its pattern key in a
+    categorical ``PATTERN_COLUMN``.
+    """
+    n_hops = paths.shape[1]
+    nodes = path_nodes(graph, paths)
+
+    columns: Dict[str, np.ndarray] = {}
+    for p in range(n_hops + 1):
+        codes = nodes[:, p]
+        columns[f"compound{p + 1}_id"] = graph.node_ids[codes]
+        for a in node_attrs:
+            columns[f"compound{p + 1}_{a}"] = graph.node_table[a].to_numpy()[codes]
+        if p < n_hops:
+            prefix = edge_prefixes[p] if edge_prefixes is not None else f"edge{p + 1}_"
+            for a in edge_attrs:
+                columns[f"{prefix}{a}"] = graph.edges[a].to_numpy()[paths[:, p]]
+    if pattern_keys is not None:
+        columns[PATTERN_COLUMN] = path_pattern_keys(graph, paths, pattern_keys)
+
+    return pd.DataFrame(columns, columns=result_columns(n_hops, node_attrs, edge_attrs, edge_prefixes,
+                                                        pattern_column=pattern_keys is not None))
+
+
+def matched_nodes(graph: GraphTables, specs: Sequence[str]) -> np.ndarray:
+    """Codes of the compounds on at least one path matched by ``specs``, in node order.
+
+    After semi-join reduction every remaining hop edge lies on a matching
+    path, so no path has to be built.
+    """
+    used = np.zeros(len(graph.node_ids), dtype=bool)
+    for spec in specs:
+        for hop_edges in filter_hops(graph, plan_pattern(graph, spec)):
+            used[graph.source[hop_edges]] = True
+            used[graph.target[hop_edges]] = True
+    return np.flatnonzero(used)
+
+
+def node_attributes(graph: GraphTables, codes: np.ndarray, node_attrs: Sequence[str]) -> pd.DataFrame:
+    """Node attribute table (compound_id and ``node_attrs``) for the given node codes."""
+    columns = {"compound_id": graph.node_ids[codes]}
+    for a in node_attrs:
+        columns[a] = graph.node_table[a].to_numpy()[codes]
+    return pd.DataFrame(columns, columns=["compound_id"] + list(node_attrs))
+
+
+# ---------------------------------------------------------------------------
+# Aggregate counts
+# ---------------------------------------------------------------------------
+
+def adjacency(graph: GraphTables, mask: Optional[np.ndarray] = None, weight: Optional[str] = None) -> sparse.csr_matrix:
+    """Sparse node × node adjacency of the (masked) edges.
+
+    Entries are 1, or the edge's ``weight`` column with missing values as 0.
+    """
+    if mask is None:
+        mask = np.ones(len(graph.edges), dtype=bool)
+    if weight is None:
+        values = np.ones(int(mask.sum()))
+    else:
+        values = pd.to_numeric(graph.edges[weight], errors="coerce").fillna(0).to_numpy(dtype=float)[mask]
+    n = len(graph.node_ids)
+    return sparse.csr_matrix((values, (graph.source[mask], graph.target[mask])), shape=(n, n))
+
+
+def _hop_weights(weights: Optional[Sequence[str]], n_hops: int) -> Optional[List[str]]:
+    if weights is None:
+        return None
+    weights = list(weights)
+    if len(weights) == 1:
+        return weights * n_hops
+    if len(weights) != n_hops:
+        raise ValueError(f"Give one weight column or one per hop ({n_hops}). Got: {weights}")
+    return weights
+
+
+def pair_counts(graph: GraphTables, spec: str, weights: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Number of matching paths between every (first, last) compound pair.
+
+    The origin-restricted adjacency matrices of the hops are multiplied, so
+    entry (u, v) of the product is the number of paths from u to v.  With
+    ``weights`` (one edge column, or one per hop) the weighted product is
+    also returned: the sum over paths of the product of their edge weights.
+
+    Returns
+    -------
+    DataFrame with compound1_id, compound{k}_id, n_paths and, when weighted,
+    weighted_sum; pairs are in node order.
+    """
+    positions = parse_pattern(spec)
+    n_hops = len(positions) - 1
+    hop_weights = _hop_weights(weights, n_hops)
+    masks = [graph.hop_mask(positions[h], positions[h + 1]) for h in range(n_hops)]
+
+    counts = adjacency(graph, masks[0])
+    for mask in masks[1:]:
+        counts = counts @ adjacency(graph, mask)
+    counts = counts.tocoo()
+
+    last = f"compound{n_hops + 1}_id"
+    df = pd.DataFrame({
+        "compound1_id": graph.node_ids[counts.row],
+        last: graph.node_ids[counts.col],
+        "n_paths": counts.data.astype(np.int64),
+        "_row": counts.row,
+        "_col": counts.col,
+    })
+
+    if hop_weights is not None:
+        weighted = adjacency(graph, masks[0], hop_weights[0])
+        for mask, weight in zip(masks[1:], hop_weights[1:]):
+            weighted = weighted @ adjacency(graph, mask, weight)
+        # align weighted sums to the count entries via sorted row * n + col keys
+        weighted = weighted.tocoo()
+        n = len(graph.node_ids)
+        keys = weighted.row.astype(np.int64) * n + weighted.col
+        order = np.argsort(keys)
+        keys, data = keys[order], weighted.data[order]
+        wanted = counts.row.astype(np.int64) * n + counts.col
+        sums = np.zeros(len(wanted))
+        if len(keys):
+            pos = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+            hit = keys[pos] == wanted
+            sums[hit] = data[pos[hit]]
+        df["weighted_sum"] = sums
+
+    df = df[df["n_paths"] > 0].sort_values(["_row", "_col"])
+    return df.drop(columns=["_row", "_col"]).reset_index(drop=True)
+
+
+def pattern_counts(graph: GraphTables, spec: str, weights: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Number of matching paths for every concrete origin tuple of a spec.
+
+    Each tuple is counted with sparse vector × matrix products: start from
+    the indicator of first-position compounds, multiply by the adjacency and
+    mask to the next origin at every hop, then sum.
+
+    Returns
+    -------
+    DataFrame with pattern (key), one origin column per position, n_paths
+    and, when weighted, weighted_sum; rows in spec expansion order.
+    """
+    positions = parse_pattern(spec)
+    n_hops = len(positions) - 1
+    hop_weights = _hop_weights(weights, n_hops)
+
+    counted_t = adjacency(graph).T.tocsr()
+    weighted_t = None
+    if hop_weights is not None:
+        weighted_t = [adjacency(graph, weight=w).T.tocsr() for w in hop_weights]
+
+    origin_of = {o: graph.origin_codes == code for code, o in enumerate(graph.origins)}
+    none = np.zeros(len(graph.node_ids), dtype=bool)
+
+    rows = []
+    for origins in expand_pattern(spec):
+        masks = [origin_of.get(o, none) for o in origins]
+        count = masks[0].astype(float)
+        for h in range(n_hops):
+            count = (counted_t @ count) * masks[h + 1]
+        row = {"pattern": pattern_key(origins)}
+        row.update({f"compound{p + 1}_origin": o for p, o in enumerate(origins)})
+        row["n_paths"] = int(round(count.sum()))
+        if weighted_t is not None:
+            total = masks[0].astype(float)
+            for h in range(n_hops):
+                total = (weighted_t[h] @ total) * masks[h + 1]
+            row["weighted_sum"] = float(total.sum())
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# ---------------------------------------------------------------------------
+# Ranked paths
+# ---------------------------------------------------------------------------
+
+_SCORE_COLUMN = re.compile(r"^(compound|edge)(\d+)_(\w+)$")
+
+
+def _hop_factors(graph: GraphTables, n_hops: int, score_columns: Sequence[str]) -> List[np.ndarray]:
+    """Per-edge score factor of every hop: the product of the score columns attached to it.
+
+    Score columns are named like result columns (``compound1_freq``,
+    ``edge2_h_abundance``).  Compound columns are attached to the hop leaving
+    the compound; the last compound's to the hop entering it.
+    """
+    factors = [np.ones(len(graph.edges)) for _ in range(n_hops)]
+    for column in score_columns:
+        match = _SCORE_COLUMN.match(column)
+        if match is None:
+            raise ValueError(f"Score column '{column}' should look like compound<p>_<attr> or edge<h>_<attr>.")
+        kind, pos, attr = match.group(1), int(match.group(2)) - 1, match.group(3)
+        if kind == "edge":
+            if not 0 <= pos < n_hops or attr not in graph.edges:
+                raise ValueError(f"Score column '{column}' is not an edge column of a {n_hops}-hop path.")
+            factors[pos] = factors[pos] * graph.edges[attr].to_numpy(dtype=float)
+        else:
+            if not 0 <= pos <= n_hops or attr not in graph.node_table:
+                raise ValueError(f"Score column '{column}' is not a compound column of a {n_hops}-hop path.")
+            values = graph.node_table[attr].to_numpy(dtype=float)
+            if pos < n_hops:
+                factors[pos] = factors[pos] * values[graph.source]
+            else:
+                factors[pos - 1] = factors[pos - 1] * values[graph.target]
+    return factors
+
+
+def top_paths(graph: GraphTables, spec: str, k: int, score_columns: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """The ``k`` highest scoring paths of a spec, without enumerating the others.
+
+    A path's score is the product of ``score_columns`` along it (see
+    ``_hop_factors``); factors must be non-negative and paths with a missing
+    factor are not ranked.  A backward max-product pass gives every edge the
+    best score of any path suffix starting with it, an exact upper bound.
+    Best-first search over partial paths keyed by that bound then yields
+    complete paths in score order: each pop pushes only the next-best
+    sibling and the best child, so about ``k × n_hops`` partial paths are
+    visited however many paths match.
+
+    Returns
+    -------
+    Paths as edge indices (shape (≤ k, n_hops)) and their scores, best
+    first; ties are in nested-loop order.
+    """
+    plan = plan_pattern(graph, spec)
+    n_hops = len(plan.positions) - 1
+    hop_edges = filter_hops(graph, plan)
+    factors = _hop_factors(graph, n_hops, score_columns)
+
+    for h in range(n_hops):
+        values = factors[h][hop_edges[h]]
+        if np.any(values < 0):
+            raise ValueError("Top-k search needs non-negative score columns.")
+        hop_edges[h] = hop_edges[h][~np.isnan(values)]
+    hop_edges = _reduce_hops(graph, hop_edges)
+
+    # best[h][i]: best score of a suffix starting with hop_edges[h][i]
+    n_nodes = len(graph.node_ids)
+    best: List[np.ndarray] = [np.empty(0)] * n_hops
+    node_best = np.ones(n_nodes)
+    for h in range(n_hops - 1, -1, -1):
+        best[h] = factors[h][hop_edges[h]] * node_best[graph.target[hop_edges[h]]]
+        node_best = np.zeros(n_nodes)
+        np.maximum.at(node_best, graph.source[hop_edges[h]], best[h])
+
+    # per hop, edges sorted by source, then bound (best first), then position
+    sorted_edges, sorted_best, segments = [], [], []
+    for h in range(n_hops):
+        src = graph.source[hop_edges[h]] if h > 0 else np.zeros(len(hop_edges[h]), dtype=np.int64)
+        order = np.lexsort((hop_edges[h], -best[h], src))
+        sorted_edges.append(hop_edges[h][order])
+        sorted_best.append(best[h][order])
+        segments.append(np.searchsorted(src[order], np.arange(n_nodes + 1)))
+
+    # heap entries: (-bound, edges so far, hop, position in sorted_edges[hop], segment end, prefix score)
+    heap = []
+    if len(sorted_edges[0]):
+        heap.append((-sorted_best[0][0], (int(sorted_edges[0][0]),), 0, 0, len(sorted_edges[0]), 1.0))
+    found = []
+    while heap and len(found) < k:
+        neg_bound, path, h, pos, end, prefix = heapq.heappop(heap)
+        if pos + 1 < end:
+            sibling = (int(sorted_edges[h][pos + 1]),)
+            heapq.heappush(heap, (-prefix * sorted_best[h][pos + 1], path[:-1] + sibling, h, pos + 1, end, prefix))
+        if h == n_hops - 1:
+            found.append(path)
+            continue
+        edge = path[-1]
+        step = prefix * factors[h][edge]
+        first, last = segments[h + 1][graph.target[edge]], segments[h + 1][graph.target[edge] + 1]
+        child = (int(sorted_edges[h + 1][first]),)
+        heapq.heappush(heap, (-step * sorted_best[h + 1][first], path + child, h + 1, first, last, step))
+
+    paths = np.array(found, dtype=np.int64).reshape(len(found), n_hops)
+    scores = np.ones(len(paths))
+    for h in range(n_hops):
+        scores = scores * factors[h][paths[:, h]]
+    order = np.lexsort(tuple(paths[:, ::-1].T) + (-scores,))
+    return paths[order], scores[order]
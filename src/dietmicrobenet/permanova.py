@@ -0,0 +1,310 @@
+"""PERMANOVA with the permutations evaluated in blocks.
+
+The pseudo-F statistic of a grouping only needs the within-group sum of
+squares::
+
+    s_W = 1/2 · Σ_g (1/n_g) · Σ_{i,j ∈ g} d_ij²
+
+With the squared distances ``D2`` computed once and a block of ``B``
+permutations encoded as 0/1 group indicator columns ``I`` (n × B·k), one
+matrix product ``D2 @ I`` gives every ``Σ_{i,j ∈ g} d_ij²`` of the block, so
+thousands of permutations cost a few BLAS calls instead of one pass over the
+distance matrix each.  The total sum of squares and the group sizes do not
+change under permutation.
+
+Permutations are drawn exactly like ``skbio.stats.distance.permanova``
+(``rng.permutation`` of the grouping codes, one per permutation, from
+``np.random.default_rng(seed)``), so for the same seed the same permutations
+are scored.  skbio counts a permuted pseudo-F only if its floating-point
+value is ``>=`` the observed one; here one within a relative ``_TIE_RTOL``
+of it also counts, so groupings whose pseudo-F equals the observed one are
+counted however their sums round.  The p-values are therefore skbio's
+unless some permutations tie the observed statistic (e.g. distances with
+few distinct values), where they can be larger than skbio's by the ties
+skbio's rounding drops.  The permutation orders for an integer seed are kept, up to
+``ORDERS_CACHE_BYTES``, so testing several metadata columns over the same
+samples draws them once per process.
+
+With ``early_stop`` the permutations run in batches of ``SEQUENTIAL_BATCH``
+and stop early, Besag–Clifford style, once ``exceedances`` permuted
+statistics reached the observed one (p = exceedances / permutations used;
+clearly not significant), or once the Clopper–Pearson interval of the
+p-value excludes ``alpha`` (clearly on one side of it).  The permutations
+used are the first ones a full run would use.
+
+:func:`permanova_many` runs independent tests (metadata columns × patterns)
+in a process pool.  By default each test is ``skbio.stats.distance.permanova``
+itself, so p-values are scikit-bio's to the last bit; ``engine="native"``
+scores them with :func:`permanova` instead (needed for ``early_stop``).
+Each test draws its permutations from the same integer seed, as a single
+call does, so the results do not depend on the number of workers.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from functools import partial
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy.stats import beta
+from skbio import DistanceMatrix
+from skbio.stats.distance import permanova as _skbio_permanova
+
+from dietmicrobenet.parallel import pool_context
+
+# Indicator entries (permutations × samples × groups) evaluated per block
+BLOCK_ENTRIES = 1 << 22
+
+# Relative tolerance for a permuted pseudo-F to count as ≥ the observed one;
+# the same grouping reached by another permutation must tie with it
+_TIE_RTOL = 1e-9
+
+# Early stopping: permutations between stopping checks, exceedances that stop
+# a test, and the confidence of the interval compared with alpha
+SEQUENTIAL_BATCH = 100
+EARLY_STOP_EXCEEDANCES = 20
+EARLY_STOP_CONFIDENCE = 0.99
+
+# Bytes of permutation orders kept for integer seeds, most recently used first
+ORDERS_CACHE_BYTES = 1 << 28
+
+# Engines of permanova_many: scikit-bio's permanova, or the block scoring here
+PERMANOVA_ENGINES = ("skbio", "native")
+
+SeedLike = Union[int, np.random.Generator, None]
+
+_orders_cache: "OrderedDict[Tuple[int, int, int], np.ndarray]" = OrderedDict()
+
+
+def _seeded_orders(n: int, permutations: int, seed: int) -> np.ndarray:
+    key = (n, permutations, seed)
+    orders = _orders_cache.get(key)
+    if orders is not None:
+        _orders_cache.move_to_end(key)
+        return orders
+    orders = _draw_orders(n, permutations, np.random.default_rng(seed))
+    orders.flags.writeable = False
+    if orders.nbytes <= ORDERS_CACHE_BYTES:
+        _orders_cache[key] = orders
+        # least recently used first out, until the kept orders fit the budget
+        while sum(kept.nbytes for kept in _orders_cache.values()) > ORDERS_CACHE_BYTES:
+            _orders_cache.popitem(last=False)
+    return orders
+
+
+def clear_orders_cache() -> None:
+    """Forget the permutation orders kept for integer seeds."""
+    _orders_cache.clear()
+
+
+def _draw_orders(n: int, permutations: int, rng: np.random.Generator) -> np.ndarray:
+    # the smallest integer type that holds a sample position
+    orders = np.empty((permutations, n), dtype=np.min_scalar_type(max(n - 1, 0)))
+    for i in range(permutations):
+        orders[i] = rng.permutation(n)
+    return orders
+
+
+def permutation_orders(n: int, permutations: int, seed: SeedLike = None) -> np.ndarray:
+    """Permutations × n sample orders, as skbio draws them for ``seed``.
+
+    ``rng.permutation(grouping)`` equals ``grouping[rng.permutation(n)]``
+    (both shuffle a length-n array with the same swaps), so the permuted
+    groupings are ``grouping[orders]``.
+    """
+    if isinstance(seed, (int, np.integer)):
+        return _seeded_orders(n, permutations, int(seed))
+    return _draw_orders(n, permutations, np.random.default_rng(seed))
+
+
+def within_sums(d2: np.ndarray, groupings: np.ndarray, group_sizes: np.ndarray) -> np.ndarray:
+    """s_W of every row of ``groupings`` (B × n integer group codes)."""
+    n_groups = len(group_sizes)
+    n_perms, n = groupings.shape
+    indicator = np.zeros((n, n_perms * n_groups))
+    columns = groupings.T + np.arange(n_perms)[None, :] * n_groups
+    np.put_along_axis(indicator, columns, 1.0, axis=1)
+    within = np.einsum("ij,ij->j", indicator, d2 @ indicator).reshape(n_perms, n_groups)
+    return 0.5 * (within / group_sizes).sum(axis=1)
+
+
+def pseudo_f(s_T: float, s_W: np.ndarray, n: int, n_groups: int) -> np.ndarray:
+    """Pseudo-F from the total and within-group sums of squares."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return ((s_T - s_W) / (n_groups - 1)) / (s_W / (n - n_groups))
+
+
+def _exceeds(d2: np.ndarray, codes: np.ndarray, orders: np.ndarray, group_sizes: np.ndarray,
+             s_T: float, stat: float) -> np.ndarray:
+    """Whether each permutation's pseudo-F is ≥ the observed one, scored in blocks."""
+    n, n_groups = len(codes), len(group_sizes)
+    block = max(1, BLOCK_ENTRIES // (n * n_groups))
+    hits = np.empty(len(orders), dtype=bool)
+    for start in range(0, len(orders), block):
+        stats = pseudo_f(s_T, within_sums(d2, codes[orders[start:start + block]], group_sizes), n, n_groups)
+        hits[start:start + block] = (stats >= stat) | np.isclose(stats, stat, rtol=_TIE_RTOL, atol=0)
+    return hits
+
+
+def interval_excludes(hits: int, used: int, alpha: float, confidence: float = EARLY_STOP_CONFIDENCE) -> bool:
+    """Whether the Clopper–Pearson interval of a p-value from ``hits`` of ``used`` permutations excludes ``alpha``."""
+    tail = (1.0 - confidence) / 2.0
+    lower = beta.ppf(tail, hits, used - hits + 1) if hits > 0 else 0.0
+    upper = beta.ppf(1.0 - tail, hits + 1, used - hits) if hits < used else 1.0
+    return upper < alpha or lower > alpha
+
+
+def _sequential_p_value(score, n: int, permutations: int, seed: SeedLike, exceedances: int,
+                        alpha: float, confidence: float) -> Tuple[float, int]:
+    """(p-value, permutations used) with Besag–Clifford and interval stopping."""
+    rng = np.random.default_rng(seed)
+    hits, used = 0, 0
+    while used < permutations:
+        batch = score(_draw_orders(n, min(SEQUENTIAL_BATCH, permutations - used), rng))
+        running = hits + np.cumsum(batch)
+        if running[-1] >= exceedances:
+            # stop at the permutation that reached the threshold, wherever it is in the batch
+            used += int(np.argmax(running >= exceedances)) + 1
+            return exceedances / used, used
+        hits, used = int(running[-1]), used + len(batch)
+        if interval_excludes(hits, used, alpha, confidence):
+            break
+    return (hits + 1) / (used + 1), used
+
+
+def permanova(
+    distances: np.ndarray,
+    grouping: Sequence,
+    permutations: int = 999,
+    seed: SeedLike = None,
+    early_stop: bool = False,
+    exceedances: int = EARLY_STOP_EXCEEDANCES,
+    alpha: float = 0.05,
+    confidence: float = EARLY_STOP_CONFIDENCE,
+) -> pd.Series:
+    """PERMANOVA of a square distance matrix; same result fields as skbio's.
+
+    Parameters
+    ----------
+    distances
+        Symmetric n × n distance matrix with a zero diagonal.
+    grouping
+        Group label of each sample, in matrix order.
+    permutations
+        Number of permutations (the most used with ``early_stop``); 0 skips
+        the test (p-value NaN).
+    seed
+        Integer seed or ``numpy.random.Generator`` for the permutations.
+    early_stop
+        Stop after ``exceedances`` permuted statistics ≥ the observed one, or
+        once the ``confidence`` interval of the p-value excludes ``alpha``.
+
+    Returns
+    -------
+    pandas.Series with ``test statistic`` (pseudo-F), ``p-value``, the
+    ``number of permutations`` used and the other fields of
+    ``skbio.stats.distance.permanova``.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    n = distances.shape[0]
+    if distances.shape != (n, n):
+        raise ValueError(f"Distance matrix must be square, got shape {distances.shape}.")
+    if len(grouping) != n:
+        raise ValueError("Grouping vector size must match the number of IDs in the distance matrix.")
+    if permutations < 0:
+        raise ValueError("Number of permutations must be greater than or equal to zero.")
+
+    labels, codes = np.unique(np.asarray(grouping), return_inverse=True)
+    codes = codes.ravel()
+    n_groups = len(labels)
+    if n_groups == n:
+        raise ValueError("All values in the grouping vector are unique; there are no within-group distances.")
+    if n_groups == 1:
+        raise ValueError("All values in the grouping vector are the same; there are no between-group distances.")
+
+    group_sizes = np.bincount(codes).astype(np.float64)
+    d2 = distances ** 2
+    s_T = d2.sum() / n / 2.0
+    stat = pseudo_f(s_T, within_sums(d2, codes[None, :], group_sizes), n, n_groups)[0]
+
+    def score(orders):
+        return _exceeds(d2, codes, orders, group_sizes, s_T, stat)
+
+    p_value, used = np.nan, permutations
+    if permutations > 0 and early_stop:
+        p_value, used = _sequential_p_value(score, n, permutations, seed, exceedances, alpha, confidence)
+    elif permutations > 0:
+        p_value = (int(score(permutation_orders(n, permutations, seed)).sum()) + 1) / (permutations + 1)
+
+    return pd.Series(
+        ["PERMANOVA", "pseudo-F", n, n_groups, stat, p_value, used],
+        index=["method name", "test statistic name", "sample size", "number of groups",
+               "test statistic", "p-value", "number of permutations"],
+        name="PERMANOVA results",
+    )
+
+
+def skbio_permanova(distances: np.ndarray, grouping: Sequence, permutations: int = 999,
+                    seed: SeedLike = None) -> pd.Series:
+    """``skbio.stats.distance.permanova`` of a square distance matrix, with the arguments of :func:`permanova`."""
+    distances = np.asarray(distances, dtype=np.float64)
+    ids = [str(i) for i in range(distances.shape[0])]
+    return _skbio_permanova(DistanceMatrix(distances, ids), np.asarray(grouping),
+                            permutations=permutations, seed=seed)
+
+
+_ENGINE_FUNCTIONS = {"skbio": skbio_permanova, "native": permanova}
+
+# Tests set by _init_tests, so workers get them once when the pool starts
+_worker_tests: List[Tuple[np.ndarray, np.ndarray]] = []
+
+
+def _init_tests(tests: List[Tuple[np.ndarray, np.ndarray]]) -> None:
+    _worker_tests[:] = tests
+
+
+def _run_test(test: Tuple[np.ndarray, np.ndarray], engine: str, options: dict) -> pd.Series:
+    distances, grouping = test
+    return _ENGINE_FUNCTIONS[engine](distances, grouping, **options)
+
+
+def _run_worker_test(i: int, engine: str, options: dict) -> pd.Series:
+    return _run_test(_worker_tests[i], engine, options)
+
+
+def permanova_many(
+    tests: Sequence[Tuple[np.ndarray, Sequence]],
+    permutations: int = 999,
+    seed: Union[int, None] = None,
+    workers: int = 1,
+    engine: str = "skbio",
+    early_stop: bool = False,
+    **options,
+) -> List[pd.Series]:
+    """PERMANOVA of each (distances, grouping) test, ``workers`` at a time.
+
+    ``engine`` is ``"skbio"`` (``skbio.stats.distance.permanova``) or
+    ``"native"`` (:func:`permanova`); ``early_stop`` and the other
+    ``options`` of :func:`permanova` need the native engine.  Every test draws its permutations from ``seed`` exactly
+    as a single call would, so the results, returned in the order of
+    ``tests``, are the same for any number of workers.
+
+    The tests are handed to the workers once, when the pool starts (inherited
+    without pickling under ``fork``); tasks are only test numbers.
+    """
+    if engine not in PERMANOVA_ENGINES:
+        raise ValueError(f"Unknown PERMANOVA engine '{engine}'; expected one of {PERMANOVA_ENGINES}.")
+    if engine == "skbio" and (early_stop or options):
+        raise ValueError("early_stop and the other permanova options need the native PERMANOVA engine.")
+    if isinstance(seed, np.random.Generator):
+        raise TypeError("permanova_many needs an integer seed (or None) so every test can redraw the same permutations.")
+    tests = [(distances, np.asarray(grouping)) for distances, grouping in tests]
+    options = dict(options, permutations=permutations, seed=seed)
+    if engine == "native":
+        options["early_stop"] = early_stop
+    if workers <= 1 or len(tests) <= 1:
+        return [_run_test(test, engine, options) for test in tests]
+    run = partial(_run_worker_test, engine=engine, options=options)
+    with pool_context().Pool(min(workers, len(tests)), initializer=_init_tests, initargs=(tests,)) as pool:
+        return pool.map(run, range(len(tests)), chunksize=1)
@@ -0,0 +1,286 @@
+"""Chunked writers for pattern results.
+
+Results are written one chunk at a time so memory stays bounded by the chunk
+size rather than the number of matched paths.  CSV output is byte-identical
+to calling ``DataFrame.to_csv(path, index=False)`` on the concatenated
+chunks; Parquet output (``.parquet`` suffix) needs the optional ``pyarrow``
+package.
+
+Formatting CSV text is by far the slowest step of writing results, so a chunk
+can be encoded with :func:`encode_chunk` in another process and handed to
+:meth:`ResultWriter.write_encoded`.
+
+Compact results hold only ``compound{p}_id`` for each compound on a path; the
+compound attributes are written once to a node table next to the results
+(``node_table_path``).  :func:`read_results` joins them back, so readers see
+the same wide table either way.
+
+Readers that only need a few columns (the comparison scripts need the origin
+and KO columns) pass ``columns`` to :func:`read_results`; only those columns
+are parsed, optionally as categoricals, and :func:`load_results` reads many
+files concurrently.
+"""
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from dietmicrobenet.patterns import PATTERN_COLUMN
+
+# Default number of result rows held in memory before flushing to disk
+DEFAULT_CHUNK_SIZE = 500_000
+
+FORMATS = ("csv", "parquet")
+
+# Compact results keep node attributes in <stem>.nodes<suffix>
+NODE_TABLE_TAG = ".nodes"
+
+
+def infer_format(path: str) -> str:
+    """Output format from the file suffix: ``parquet`` for .parquet/.pq, otherwise ``csv``."""
+    return "parquet" if Path(path).suffix.lower() in (".parquet", ".pq") else "csv"
+
+
+def node_table_path(path: str) -> Path:
+    """Node attribute table written next to compact results, e.g. graph_results.nodes.csv."""
+    path = Path(path)
+    return path.with_name(f"{path.stem}{NODE_TABLE_TAG}{path.suffix}")
+
+
+def read_table(path: str, **kwargs) -> pd.DataFrame:
+    """Read a CSV or Parquet results file (by suffix); ``kwargs`` go to the pandas reader."""
+    if infer_format(str(path)) == "parquet":
+        return pd.read_parquet(path, **kwargs)
+    return pd.read_csv(path, **kwargs)
+
+
+def expand_node_attributes(df: pd.DataFrame, nodes: pd.DataFrame) -> pd.DataFrame:
+    """Join node attributes onto compact results.
+
+    Every ``compound{p}_id`` column gets ``compound{p}_<attr>`` columns for
+    the node table's attributes, placed right after it, which restores the
+    wide column layout.
+    """
+    nodes = nodes.drop_duplicates(subset="compound_id").set_index("compound_id")
+    columns = {}
+    for col in df.columns:
+        columns[col] = df[col]
+        if col.startswith("compound") and col.endswith("_id"):
+            prefix = col[:-len("id")]
+            for attr in nodes.columns:
+                columns[f"{prefix}{attr}"] = nodes[attr].reindex(df[col]).to_numpy()
+    return pd.DataFrame(columns, index=df.index)
+
+
+def _is_compact(columns: Sequence[str], path: str) -> bool:
+    """Whether results with these columns hold compound attributes in a node table next to ``path``."""
+    return "compound1_id" in columns and "compound1_origin" not in columns and node_table_path(path).exists()
+
+
+def _categorical_pattern(df: pd.DataFrame) -> pd.DataFrame:
+    if PATTERN_COLUMN in df.columns and not isinstance(df[PATTERN_COLUMN].dtype, pd.CategoricalDtype):
+        df[PATTERN_COLUMN] = df[PATTERN_COLUMN].astype("category")
+    return df
+
+
+def read_columns(path: str) -> List[str]:
+    """Column names of a CSV or Parquet file, without reading its rows."""
+    if infer_format(str(path)) == "parquet":
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(path).names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def _read_projected(path: str, columns: Sequence[str], categorical: Sequence[str]) -> pd.DataFrame:
+    """Only ``columns`` of a results file; requested columns it does not have are left out."""
+    header = read_columns(path)
+    wanted = list(dict.fromkeys(columns))
+    present = [c for c in header if c in wanted]
+    compact = _is_compact(header, path)
+
+    # compact files hold compound attributes in the node table, reached through compound{p}_id
+    node_attrs = {}
+    if compact:
+        for col in header:
+            if col.startswith("compound") and col.endswith("_id"):
+                prefix = col[:-len("id")]
+                attrs = [c[len(prefix):] for c in wanted if c.startswith(prefix) and c not in header]
+                if attrs:
+                    node_attrs[col] = attrs
+    read = [c for c in header if c in present or c in node_attrs]
+
+    if infer_format(str(path)) == "parquet":
+        df = pd.read_parquet(path, columns=read)
+    else:
+        dtype = {c: "category" for c in categorical if c in read}
+        df = pd.read_csv(path, usecols=read, dtype=dtype)
+
+    if node_attrs:
+        needed = sorted({a for attrs in node_attrs.values() for a in attrs})
+        node_cols = read_columns(node_table_path(path))
+        nodes = read_table(node_table_path(path), columns=["compound_id"] + [a for a in needed if a in node_cols])
+        df = expand_node_attributes(df, nodes)
+
+    df = df[[c for c in wanted if c in df.columns]]
+    for col in categorical:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return _categorical_pattern(df)
+
+
+def read_results(
+    path: str,
+    columns: Optional[Sequence[str]] = None,
+    categorical: Sequence[str] = (),
+) -> pd.DataFrame:
+    """Read a results file, joining its node table back on when it was written compact.
+
+    A pattern key column is returned as a categorical, as it was written.
+    With ``columns``, only those columns are read (columns the file does not
+    have are skipped), and the ``categorical`` ones are parsed straight into
+    categoricals, which keeps the repeated origin and KO strings small.
+    """
+    if columns is not None:
+        return _read_projected(path, columns, categorical)
+    df = _categorical_pattern(read_table(path))
+    if _is_compact(df.columns, path):
+        df = expand_node_attributes(df, read_table(node_table_path(path)))
+    return df
+
+
+def load_results(
+    paths: Iterable[str],
+    columns: Optional[Sequence[str]] = None,
+    categorical: Sequence[str] = (),
+    workers: int = 1,
+) -> Iterator[Tuple[pd.DataFrame, float]]:
+    """:func:`read_results` for many files, ``workers`` at a time.
+
+    Yields (dataframe, seconds spent loading it) in the order of ``paths``.
+    Files are read in threads: the CSV and Parquet readers do their parsing
+    without holding the GIL, and the frames need no copying between workers.
+    """
+    def load(path):
+        start = time.perf_counter()
+        df = read_results(path, columns, categorical)
+        return df, time.perf_counter() - start
+
+    if workers <= 1:
+        yield from map(load, paths)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(load, paths)
+
+
+def iter_results(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """:func:`read_results` in chunks of at most ``chunk_size`` rows."""
+    if infer_format(str(path)) == "parquet":
+        import pyarrow.parquet as pq
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size))
+    else:
+        chunks = pd.read_csv(path, chunksize=chunk_size)
+
+    nodes = None
+    for chunk in chunks:
+        if _is_compact(chunk.columns, path):
+            nodes = read_table(node_table_path(path)) if nodes is None else nodes
+            chunk = expand_node_attributes(chunk, nodes)
+        yield _categorical_pattern(chunk)
+
+
+def encode_chunk(df: pd.DataFrame, fmt: str) -> Tuple[int, Union[str, pd.DataFrame]]:
+    """Encode a chunk for ``ResultWriter.write_encoded``: (rows, payload).
+
+    The CSV payload is the chunk's text without header; Parquet chunks are
+    passed through and converted by the writer, which owns the schema.
+    """
+    if fmt == "csv":
+        return len(df), df.to_csv(None, header=False, index=False)
+    return len(df), df
+
+
+class ResultWriter:
+    """Append result chunks to a single CSV or Parquet file.
+
+    Use as a context manager; every chunk must have the same columns.  When no
+    chunk is written, ``columns`` is used to write an empty file with a header.
+    """
+
+    def __init__(self, path: str, fmt: Optional[str] = None, columns: Optional[List[str]] = None):
+        self.path = Path(path)
+        self.fmt = fmt or infer_format(path)
+        if self.fmt not in FORMATS:
+            raise ValueError(f"Unknown results format '{self.fmt}'. Choose from {FORMATS}.")
+        self.columns = list(columns) if columns is not None else None
+        self.rows = 0
+        self._handle = None
+        self._parquet = None
+        self._schema = None
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Append one chunk."""
+        if self.columns is None:
+            self.columns = list(df.columns)
+        elif list(df.columns) != self.columns:
+            raise ValueError(f"Chunk columns {list(df.columns)} differ from {self.columns}.")
+        self.write_encoded(encode_chunk(df, self.fmt))
+
+    def write_encoded(self, chunk: Tuple[int, Union[str, pd.DataFrame]]) -> None:
+        """Append one chunk from ``encode_chunk``; its columns must match ``columns``."""
+        rows, payload = chunk
+        if self.columns is None:
+            raise ValueError("Set columns before writing encoded chunks.")
+        if self.fmt == "csv":
+            if self._handle is None:
+                self._handle = open(self.path, "w", newline="")
+                pd.DataFrame(columns=self.columns).to_csv(self._handle, index=False)
+            self._handle.write(payload)
+        else:
+            self._write_parquet(payload)
+        self.rows += rows
+
+    def close(self) -> None:
+        """Flush and close the file, writing a header-only file when nothing was written."""
+        if self._handle is None and self._parquet is None:
+            empty = pd.DataFrame(columns=self.columns or [])
+            if self.fmt == "csv":
+                empty.to_csv(self.path, index=False)
+            else:
+                self._write_parquet(empty)
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+
+    def _write_parquet(self, df: pd.DataFrame) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Writing Parquet results requires pyarrow (pip install pyarrow).") from e
+
+        if self._schema is None:
+            # text columns are typed as strings up front so all-missing chunks keep the schema
+            fields = [
+                pa.field(col, pa.string()) if df[col].dtype == object
+                else pa.field(col, pa.dictionary(pa.int32(), pa.string()))
+                if isinstance(df[col].dtype, pd.CategoricalDtype)
+                else pa.field(col, pa.from_numpy_dtype(df[col].dtype))
+                for col in df.columns
+            ]
+            self._schema = pa.schema(fields)
+            self._parquet = pq.ParquetWriter(self.path, self._schema)
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        self._parquet.write_table(table)
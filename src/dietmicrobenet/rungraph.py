@@ -0,0 +1,151 @@
+"""Steps shared by run_graph.py and host_run_graph.py.
+
+Both scripts read the same node and edge CSVs, optionally through a graph
+snapshot, stream the matched paths of the join or SQLite engine to a results
+file and can add that file to a cohort store.  They only differ in their
+default patterns and result columns: the microbe results use unprefixed edge
+columns for single-hop patterns, the host results carry a pattern column.
+Those are passed in as ``edge_prefixes`` and ``pattern_column``.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from dietmicrobenet import cohort, parallel, patterns, snapshot, sqlstore
+from dietmicrobenet.patterns import GraphTables
+from dietmicrobenet.results import DEFAULT_CHUNK_SIZE, ResultWriter, node_table_path
+
+
+# ------------------------------------------------------
+# Inputs
+# ------------------------------------------------------
+
+def load_csvs(nodes_csv: str, edges_csv: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Read the node and edge CSVs."""
+    print("📄 Loading CSV files...")
+    nodes_df = pd.read_csv(nodes_csv)
+    edges_df = pd.read_csv(edges_csv)
+    print(f" → Loaded {len(nodes_df)} nodes and {len(edges_df)} edges")
+    return nodes_df, edges_df
+
+
+def load_snapshot(nodes_csv: str, edges_csv: str, multi_edges: bool = False) -> GraphTables:
+    """Graph from its cached snapshot, parsing the CSVs (and caching them) only on the first run."""
+    print("📄 Loading graph snapshot...")
+    graph, cached = snapshot.load_graph(nodes_csv, edges_csv, multi_edges=multi_edges)
+    state = "Loaded" if cached else "Built and cached"
+    print(f" → {state} graph with {len(graph.node_ids)} nodes and {len(graph.edges)} edges")
+    return graph
+
+
+# ------------------------------------------------------
+# Join engine
+# ------------------------------------------------------
+
+def write_graph_patterns(
+    graph: GraphTables,
+    output: str,
+    specs: Sequence[str],
+    node_attrs: List[str],
+    edge_attrs: List[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    fmt: Optional[str] = None,
+    workers: int = 1,
+    compact: bool = False,
+    edge_prefixes: Optional[List[str]] = None,
+    pattern_column: bool = False,
+) -> int:
+    """Run the pattern queries on a built graph and stream the matches to disk in chunks.
+
+    With workers > 1, blocks of first-hop edges (grouped by source compound)
+    are joined and rendered in a process pool; the file is the same.
+
+    With compact, rows only hold compound IDs and the compound attributes are
+    written once to a node table next to the output (see results.read_results).
+
+    Returns:
+        int: number of matching rows written
+    """
+    n_hops = len(patterns.parse_pattern(specs[0])) - 1
+    row_node_attrs = [] if compact else node_attrs
+    columns = patterns.result_columns(n_hops, row_node_attrs, edge_attrs, edge_prefixes=edge_prefixes,
+                                      pattern_column=pattern_column)
+    pattern_keys = patterns.spec_keys(specs) if pattern_column else None
+    with ResultWriter(output, fmt=fmt, columns=columns) as writer:
+        parallel.write_paths(graph, specs, writer, row_node_attrs, edge_attrs, edge_prefixes, chunk_size, workers,
+                             pattern_keys=pattern_keys)
+    if compact:
+        write_node_table(graph, specs, output, node_attrs, fmt)
+    return writer.rows
+
+
+def write_node_table(graph: GraphTables, specs: Sequence[str], output: str, node_attrs: List[str],
+                     fmt: Optional[str] = None) -> None:
+    """Write the attributes of every compound on a matching path next to the output."""
+    nodes = patterns.node_attributes(graph, patterns.matched_nodes(graph, specs), node_attrs)
+    with ResultWriter(node_table_path(output), fmt=fmt, columns=list(nodes.columns)) as writer:
+        writer.write(nodes)
+
+
+# ------------------------------------------------------
+# SQLite engine
+# ------------------------------------------------------
+
+def sqlite_patterns(
+    nodes_csv: str,
+    edges_csv: str,
+    output: str,
+    specs: Sequence[str],
+    node_attrs: List[str],
+    edge_attrs: List[str],
+    db: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    fmt: Optional[str] = None,
+    edge_prefixes: Optional[List[str]] = None,
+    pattern_column: bool = False,
+) -> int:
+    """Run the pattern queries as indexed SQL joins in an on-disk SQLite database.
+
+    The CSVs are streamed into the database (default: next to the edge CSV,
+    with a .sqlite suffix) unless it already holds the same CSV contents, so
+    neither the graph nor the results need to fit in memory.
+
+    Returns:
+        int: number of matching rows written, same file as write_graph_patterns
+    """
+    db = db or str(Path(edges_csv).with_suffix(".sqlite"))
+    print(f"📄 Opening SQLite database {db}...")
+    conn, reused = sqlstore.open_database(db, nodes_csv, edges_csv)
+    print(f" → {'Reused' if reused else 'Loaded'} graph with "
+          f"{conn.execute('SELECT COUNT(*) FROM nodes').fetchone()[0]} nodes and "
+          f"{conn.execute('SELECT COUNT(*) FROM edges').fetchone()[0]} edges")
+
+    columns = patterns.result_columns(len(patterns.parse_pattern(specs[0])) - 1, node_attrs, edge_attrs,
+                                      edge_prefixes=edge_prefixes, pattern_column=pattern_column)
+    pattern_keys = patterns.spec_keys(specs) if pattern_column else None
+    try:
+        with ResultWriter(output, fmt=fmt, columns=columns) as writer:
+            for chunk in sqlstore.iter_patterns(conn, specs, node_attrs, edge_attrs, edge_prefixes, chunk_size,
+                                                pattern_keys=pattern_keys):
+                writer.write(chunk)
+    finally:
+        conn.close()
+    return writer.rows
+
+
+# ------------------------------------------------------
+# Cohort store
+# ------------------------------------------------------
+
+def append_to_cohort(cohort_dir: str, sample: str, output: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Add the results file to the cohort store, partitioned by sample and pattern.
+
+    Returns:
+        int: number of rows stored
+    """
+    n_stored = cohort.append_results(cohort_dir, sample, output, chunk_size=chunk_size)
+    print(f"\n🗂️  Stored {n_stored} rows for sample '{sample}' in cohort {cohort_dir}")
+    return n_stored
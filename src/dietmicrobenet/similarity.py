@@ -0,0 +1,105 @@
+"""Jaccard similarity between many KO sets at once.
+
+Samples are encoded as a binary sample × KO sparse matrix ``X`` (CSR).  One
+sparse product ``X @ X.T`` gives every pairwise intersection size, and the
+union sizes follow from the row sums::
+
+    |A ∩ B| = (X Xᵀ)[a, b]        |A ∪ B| = |A| + |B| − |A ∩ B|
+
+so the whole matrix is computed in compiled code instead of one Python set
+operation per pair.  When most samples share a good part of the KOs the
+product has few zeros, and a dense BLAS product of the 0/1 matrix is much
+faster than a sparse one; it is used above ``DENSE_DENSITY``.
+
+Two empty sets have similarity 1.0, as in ``GraphComparison.jaccard``.
+"""
+from __future__ import annotations
+
+from typing import Dict, Hashable, Iterable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Fraction of non-zero sample × KO entries above which intersections use a dense product
+DENSE_DENSITY = 0.01
+
+# float32 holds integer counts exactly up to 2**24 KOs per sample
+_EXACT_FLOAT32 = 2 ** 24
+
+
+def incidence_matrix(ko_sets: Sequence[Iterable[str]]) -> Tuple[sparse.csr_matrix, pd.Index]:
+    """Binary sample × KO CSR matrix (repeated KOs count once) and the KO of each column."""
+    ko_lists: List[list] = [list(kos) for kos in ko_sets]
+    rows = np.repeat(np.arange(len(ko_lists)), [len(kos) for kos in ko_lists])
+    items = np.array([ko for kos in ko_lists for ko in kos], dtype=object)
+    codes, kos = pd.factorize(items)
+    X = sparse.csr_matrix((np.ones(len(codes), dtype=np.int64), (rows, codes)), shape=(len(ko_lists), len(kos)))
+    X.data[:] = 1  # duplicates were summed when the matrix was built
+    return X, pd.Index(kos)
+
+
+def jaccard_cross(X: sparse.spmatrix, Y: sparse.spmatrix) -> np.ndarray:
+    """Dense Jaccard similarity between every row of ``X`` and every row of ``Y`` (same KO columns)."""
+    X = sparse.csr_matrix(X, dtype=np.int64)
+    Y = X if Y is X else sparse.csr_matrix(Y, dtype=np.int64)
+    x_sizes = np.asarray(X.sum(axis=1)).ravel()
+    y_sizes = x_sizes if Y is X else np.asarray(Y.sum(axis=1)).ravel()
+    density = (X.nnz + Y.nnz) / max((X.shape[0] + Y.shape[0]) * X.shape[1], 1)
+    if density > DENSE_DENSITY and X.shape[1] < _EXACT_FLOAT32:
+        x_dense = X.toarray().astype(np.float32)
+        y_dense = x_dense if Y is X else Y.toarray().astype(np.float32)
+        intersections = np.rint(x_dense @ y_dense.T).astype(np.int64)
+    else:
+        intersections = (X @ Y.T).toarray()
+    unions = x_sizes[:, None] + y_sizes[None, :] - intersections
+    similarity = np.ones(unions.shape, dtype=float)
+    np.divide(intersections, unions, out=similarity, where=unions > 0)
+    return similarity
+
+
+def jaccard_matrix(X: sparse.spmatrix) -> np.ndarray:
+    """Dense square Jaccard similarity matrix between the rows of a binary matrix."""
+    X = sparse.csr_matrix(X, dtype=np.int64)
+    return jaccard_cross(X, X)
+
+
+def jaccard_similarity(ko_sets: Sequence[Iterable[str]]) -> np.ndarray:
+    """Pairwise Jaccard similarity of KO sets, in the given order."""
+    X, _ = incidence_matrix(ko_sets)
+    return jaccard_matrix(X)
+
+
+def subset_matrix(matrix: np.ndarray, labels: Sequence[str], keep: Sequence[str]) -> np.ndarray:
+    """Rows and columns of ``matrix`` for the ``keep`` labels, in that order."""
+    position = {label: i for i, label in enumerate(labels)}
+    idx = np.array([position[label] for label in keep], dtype=np.int64)
+    return matrix[np.ix_(idx, idx)]
+
+
+class SimilarityCache:
+    """Similarity matrices of one run, each computed once.
+
+    Entries are keyed by the caller's name for the KO sets (pattern, edge)
+    together with the ordered sample names, so a different sample set is a
+    different entry.  Matrices for fewer samples (e.g. PERMANOVA groups) are
+    sliced from a cached matrix with :func:`subset_matrix` instead of being
+    recomputed.
+    """
+
+    def __init__(self):
+        self._matrices: Dict[Tuple[Hashable, Tuple[str, ...]], np.ndarray] = {}
+        self.computed = 0
+
+    def put(self, key: Hashable, matrix: np.ndarray, labels: Sequence[str]) -> None:
+        """Use a matrix computed elsewhere (e.g. read from a comparison store) for ``key`` and ``labels``."""
+        self._matrices[(key, tuple(labels))] = matrix
+
+    def matrix(self, key: Hashable, pattern_kos: Dict[str, Iterable[str]]) -> Tuple[np.ndarray, List[str]]:
+        """Jaccard similarity matrix of ``pattern_kos`` and its labels (the sample names, in order)."""
+        labels = list(pattern_kos.keys())
+        entry = (key, tuple(labels))
+        if entry not in self._matrices:
+            self._matrices[entry] = jaccard_similarity([pattern_kos[name] for name in labels])
+            self.computed += 1
+        return self._matrices[entry], labels
@@ -0,0 +1,189 @@
+"""Binary snapshots of pattern graphs, cached next to the node/edge CSVs.
+
+Building a :class:`~dietmicrobenet.patterns.GraphTables` means parsing both
+CSVs and collapsing the edges; a snapshot stores the result so later runs on
+the same inputs skip all of that.  A snapshot is an uncompressed ``.npz``
+holding
+
+* the CSR adjacency (``indptr`` per source node, ``indices`` = edge targets;
+  edges are already grouped by source, so CSR order is edge order),
+* the compound ID dictionary (node code → compound) and origin categories,
+* every node and edge attribute column.
+
+Text columns are dictionary encoded: integer codes (-1 for missing) plus the
+distinct strings packed into one UTF-8 buffer with offsets, so loading is a
+buffer decode and a slice per distinct value, not a CSV parse.  No pickled
+objects are stored.
+
+Snapshots are keyed by a SHA-256 of the CSV contents, so editing either CSV
+(or switching ``multi_edges``) simply produces a new snapshot.
+"""
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from dietmicrobenet.patterns import GraphTables
+
+# Bump when the layout changes so old snapshots are rebuilt rather than misread
+SNAPSHOT_VERSION = 1
+
+_SUFFIX = ".npz"
+_READ_BLOCK = 1 << 20
+
+
+# ---------------------------------------------------------------------------
+# Cache keys
+# ---------------------------------------------------------------------------
+
+def input_digest(nodes_csv: str, edges_csv: str, multi_edges: bool = False) -> str:
+    """SHA-256 over both CSVs' bytes, the edge mode and the snapshot version."""
+    digest = hashlib.sha256(f"v{SNAPSHOT_VERSION};multi_edges={bool(multi_edges)};".encode())
+    for path in (nodes_csv, edges_csv):
+        digest.update(b"\0")
+        with open(path, "rb") as fh:
+            for block in iter(lambda: fh.read(_READ_BLOCK), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _prefix(edges_csv: str, multi_edges: bool) -> str:
+    return f"{Path(edges_csv).stem}.{'multigraph' if multi_edges else 'graph'}-"
+
+
+def snapshot_path(nodes_csv: str, edges_csv: str, multi_edges: bool = False) -> Path:
+    """Snapshot location next to the edge CSV, e.g. ``edges.graph-<hash>.npz``."""
+    key = input_digest(nodes_csv, edges_csv, multi_edges)[:16]
+    return Path(edges_csv).with_name(f"{_prefix(edges_csv, multi_edges)}{key}{_SUFFIX}")
+
+
+# ---------------------------------------------------------------------------
+# Column encoding
+# ---------------------------------------------------------------------------
+
+def _encode_column(arrays: Dict[str, np.ndarray], name: str, values: pd.Series) -> None:
+    """Store one attribute column under ``name``: numeric as-is, anything else dictionary encoded."""
+    if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+        arrays[f"{name}/values"] = values.to_numpy()
+        return
+    codes, uniques = pd.factorize(values.where(values.isna(), values.astype(str)), use_na_sentinel=True)
+    text = [str(u) for u in uniques]
+    lengths = np.fromiter((len(t) for t in text), dtype=np.int64, count=len(text))
+    arrays[f"{name}/codes"] = codes.astype(np.int64)
+    arrays[f"{name}/offsets"] = np.concatenate([[0], np.cumsum(lengths)])
+    arrays[f"{name}/text"] = np.frombuffer("".join(text).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_column(data, name: str) -> np.ndarray:
+    if f"{name}/values" in data:
+        return data[f"{name}/values"]
+    codes = data[f"{name}/codes"]
+    offsets = data[f"{name}/offsets"]
+    text = data[f"{name}/text"].tobytes().decode("utf-8")
+    uniques = np.empty(len(offsets), dtype=object)  # last slot stands for missing values
+    uniques[:-1] = [text[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+    uniques[-1] = np.nan
+    return uniques[np.where(codes < 0, len(offsets) - 1, codes)]
+
+
+# ---------------------------------------------------------------------------
+# Save / load
+# ---------------------------------------------------------------------------
+
+def save_snapshot(graph: GraphTables, path: str) -> None:
+    """Write ``graph`` as an uncompressed ``.npz`` snapshot."""
+    n_nodes = len(graph.node_ids)
+    if np.any(np.diff(graph.source) < 0):
+        raise ValueError("Edges must be grouped by source node to be stored as CSR.")
+
+    arrays: Dict[str, np.ndarray] = {
+        "version": np.array(SNAPSHOT_VERSION),
+        "indptr": np.concatenate([[0], np.cumsum(np.bincount(graph.source, minlength=n_nodes))]).astype(np.int64),
+        "indices": graph.target.astype(np.int64),
+        "origin_codes": graph.origin_codes,
+        "node_columns": np.array(list(graph.node_table.columns), dtype=str),
+        "edge_columns": np.array(list(graph.edges.columns), dtype=str),
+    }
+    _encode_column(arrays, "node_ids", pd.Series(graph.node_ids))
+    _encode_column(arrays, "origins", pd.Series(graph.origins, dtype=object))
+    for col in graph.node_table.columns:
+        _encode_column(arrays, f"node:{col}", graph.node_table[col])
+    for col in graph.edges.columns:
+        if col not in ("compound1", "compound2"):  # rebuilt from the adjacency
+            _encode_column(arrays, f"edge:{col}", graph.edges[col])
+
+    # write under a temporary name so an interrupted run never leaves a truncated snapshot
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as fh:
+        np.savez(fh, **arrays)
+    tmp.replace(path)
+
+
+def load_snapshot(path: str) -> GraphTables:
+    """Read a snapshot written by :func:`save_snapshot`.
+
+    Raises
+    ------
+    ValueError
+        When the snapshot was written by a different layout version.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        version = int(data["version"])
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot {path} has version {version}, expected {SNAPSHOT_VERSION}.")
+
+        indptr = data["indptr"]
+        target = data["indices"]
+        source = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        node_ids = _decode_column(data, "node_ids")
+
+        node_table = pd.DataFrame({col: _decode_column(data, f"node:{col}") for col in data["node_columns"]},
+                                  columns=list(data["node_columns"]))
+        edges = {}
+        for col in data["edge_columns"]:
+            if col == "compound1":
+                edges[col] = node_ids[source]
+            elif col == "compound2":
+                edges[col] = node_ids[target]
+            else:
+                edges[col] = _decode_column(data, f"edge:{col}")
+
+        return GraphTables(
+            edges=pd.DataFrame(edges, columns=list(data["edge_columns"])),
+            node_ids=node_ids,
+            node_table=node_table,
+            source=source,
+            target=target,
+            origins=pd.Index(_decode_column(data, "origins")),
+            origin_codes=data["origin_codes"],
+        )
+
+
+def load_graph(nodes_csv: str, edges_csv: str, multi_edges: bool = False) -> Tuple[GraphTables, bool]:
+    """Graph for the two CSVs, from its snapshot when one exists, otherwise parsed and snapshotted.
+
+    Older snapshots of the same edge CSV and edge mode are removed when a new
+    one is written.
+
+    Returns
+    -------
+    The graph and whether it came from an existing snapshot.
+    """
+    path = snapshot_path(nodes_csv, edges_csv, multi_edges)
+    if path.exists():
+        try:
+            return load_snapshot(path), True
+        except ValueError:
+            pass  # written by another layout version; rebuild below
+
+    graph = GraphTables.from_frames(pd.read_csv(nodes_csv), pd.read_csv(edges_csv), multi_edges=multi_edges)
+    for stale in path.parent.glob(f"{_prefix(edges_csv, multi_edges)}*{_SUFFIX}"):
+        if stale != path:
+            stale.unlink()
+    save_snapshot(graph, path)
+    return graph, False
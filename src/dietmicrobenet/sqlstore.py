@@ -0,0 +1,224 @@
+"""Embedded SQLite backend for pattern queries.
+
+The node and edge CSVs are bulk-loaded into an on-disk SQLite database in
+batched transactions (the CSVs are streamed, never held in memory), indexed
+on ``origin`` and ``(compound1, compound2)``, and patterns are run as indexed
+SQL joins.  Results stream out of the cursor in chunks, so graphs larger than
+memory can be queried without an external database server.
+
+The loaded graph follows ``nx.DiGraph`` semantics like the other engines:
+one edge per (compound1, compound2) with the attributes of its last row but
+the position of its first, and compounds numbered in insertion order (node
+table first, then compounds only found in edges).  Queries return the same
+columns and rows, in the same order, as
+:func:`dietmicrobenet.patterns.materialize` on the matched paths.
+
+A database remembers the SHA-256 of the CSVs it was loaded from
+(:func:`dietmicrobenet.snapshot.input_digest`), so reopening it for the same
+inputs skips the load.
+"""
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from dietmicrobenet.patterns import PATTERN_COLUMN, parse_pattern, result_columns
+from dietmicrobenet.snapshot import input_digest
+
+# Rows inserted per transaction while loading
+DEFAULT_BATCH_SIZE = 50_000
+
+_KEYS = ("compound1", "compound2")
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _records(df: pd.DataFrame) -> Iterator[tuple]:
+    """Rows as tuples of Python values with missing values as None."""
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+# ---------------------------------------------------------------------------
+# Loading
+# ---------------------------------------------------------------------------
+
+def _create_tables(conn: sqlite3.Connection, node_columns: List[str], edge_columns: List[str]) -> None:
+    # attribute columns are untyped so values keep the type pandas read them with
+    node_attrs = "".join(f", {_quote(c)}" for c in node_columns if c != "compound")
+    edge_attrs = "".join(f", {_quote(c)}" for c in edge_columns if c not in _KEYS)
+    conn.executescript(f"""
+        DROP TABLE IF EXISTS nodes;
+        DROP TABLE IF EXISTS edges;
+        CREATE TABLE nodes (pos INTEGER PRIMARY KEY, compound TEXT NOT NULL UNIQUE{node_attrs});
+        CREATE TABLE edges (pos INTEGER PRIMARY KEY, compound1 TEXT NOT NULL, compound2 TEXT NOT NULL{edge_attrs},
+                            UNIQUE (compound1, compound2));
+    """)
+
+
+def _upsert(table: str, keys: Sequence[str], columns: List[str]) -> str:
+    """Insert that keeps a duplicate key's first position but takes its latest attributes."""
+    names = ", ".join(_quote(c) for c in columns)
+    values = ", ".join("?" for _ in columns)
+    updates = [f"{_quote(c)} = excluded.{_quote(c)}" for c in columns if c not in keys]
+    conflict = f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+    keys = ", ".join(_quote(k) for k in keys)
+    return f"INSERT INTO {table} ({names}) VALUES ({values}) ON CONFLICT ({keys}) {conflict}"
+
+
+def _normalize_numbers(conn: sqlite3.Connection, table: str, columns: List[str]) -> None:
+    """Store integers as REAL in columns that also hold REAL or missing values.
+
+    CSV chunks are typed one at a time, so a column read whole as float
+    (e.g. integers with gaps) can arrive partly as integers.
+    """
+    for col in columns:
+        q = _quote(col)
+        mixed = conn.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {table} WHERE typeof({q}) IN ('real', 'null'))"
+            f" AND EXISTS (SELECT 1 FROM {table} WHERE typeof({q}) = 'integer')"
+        ).fetchone()[0]
+        if mixed:
+            conn.execute(f"UPDATE {table} SET {q} = CAST({q} AS REAL) WHERE typeof({q}) = 'integer'")
+
+
+def load_csvs(conn: sqlite3.Connection, nodes_csv: str, edges_csv: str, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+    """(Re)create the nodes and edges tables from the CSVs, one transaction per batch of rows."""
+    node_columns = list(pd.read_csv(nodes_csv, nrows=0).columns)
+    edge_columns = list(pd.read_csv(edges_csv, nrows=0).columns)
+    _create_tables(conn, node_columns, edge_columns)
+
+    insert_node = _upsert("nodes", ["compound"], node_columns)
+    for chunk in pd.read_csv(nodes_csv, chunksize=batch_size):
+        with conn:
+            conn.executemany(insert_node, _records(chunk))
+
+    insert_edge = _upsert("edges", _KEYS, edge_columns)
+    insert_endpoint = "INSERT INTO nodes (compound) VALUES (?) ON CONFLICT (compound) DO NOTHING"
+    for chunk in pd.read_csv(edges_csv, chunksize=batch_size):
+        with conn:
+            # compounds only found in edges are added in edge order, after the node table
+            endpoints = chunk[list(_KEYS)].to_numpy().ravel()
+            conn.executemany(insert_endpoint, ((c,) for c in pd.unique(endpoints)))
+            conn.executemany(insert_edge, _records(chunk))
+
+    with conn:
+        _normalize_numbers(conn, "nodes", [c for c in node_columns if c != "compound"])
+        _normalize_numbers(conn, "edges", [c for c in edge_columns if c not in _KEYS])
+        conn.execute("CREATE INDEX IF NOT EXISTS nodes_origin ON nodes (origin)")
+        conn.execute("ANALYZE")
+
+
+def open_database(path: str, nodes_csv: str, edges_csv: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Tuple[sqlite3.Connection, bool]:
+    """Open (or create) the database at ``path`` holding the graph of the two CSVs.
+
+    The CSVs are only loaded when the database is new or was built from
+    different CSV contents.
+
+    Returns
+    -------
+    The connection and whether an existing load was reused.
+    """
+    digest = input_digest(nodes_csv, edges_csv)
+    conn = sqlite3.connect(str(Path(path)))
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    row = conn.execute("SELECT value FROM meta WHERE key = 'input_digest'").fetchone()
+    if row is not None and row[0] == digest:
+        return conn, True
+
+    load_csvs(conn, nodes_csv, edges_csv, batch_size)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('input_digest', ?)", (digest,))
+    return conn, False
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+def pattern_sql(
+    specs: Sequence[str],
+    node_attrs: Sequence[str],
+    edge_attrs: Sequence[str],
+    edge_prefixes: Optional[Sequence[str]] = None,
+    pattern_column: bool = False,
+) -> Tuple[str, List[str]]:
+    """SQL (and its parameters) returning the paths matched by any of ``specs``.
+
+    Hop h joins ``edges e{h}`` on the previous hop's target; position p
+    joins ``nodes n{p}``.  Every spec is a conjunction of ``origin IN (...)``
+    tests and the specs are OR-ed, so a path matched by several specs is
+    returned once.  Rows come in nested-loop order: by first compound, then
+    by each hop's edge position.  ``pattern_column`` adds the path's pattern
+    key (its origins joined by ``_``).
+    """
+    all_positions = [parse_pattern(spec) for spec in specs]
+    if len({len(p) for p in all_positions}) != 1:
+        raise ValueError(f"All patterns in one query must have the same length. Got: {list(specs)}")
+    n_hops = len(all_positions[0]) - 1
+    columns = result_columns(n_hops, node_attrs, edge_attrs, edge_prefixes, pattern_column)
+    if edge_prefixes is None:
+        edge_prefixes = [f"edge{h + 1}_" for h in range(n_hops)]
+
+    select = []
+    for p in range(n_hops + 1):
+        select.append(f"n{p}.compound")
+        select += [f"n{p}.{_quote(a)}" for a in node_attrs]
+        if p < n_hops:
+            select += [f"e{p}.{_quote(a)}" for a in edge_attrs]
+    if pattern_column:
+        select.append(" || '_' || ".join(f"n{p}.origin" for p in range(n_hops + 1)))
+    select = [f"{expr} AS {_quote(name)}" for expr, name in zip(select, columns)]
+
+    joins = ["edges e0", "JOIN nodes n0 ON n0.compound = e0.compound1", "JOIN nodes n1 ON n1.compound = e0.compound2"]
+    for h in range(1, n_hops):
+        joins.append(f"JOIN edges e{h} ON e{h}.compound1 = e{h - 1}.compound2")
+        joins.append(f"JOIN nodes n{h + 1} ON n{h + 1}.compound = e{h}.compound2")
+
+    params: List[str] = []
+    alternatives = []
+    for positions in all_positions:
+        tests = []
+        for p, origins in enumerate(positions):
+            tests.append(f"n{p}.origin IN ({', '.join('?' for _ in origins)})")
+            params += list(origins)
+        alternatives.append("(" + " AND ".join(tests) + ")")
+
+    order = ["n0.pos"] + [f"e{h}.pos" for h in range(n_hops)]
+    sql = (f"SELECT {', '.join(select)}\nFROM {' '.join(joins)}\n"
+           f"WHERE {' OR '.join(alternatives)}\nORDER BY {', '.join(order)}")
+    return sql, params
+
+
+def iter_patterns(
+    conn: sqlite3.Connection,
+    specs: Sequence[str],
+    node_attrs: Sequence[str],
+    edge_attrs: Sequence[str],
+    edge_prefixes: Optional[Sequence[str]] = None,
+    chunk_size: int = DEFAULT_BATCH_SIZE,
+    pattern_keys: Optional[Sequence[str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """Run the pattern query and yield the results in chunks of ``chunk_size`` rows.
+
+    With ``pattern_keys`` the chunks carry a categorical ``PATTERN_COLUMN``
+    with those categories, as :func:`dietmicrobenet.patterns.materialize`.
+    """
+    sql, params = pattern_sql(specs, node_attrs, edge_attrs, edge_prefixes, pattern_keys is not None)
+    cursor = conn.execute(sql, params)
+    columns = [d[0] for d in cursor.description]
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        chunk = pd.DataFrame.from_records(rows, columns=columns)
+        if pattern_keys is not None:
+            chunk[PATTERN_COLUMN] = pd.Categorical(chunk[PATTERN_COLUMN], categories=list(pattern_keys))
+        yield chunk
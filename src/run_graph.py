@@ -6,6 +6,19 @@ import networkx as nx
 from tqdm import tqdm
 import argparse as arg
 
+from dietmicrobenet import patterns, rungraph
+from dietmicrobenet.results import DEFAULT_CHUNK_SIZE, FORMATS, ResultWriter
+from dietmicrobenet.rungraph import append_to_cohort, load_csvs, load_snapshot
+
+
+# origin patterns reported by the queries (see dietmicrobenet.patterns for the syntax)
+PATTERNS = patterns.MICROBE_PATTERNS
+
+NODE_ATTRS = ["origin", "assoc_food", "freq"]
+EDGE_ATTRS = ["reaction", "KOs", "organisms", "abundance"]
+
+RESULT_COLUMNS = patterns.result_columns(1, NODE_ATTRS, EDGE_ATTRS, edge_prefixes=[""])
+
 
 # ------------------------------------------------------
 # Pattern query helper
@@ -32,23 +45,89 @@ def append_result(results, c1, n1, c2, n2, edge):
 
 
 # ------------------------------------------------------
-# Main
+# Join engine
 # ------------------------------------------------------
 
-def main():
-    parser = arg.ArgumentParser(description="In-memory graph builder + pattern queries")
-    parser.add_argument('--n', required=True, help='Node CSV file')
-    parser.add_argument('--e', required=True, help='Edge CSV file')
-    parser.add_argument('--o', required=True, help='Output CSV file')
-    args = parser.parse_args()
+def frame_patterns(nodes_df, edges_df, specs=PATTERNS, multi_edges=False):
+    """Run the pattern queries on the node/edge tables without building a graph.
+
+    Single-hop specs give the 12 result columns; longer specs get edge1_,
+    edge2_, ... prefixed edge columns.
 
-    # Load CSVs
-    print("📄 Loading CSV files...")
-    nodes_df = pd.read_csv(args.n)
-    edges_df = pd.read_csv(args.e)
-    print(f" → Loaded {len(nodes_df)} nodes and {len(edges_df)} edges")
+    Returns:
+        pandas df: matching relationships, same rows and order as networkx_patterns
+    """
+    graph = patterns.GraphTables.from_frames(nodes_df, edges_df, multi_edges=multi_edges)
+    paths = patterns.match_patterns(graph, specs)
+    return patterns.materialize(graph, paths, NODE_ATTRS, EDGE_ATTRS, edge_prefixes=_edge_prefixes(specs))
+
+
+def write_patterns(nodes_df, edges_df, output, specs=PATTERNS, chunk_size=DEFAULT_CHUNK_SIZE, fmt=None,
+                   multi_edges=False, workers=1, compact=False):
+    """Run the pattern queries and stream the matches to disk in chunks.
+
+    Only one chunk of result rows is held in memory; the file is the same as
+    writing frame_patterns(...) in one go.
+
+    Returns:
+        int: number of matching relationships written
+    """
+    graph = patterns.GraphTables.from_frames(nodes_df, edges_df, multi_edges=multi_edges)
+    return write_graph_patterns(graph, output, specs, chunk_size=chunk_size, fmt=fmt, workers=workers,
+                                compact=compact)
+
+
+def write_graph_patterns(graph, output, specs=PATTERNS, chunk_size=DEFAULT_CHUNK_SIZE, fmt=None, workers=1,
+                         compact=False):
+    """write_patterns for an already built graph (e.g. loaded from a snapshot).
+
+    See rungraph.write_graph_patterns for workers and compact.
+
+    Returns:
+        int: number of matching relationships written
+    """
+    return rungraph.write_graph_patterns(graph, output, specs, NODE_ATTRS, EDGE_ATTRS, chunk_size=chunk_size,
+                                         fmt=fmt, workers=workers, compact=compact,
+                                         edge_prefixes=_edge_prefixes(specs))
+
+
+def _edge_prefixes(specs):
+    """Unprefixed edge columns for single-hop specs, edge1_, edge2_, ... otherwise."""
+    return [""] if len(patterns.parse_pattern(specs[0])) == 2 else None
+
+
+# ------------------------------------------------------
+# SQLite engine
+# ------------------------------------------------------
+
+def sqlite_patterns(nodes_csv, edges_csv, output, db=None, specs=PATTERNS, chunk_size=DEFAULT_CHUNK_SIZE, fmt=None):
+    """Run the pattern queries as indexed SQL joins in an on-disk SQLite database.
+
+    See rungraph.sqlite_patterns.
+
+    Returns:
+        int: number of matching rows written, same file as write_patterns
+    """
+    return rungraph.sqlite_patterns(nodes_csv, edges_csv, output, specs, NODE_ATTRS, EDGE_ATTRS, db=db,
+                                    chunk_size=chunk_size, fmt=fmt, edge_prefixes=_edge_prefixes(specs))
+
+
+# ------------------------------------------------------
+# networkx engine
+# ------------------------------------------------------
+
+def networkx_patterns(nodes_df, edges_df, specs=PATTERNS):
+    """Build the graph in memory and run the pattern queries edge by edge.
+
+    Only single-hop specs (two positions) are supported.
+
+    Returns:
+        pandas df: matching relationships
+    """
+    allowed = {origins for spec in specs for origins in patterns.expand_pattern(spec)}
+    if any(len(origins) != 2 for origins in allowed):
+        raise ValueError("The networkx engine only runs single-hop patterns; use the join or sqlite engine.")
 
-    # Create a directed graph
     print("\n🔧 Building graph in memory...")
     G = nx.DiGraph()
 
@@ -85,25 +164,85 @@ def main():
         n1 = G.nodes[c1]
         n2 = G.nodes[c2]
 
-        # 1. food → microbe
-        if n1["origin"] == "food" and n2["origin"] == "microbe":
+        if (n1["origin"], n2["origin"]) in allowed:
             append_result(results, c1, n1, c2, n2, edge)
 
-        # 2. food → both
-        if n1["origin"] == "food" and n2["origin"] == "both":
-            append_result(results, c1, n1, c2, n2, edge)
+    return pd.DataFrame(results, columns=RESULT_COLUMNS)
 
-        # 3. both → both
-        if n1["origin"] == "both" and n2["origin"] == "both":
-            append_result(results, c1, n1, c2, n2, edge)
 
-    # Convert to DataFrame
-    df = pd.DataFrame(results)
-    print(f"\n📊 Found {len(df)} matching relationships.")
+# ------------------------------------------------------
+# Main
+# ------------------------------------------------------
+
+def main():
+    parser = arg.ArgumentParser(description="In-memory graph builder + pattern queries")
+    parser.add_argument('--n', required=True, help='Node CSV file')
+    parser.add_argument('--e', required=True, help='Edge CSV file')
+    parser.add_argument('--o', required=True, help='Output CSV file')
+    parser.add_argument('--engine', choices=['join', 'networkx', 'sqlite'], default='join',
+                        help='Pattern engine: vectorized edge joins (default), networkx graph or '
+                             'indexed SQL joins in an on-disk SQLite database')
+    parser.add_argument('--pattern', action='append', default=None,
+                        help='Origin pattern to query, e.g. "food -> microbe|both" (repeatable, default: food/both patterns)')
+    parser.add_argument('--chunk_size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Result rows held in memory before they are written out; the join engine '
+                             'also holds the edge indices of one block of paths, which is larger only '
+                             'when one first-hop edge starts more paths than this')
+    parser.add_argument('--format', choices=FORMATS, default=None,
+                        help='Output format (default: from the --o suffix, .parquet or CSV)')
+    parser.add_argument('--multi_edges', action='store_true',
+                        help='Keep every reaction between a compound pair: reactions, KOs and organisms are '
+                             'pooled and abundances summed per pair (default: last reaction per pair, as networkx)')
+    parser.add_argument('--compact', action='store_true',
+                        help='Write compound IDs only in the results plus one node attribute table '
+                             '(<output>.nodes.<ext>) instead of repeating compound attributes on every row')
+    parser.add_argument('--db', default=None,
+                        help='SQLite database for --engine sqlite (default: the edge CSV path with a .sqlite suffix)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes used by the join engine to find and write matching paths '
+                             '(output is the same for any number)')
+    parser.add_argument('--cohort', default=None,
+                        help='Also store the results in this cohort directory (Parquet partitioned by sample and '
+                             'pattern) for the graph comparison scripts; needs --sample')
+    parser.add_argument('--sample', default=None,
+                        help='Sample name the results are stored under in --cohort')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Cache the parsed graph as a binary snapshot next to the edge CSV and reuse it '
+                             'on later runs with the same CSV contents')
+    args = parser.parse_args()
 
-    # Save output
-    df.to_csv(args.o, index=False)
+    specs = args.pattern or PATTERNS
+
+    if args.cohort and not args.sample:
+        parser.error("--cohort needs --sample")
+    if args.engine != 'join' and (args.multi_edges or args.snapshot or args.compact):
+        parser.error("--multi_edges, --snapshot and --compact need the join engine")
+    if args.engine != 'join' and args.workers > 1:
+        parser.error("--workers needs the join engine")
+    if args.engine == 'networkx' and any(len(patterns.parse_pattern(spec)) > 2 for spec in specs):
+        parser.error("--engine networkx only runs single-hop patterns; use the join or sqlite engine")
+
+    if args.engine == 'sqlite':
+        n_found = sqlite_patterns(args.n, args.e, args.o, args.db, specs, chunk_size=args.chunk_size, fmt=args.format)
+    elif args.engine == 'networkx':
+        nodes_df, edges_df = load_csvs(args.n, args.e)
+        df = networkx_patterns(nodes_df, edges_df, specs)
+        with ResultWriter(args.o, fmt=args.format, columns=RESULT_COLUMNS) as writer:
+            writer.write(df)
+        n_found = len(df)
+    else:
+        if args.snapshot:
+            graph = load_snapshot(args.n, args.e, args.multi_edges)
+        else:
+            nodes_df, edges_df = load_csvs(args.n, args.e)
+            graph = patterns.GraphTables.from_frames(nodes_df, edges_df, multi_edges=args.multi_edges)
+        print("\n🔍 Running pattern queries...")
+        n_found = write_graph_patterns(graph, args.o, specs, chunk_size=args.chunk_size, fmt=args.format,
+                                       workers=args.workers, compact=args.compact)
+    print(f"\n📊 Found {n_found} matching relationships.")
     print(f"\n💾 Saved results to: {args.o}")
+    if args.cohort:
+        append_to_cohort(args.cohort, args.sample, args.o, chunk_size=args.chunk_size)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import run_graph as rg
+import GraphComparison as gc
+from Host import host_run_graph as hrg
+from dietmicrobenet import cohort
+
+
+def random_tables(seed, origins, n_nodes=150, n_edges=1500, host=False):
+    """Random node/edge tables; host tables get microbe and host abundances."""
+    rng = np.random.default_rng(seed)
+    compounds = [f'C{i:05d}' for i in range(n_nodes)]
+    nodes = pd.DataFrame({
+        'compound': compounds,
+        'origin': rng.choice(origins, size=n_nodes),
+        'assoc_food': rng.choice(["['apple']", "['pear']", None], size=n_nodes),
+        'freq': rng.integers(0, 100, size=n_nodes).astype(float),
+    })
+    edges = pd.DataFrame({
+        'compound1': rng.choice(compounds, size=n_edges),
+        'compound2': rng.choice(compounds, size=n_edges),
+        'reaction': [f'rn{i}' for i in range(n_edges)],
+        'KOs': [f"['K{i % 300:05d}']" for i in range(n_edges)],
+        'organisms': rng.choice(['org1', 'org2'], size=n_edges),
+    })
+    if host:
+        edges['m_abundance'] = rng.random(n_edges)
+        edges['h_abundance'] = rng.random(n_edges)
+    else:
+        edges['abundance'] = rng.random(n_edges)
+    return nodes, edges
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+        self.root = os.path.join(self.tmp, 'cohort')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write_samples(self, names, compact=False):
+        paths = []
+        for seed, name in enumerate(names):
+            nodes, edges = random_tables(seed, ['food', 'microbe', 'both'])
+            path = os.path.join(self.tmp, f'sample{seed}.csv')
+            rg.write_patterns(nodes, edges, path, chunk_size=100, compact=compact)
+            self.assertEqual(cohort.append_results(self.root, name, path, chunk_size=100),
+                             len(pd.read_csv(path)))
+            paths.append(path)
+        return paths
+
+    def test_partitions_by_sample_and_pattern(self):
+        self.write_samples(['s1', 'sample 2/b'])
+        self.assertEqual(cohort.stored_samples(self.root), ['s1', 'sample 2/b'])
+        self.assertEqual(cohort.stored_patterns(self.root), ['both_both', 'food_both', 'food_microbe'])
+
+    def test_pruned_read_matches_results_file(self):
+        names = ['s1', 's2', 's3']
+        paths = self.write_samples(names)
+        df = cohort.read_sample(self.root, 's2', patterns=['food_microbe'], columns=['KOs'])
+
+        full = pd.read_csv(paths[1])
+        expected = full[(full['compound1_origin'] == 'food') & (full['compound2_origin'] == 'microbe')]
+        self.assertEqual(list(df.columns), ['KOs', 'pattern'])
+        self.assertEqual(df['KOs'].tolist(), expected['KOs'].tolist())
+        self.assertEqual(set(df['pattern']), {'food_microbe'})
+
+    def test_comparison_subsets_match_file_subsets(self):
+        names = ['s1', 's2', 's3']
+        paths = self.write_samples(names)
+        from_files = gc.subset_graphs(gc.get_graphs(paths, names))
+        from_cohort = gc.cohort_subsets(self.root, names)
+        for files_dict, cohort_dict in zip(from_files, from_cohort):
+            self.assertEqual(gc.get_kos(cohort_dict), gc.get_kos(files_dict))
+
+    def test_missing_origins_match_file_subsets(self):
+        names = ['s1', 's2']
+        paths = []
+        for seed, name in enumerate(names):
+            nodes, edges = random_tables(seed, ['food', 'microbe', 'both'])
+            path = os.path.join(self.tmp, f'sample{seed}.csv')
+            rg.write_patterns(nodes, edges, path)
+            results = pd.read_csv(path)
+            results.loc[results.index[::3], 'compound1_origin'] = np.nan
+            results.loc[results.index[1::5], 'compound2_origin'] = np.nan
+            results.to_csv(path, index=False)
+            self.assertEqual(cohort.append_results(self.root, name, path), len(results))
+            paths.append(path)
+        self.assertIn(f'{cohort.MISSING_ORIGIN}_microbe', cohort.stored_patterns(self.root))
+        from_files = gc.subset_graphs(gc.get_graphs(paths, names))
+        from_cohort = gc.cohort_subsets(self.root, names)
+        for files_dict, cohort_dict in zip(from_files, from_cohort):
+            self.assertEqual(gc.get_kos(cohort_dict), gc.get_kos(files_dict))
+
+    def test_compact_results_are_stored_by_pattern(self):
+        self.write_samples(['s1'], compact=True)
+        self.assertEqual(cohort.stored_patterns(self.root), ['both_both', 'food_both', 'food_microbe'])
+
+    def test_host_results_use_pattern_column(self):
+        nodes, edges = random_tables(1, ['diet', 'microbe', 'microbediet', 'host', 'all'], host=True)
+        path = os.path.join(self.tmp, 'host.csv')
+        hrg.write_patterns(nodes, edges, path, chunk_size=200)
+        cohort.append_results(self.root, 'h1', path, chunk_size=200)
+
+        full = pd.read_csv(path)
+        df = cohort.read_sample(self.root, 'h1', patterns=['diet_microbe_host'], columns=['edge1_KOs', 'edge2_KOs'])
+        self.assertEqual(len(df), int((full['pattern'] == 'diet_microbe_host').sum()))
+        self.assertEqual(set(cohort.stored_patterns(self.root)), set(full['pattern']))
+
+    def test_append_replaces_sample(self):
+        self.write_samples(['s1'])
+        empty = os.path.join(self.tmp, 'empty.csv')
+        pd.DataFrame(columns=rg.RESULT_COLUMNS).to_csv(empty, index=False)
+        self.assertEqual(cohort.append_results(self.root, 's1', empty), 0)
+
+        self.assertEqual(cohort.stored_samples(self.root), ['s1'])
+        self.assertEqual(cohort.stored_patterns(self.root), [])
+        self.assertEqual(len(cohort.read_sample(self.root, 's1', columns=['KOs'])), 0)
+
+    def test_missing_sample_raises(self):
+        self.write_samples(['s1'])
+        with self.assertRaises(FileNotFoundError):
+            cohort.read_cohort(self.root, ['s1', 'nope'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+from dietmicrobenet import comparestore
+from dietmicrobenet.similarity import jaccard_similarity
+
+
+def random_sets(seed, n, n_kos=60):
+    rng = np.random.default_rng(seed)
+    sets = {f's{i}': [f'K{k:05d}' for k in rng.choice(n_kos, size=rng.integers(0, 20))] for i in range(n)}
+    sets['s1'] = []
+    sets['s2'] = []
+    return sets
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_batches_match_one_shot_similarity(self):
+        sets = random_sets(0, 30)
+        names = list(sets)
+        for start, stop in [(0, 1), (1, 12), (12, 12), (12, 30)]:
+            store = comparestore.ComparisonStore(self.root, 'Food to Microbe')
+            self.assertEqual(store.add({n: sets[n] for n in names[start:stop]}), names[start:stop])
+        store = comparestore.ComparisonStore(self.root, 'Food to Microbe')
+        matrix, labels = store.similarity()
+        self.assertEqual(labels, names)
+        np.testing.assert_array_equal(matrix, jaccard_similarity([sets[n] for n in names]))
+        self.assertEqual(store.ko_sets(), {n: sorted(set(kos)) for n, kos in sets.items()})
+        self.assertEqual(comparestore.store_keys(self.root), ['Food to Microbe'])
+
+    def test_subset_in_requested_order(self):
+        sets = random_sets(1, 15)
+        store = comparestore.ComparisonStore(self.root, 'focal_edge1')
+        store.add(sets)
+        keep = ['s9', 's2', 's14', 's0']
+        matrix, labels = store.similarity(keep)
+        self.assertEqual(labels, keep)
+        np.testing.assert_array_equal(matrix, jaccard_similarity([sets[n] for n in keep]))
+        self.assertEqual(list(store.ko_sets(keep)), keep)
+        with self.assertRaises(KeyError):
+            store.similarity(['missing'])
+
+    def test_stored_samples_are_skipped_or_rejected(self):
+        sets = random_sets(2, 6)
+        store = comparestore.ComparisonStore(self.root, 'key')
+        store.add(sets)
+        self.assertEqual(store.add({'s3': list(reversed(sets['s3'])) * 2, 'new': ['K00001']}), ['new'])
+        with self.assertRaises(ValueError):
+            store.add({'s4': sets['s4'] + ['K99999']})
+
+    def test_interrupted_append_is_ignored(self):
+        sets = random_sets(3, 10)
+        names = list(sets)
+        store = comparestore.ComparisonStore(self.root, 'key')
+        store.add({n: sets[n] for n in names[:5]})
+        # bytes of an append whose store.json was never written
+        for name in ('indptr.int64', 'indices.int32', 'similarity.float64'):
+            with open(store.path / name, 'ab') as fh:
+                fh.write(b'\xff' * 24)
+        store = comparestore.ComparisonStore(self.root, 'key')
+        self.assertEqual(store.samples, names[:5])
+        store.add({n: sets[n] for n in names[5:]})
+        matrix, _ = comparestore.ComparisonStore(self.root, 'key').similarity()
+        np.testing.assert_array_equal(matrix, jaccard_similarity([sets[n] for n in names]))
+
+    def test_update_stores_loads_only_missing_samples(self):
+        sets = random_sets(4, 8)
+        names = list(sets)
+        requested = []
+
+        def load(missing):
+            requested.append(missing)
+            return {key: {n: sets[n] for n in missing} for key in ('a', 'b')}
+
+        comparestore.update_stores(self.root, ['a', 'b'], names[:5], load)
+        stores = comparestore.update_stores(self.root, ['a', 'b'], names, load)
+        comparestore.update_stores(self.root, ['a', 'b'], names, load)
+        self.assertEqual(requested, [names[:5], names[5:]])
+        self.assertEqual(stores['b'].samples, names)
+
+    def test_other_source_is_rejected(self):
+        sets = random_sets(5, 4)
+        comparestore.ComparisonStore(self.root, 'key', {'ko_column': 'KOs', 'cohort': None}).add(sets)
+        store = comparestore.ComparisonStore(self.root, 'key', {'ko_column': 'KOs', 'cohort': None})
+        self.assertEqual(store.samples, list(sets))
+        with self.assertRaises(ValueError):
+            comparestore.ComparisonStore(self.root, 'key', {'ko_column': 'edge1_KOs', 'cohort': None})
+
+    def test_other_input_file_is_rejected(self):
+        sets = random_sets(6, 4)
+
+        def load(missing):
+            return {'key': {n: sets[n] for n in missing}}
+
+        inputs = {n: f'/data/{n}.csv' for n in sets}
+        comparestore.update_stores(self.root, ['key'], list(sets), load, inputs=inputs)
+        comparestore.update_stores(self.root, ['key'], list(sets), load, inputs=inputs)
+        with self.assertRaises(ValueError):
+            comparestore.update_stores(self.root, ['key'], list(sets), load, inputs={**inputs, 's0': '/other/s0.csv'})
+
+    def test_empty_store(self):
+        store = comparestore.ComparisonStore(self.root, 'empty')
+        matrix, labels = store.similarity()
+        self.assertEqual(matrix.shape, (0, 0))
+        self.assertEqual(labels, [])
+        self.assertEqual(comparestore.store_keys(Path(self.root) / 'nothing'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
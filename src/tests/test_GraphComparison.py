@@ -96,6 +96,43 @@ class TestGraphCompare(unittest.TestCase):
         self.assertIn("sample1", graph_dict)
         self.assertIsInstance(graph_dict["sample1"], pd.DataFrame)
 
+    def test_get_graphs_projected_columns(self):
+        paths, names = gc.csv_to_inputs(
+            metadata=str(self.metadata_csv), paths_col="paths",
+            names_col="names"
+        )
+        columns = gc.ORIGIN_COLS + ["KOs"]
+        full = gc.get_graphs(paths, names)
+        projected = gc.get_graphs(paths, names, columns=columns, workers=2)
+        for name in names:
+            self.assertEqual(list(projected[name].columns), columns)
+            for col in columns:
+                self.assertIsInstance(projected[name][col].dtype, pd.CategoricalDtype)
+        for full_dict, projected_dict in zip(gc.subset_graphs(full), gc.subset_graphs(projected)):
+            self.assertEqual(gc.get_kos(projected_dict), gc.get_kos(full_dict))
+
+    def test_store_matches_loading_every_sample(self):
+        paths, names = gc.csv_to_inputs(
+            metadata=str(self.metadata_csv), paths_col="paths",
+            names_col="names"
+        )
+        path_of = dict(zip(names, paths))
+        loaded = gc.load_pattern_kos(names, paths)
+        self.assertEqual(list(loaded), gc.PATTERN_NAMES)
+
+        def load(samples):
+            return gc.load_pattern_kos(samples, [path_of[s] for s in samples])
+
+        store_dir = os.path.join(self.tmpdir, "store")
+        gc.update_stores(store_dir, gc.PATTERN_NAMES, names[:2], load)
+        stores = gc.update_stores(store_dir, gc.PATTERN_NAMES, names, load)
+        for pat_name, store in stores.items():
+            self.assertEqual(store.ko_sets(names), loaded[pat_name])
+            matrix, labels = store.similarity(names)
+            expected, expected_labels = gc.calculate_similarity_matrix(loaded[pat_name])
+            self.assertEqual(labels, expected_labels)
+            np.testing.assert_array_equal(matrix, expected)
+
     def test_subset_graphs(self):
         paths, names = gc.csv_to_inputs(
             metadata=str(self.metadata_csv), paths_col="paths",
@@ -173,6 +210,29 @@ class TestGraphCompare(unittest.TestCase):
         self.assertIn("p_value", result)
         self.assertIn("R2", result)
 
+        # run_stat_tests (used by main and summary) gives the same result
+        batched = gc.run_stat_tests({"pattern": pattern}, metadata, ["group"], workers=2)
+        self.assertEqual(batched["pattern"], [("group", result)])
+
+    def test_stat_test_matches_skbio(self):
+        from skbio import DistanceMatrix
+        from skbio.stats.distance import permanova as skbio_permanova
+
+        # few KOs over 8 samples in 2 groups: many permutations tie the observed pseudo-F
+        rng = np.random.default_rng(3)
+        names = [f"s{i}" for i in range(8)]
+        pattern = {name: [f"KO{k}" for k in rng.choice(5, size=3)] for name in names}
+        metadata = pd.DataFrame({"group": np.repeat(["A", "B"], 4)}, index=names)
+
+        matrix, labels = gc.similarity_matrix(pattern)
+        expected = skbio_permanova(DistanceMatrix(1.0 - matrix, labels), metadata.loc[labels, "group"],
+                                   permutations=5000, seed=5)
+        result = gc.stat_test(pattern, metadata=metadata, group_col="group")
+        self.assertEqual(result["p_value"], expected["p-value"])
+        self.assertEqual(result["pseudo_F"], expected["test statistic"])
+        batched = gc.run_stat_tests({"pattern": pattern}, metadata, ["group"], workers=2)
+        self.assertEqual(batched["pattern"], [("group", result)])
+
 
     def test_plotting(self):
         pattern = {
@@ -1,8 +1,13 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
+import numpy as np
 import pandas as pd
 import networkx as nx
 from Host import host_nodes_edges as hne
 from Host import host_run_graph as hrg
+from dietmicrobenet.results import node_table_path, read_results
 
 # create dummy data 
 food_meta_df = pd.DataFrame({
@@ -88,6 +93,37 @@ def build_test_graph():
 
     return G
 
+def graph_to_frames(G):
+    """Convert a test graph into the node and edge tables written by main_host.py."""
+    nodes_df = pd.DataFrame([{"compound": n, **attrs} for n, attrs in G.nodes(data=True)])
+    edges_df = pd.DataFrame([{"compound1": u, "compound2": v, **attrs} for u, v, attrs in G.edges(data=True)])
+    return nodes_df, edges_df
+
+def hub_graph(n_nodes, n_hubs, n_edges, seed):
+    """Random node and edge tables where a few hub compounds take part in most edges."""
+    rng = np.random.default_rng(seed)
+    origins = ["diet", "microbe", "microbediet", "host", "hostdiet", "hostmicrobe", "all", "none"]
+    compounds = [f"C{i:05d}" for i in range(n_nodes)]
+    nodes_df = pd.DataFrame({
+        "compound": compounds,
+        "origin": rng.choice(origins, size=n_nodes),
+        "assoc_food": rng.choice(["['apple']", "['pear']", None], size=n_nodes),
+        "freq": rng.integers(0, 100, size=n_nodes).astype(float),
+    })
+    hubs = rng.choice(compounds, size=n_hubs, replace=False)
+    weights = np.where(np.isin(compounds, hubs), 50.0, 1.0)
+    weights /= weights.sum()
+    edges_df = pd.DataFrame({
+        "compound1": rng.choice(compounds, size=n_edges, p=weights),
+        "compound2": rng.choice(compounds, size=n_edges, p=weights),
+        "reaction": [f"rn{i}" for i in range(n_edges)],
+        "KOs": [f"['K{i % 1000:05d}']" for i in range(n_edges)],
+        "organisms": rng.choice(["org1", "org2"], size=n_edges),
+        "m_abundance": rng.random(n_edges),
+        "h_abundance": rng.random(n_edges),
+    })
+    return nodes_df, edges_df
+
 class MyTestCase(unittest.TestCase): 
     def test_org_abundance(self): 
         abundance, orgs = hne.make_organisms_abundance_dict(microbe_meta_clean=microbe_meta, 
@@ -216,6 +252,208 @@ class MyTestCase(unittest.TestCase):
         # C9 is produced by K00004 (both microbe and host) -> hostmicrobe
         self.assertEqual(get_origin('C9'), 'hostmicrobe')
 
+    def test_two_hop_matches_networkx(self):
+        """join engine should return the same paths, in the same order, as the networkx loop."""
+        nodes_df, edges_df = graph_to_frames(build_test_graph())
+        expected = hrg.networkx_patterns(nodes_df, edges_df)
+        res = hrg.two_hop_patterns(nodes_df, edges_df)
+
+        self.assertEqual(list(res.columns), hrg.RESULT_COLUMNS)
+        pd.testing.assert_frame_equal(res, expected, check_dtype=False)
+
+    def test_two_hop_matches_networkx_hub_graph(self):
+        """high-degree hub compounds with duplicated compound pairs."""
+        nodes_df, edges_df = hub_graph(n_nodes=300, n_hubs=3, n_edges=3000, seed=7)
+        expected = hrg.networkx_patterns(nodes_df, edges_df)
+        res = hrg.two_hop_patterns(nodes_df, edges_df)
+        pd.testing.assert_frame_equal(res, expected, check_dtype=False)
+
+    def test_streamed_output_matches_single_write(self):
+        """chunked writing should give the same file as writing all paths at once."""
+        nodes_df, edges_df = hub_graph(n_nodes=200, n_hubs=2, n_edges=2000, seed=3)
+        with tempfile.TemporaryDirectory() as tmp:
+            expected = os.path.join(tmp, "expected.csv")
+            streamed = os.path.join(tmp, "streamed.csv")
+            hrg.two_hop_patterns(nodes_df, edges_df).to_csv(expected, index=False)
+            n_rows = hrg.write_patterns(nodes_df, edges_df, streamed, chunk_size=500)
+
+            with open(expected) as fh_expected, open(streamed) as fh_streamed:
+                self.assertEqual(fh_streamed.read(), fh_expected.read())
+            self.assertEqual(n_rows, len(pd.read_csv(expected)))
+
+    def test_workers_output_matches_single_process(self):
+        """a process pool writes the same file, in the same order, as one process."""
+        nodes_df, edges_df = hub_graph(n_nodes=200, n_hubs=2, n_edges=2000, seed=4)
+        with tempfile.TemporaryDirectory() as tmp:
+            single = os.path.join(tmp, "single.csv")
+            pooled = os.path.join(tmp, "pooled.csv")
+            hrg.write_patterns(nodes_df, edges_df, single, chunk_size=500)
+            hrg.write_patterns(nodes_df, edges_df, pooled, chunk_size=500, workers=4)
+
+            with open(single) as fh_single, open(pooled) as fh_pooled:
+                self.assertEqual(fh_pooled.read(), fh_single.read())
+
+    def test_pattern_column_matches_origins(self):
+        """each path is tagged with the key of its three origins, as a categorical."""
+        nodes_df, edges_df = hub_graph(n_nodes=200, n_hubs=2, n_edges=2000, seed=5)
+        res = hrg.two_hop_patterns(nodes_df, edges_df)
+
+        self.assertIsInstance(res["pattern"].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(res["pattern"].cat.categories), hrg.PATTERN_KEYS)
+        expected = res["compound1_origin"] + "_" + res["compound2_origin"] + "_" + res["compound3_origin"]
+        self.assertEqual(res["pattern"].astype(str).tolist(), expected.tolist())
+
+    def test_parquet_output_keeps_pattern_column(self):
+        """the categorical pattern column round-trips through Parquet chunks."""
+        nodes_df, edges_df = hub_graph(n_nodes=200, n_hubs=2, n_edges=2000, seed=5)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "results.parquet")
+            hrg.write_patterns(nodes_df, edges_df, output, chunk_size=500)
+            res = read_results(output)
+
+        expected = hrg.two_hop_patterns(nodes_df, edges_df)
+        self.assertIsInstance(res["pattern"].dtype, pd.CategoricalDtype)
+        self.assertEqual(res["pattern"].astype(str).tolist(), expected["pattern"].astype(str).tolist())
+
+    def test_compact_output_expands_to_full_output(self):
+        """compound attributes moved to the node table are joined back on read."""
+        nodes_df, edges_df = hub_graph(n_nodes=200, n_hubs=2, n_edges=2000, seed=6)
+        with tempfile.TemporaryDirectory() as tmp:
+            full = os.path.join(tmp, "full.csv")
+            compact = os.path.join(tmp, "compact.csv")
+            hrg.write_patterns(nodes_df, edges_df, full, chunk_size=500)
+            hrg.write_patterns(nodes_df, edges_df, compact, chunk_size=500, compact=True)
+
+            self.assertNotIn("compound2_assoc_food", pd.read_csv(compact).columns)
+            self.assertTrue(node_table_path(compact).exists())
+            pd.testing.assert_frame_equal(read_results(compact), read_results(full))
+
+    def test_top_paths_match_ranked_enumeration(self):
+        nodes_df, edges_df = hub_graph(n_nodes=200, n_hubs=2, n_edges=2000, seed=6)
+        paths = hrg.two_hop_patterns(nodes_df, edges_df)
+        paths["score"] = paths[hrg.SCORE_COLUMNS].prod(axis=1, skipna=False)
+        expected = paths.dropna(subset=["score"]).sort_values("score", ascending=False, kind="stable").head(25)
+
+        res = hrg.top_patterns(nodes_df, edges_df, k=25)
+        self.assertEqual(list(res.columns), hrg.RESULT_COLUMNS + ["score"])
+        np.testing.assert_allclose(res["score"], expected["score"])
+        self.assertEqual(list(zip(res["edge1_reaction"], res["edge2_reaction"])),
+                         list(zip(expected["edge1_reaction"], expected["edge2_reaction"])))
+
+    def test_top_paths_k_beyond_matches(self):
+        nodes_df, edges_df = graph_to_frames(build_test_graph())
+        n_scored = hrg.two_hop_patterns(nodes_df, edges_df)[hrg.SCORE_COLUMNS].notna().all(axis=1).sum()
+        res = hrg.top_patterns(nodes_df, edges_df, k=1000)
+        self.assertEqual(len(res), n_scored)
+        self.assertTrue(res["score"].is_monotonic_decreasing)
+
+    def test_top_paths_rejects_negative_scores(self):
+        nodes_df, edges_df = hub_graph(n_nodes=50, n_hubs=1, n_edges=200, seed=1)
+        edges_df["m_abundance"] = -edges_df["m_abundance"]
+        with self.assertRaises(ValueError):
+            hrg.top_patterns(nodes_df, edges_df, k=5)
+
+    def test_reach_covers_two_hop_pairs(self):
+        """every (compound1, compound3) pair of a 2-hop path is reachable within two hops."""
+        nodes_df, edges_df = hub_graph(n_nodes=200, n_hubs=2, n_edges=2000, seed=8)
+        paths = hrg.two_hop_patterns(nodes_df, edges_df)
+        pairs = set(zip(paths["compound1_id"], paths["compound3_id"]))
+        pairs = {(c1, c3) for c1, c3 in pairs if c1 != c3}
+
+        res = hrg.reach_patterns(nodes_df, edges_df, max_hops=2)
+        self.assertTrue(pairs <= set(zip(res["source_id"], res["target_id"])))
+        self.assertTrue(res["min_hops"].between(1, 2).all())
+
+    def test_sqlite_matches_join(self):
+        """the SQLite engine writes the same file as the join engine, duplicate edges included."""
+        nodes_df, edges_df = hub_graph(n_nodes=200, n_hubs=2, n_edges=2000, seed=9)
+        with tempfile.TemporaryDirectory() as tmp:
+            nodes_csv = os.path.join(tmp, "nodes.csv")
+            edges_csv = os.path.join(tmp, "edges.csv")
+            nodes_df.to_csv(nodes_csv, index=False)
+            edges_df.to_csv(edges_csv, index=False)
+            expected = os.path.join(tmp, "join.csv")
+            hrg.write_patterns(pd.read_csv(nodes_csv), pd.read_csv(edges_csv), expected)
+
+            out = os.path.join(tmp, "sqlite.csv")
+            db = os.path.join(tmp, "graph.db")
+            n_rows = hrg.sqlite_patterns(nodes_csv, edges_csv, out, db=db, chunk_size=700)
+            with open(expected) as fh_expected, open(out) as fh_out:
+                self.assertEqual(fh_out.read(), fh_expected.read())
+            self.assertEqual(n_rows, len(pd.read_csv(expected)))
+
+    def test_pair_counts_match_enumeration(self):
+        nodes_df, edges_df = hub_graph(n_nodes=200, n_hubs=2, n_edges=2000, seed=5)
+        paths = hrg.two_hop_patterns(nodes_df, edges_df)
+        paths["weight"] = paths["edge1_m_abundance"] * paths["edge2_h_abundance"]
+        expected = (paths.groupby(["compound1_id", "compound3_id"])
+                         .agg(n_paths=("weight", "size"), weighted_sum=("weight", "sum"))
+                         .reset_index())
+
+        counts = hrg.count_patterns(nodes_df, edges_df, "pairs", weights=["m_abundance", "h_abundance"])
+        counts = counts.sort_values(["compound1_id", "compound3_id"]).reset_index(drop=True)
+
+        self.assertEqual(list(counts.columns), ["compound1_id", "compound3_id", "n_paths", "weighted_sum"])
+        pd.testing.assert_frame_equal(counts, expected, check_dtype=False)
+
+    def test_pattern_counts_match_enumeration(self):
+        nodes_df, edges_df = hub_graph(n_nodes=200, n_hubs=2, n_edges=2000, seed=6)
+        paths = hrg.two_hop_patterns(nodes_df, edges_df)
+        expected = paths.groupby(["compound1_origin", "compound2_origin", "compound3_origin"]).size()
+
+        counts = hrg.count_patterns(nodes_df, edges_df, "patterns")
+        self.assertEqual(len(counts), 36)
+        self.assertEqual(counts["n_paths"].sum(), len(paths))
+        for _, row in counts.iterrows():
+            key = (row["compound1_origin"], row["compound2_origin"], row["compound3_origin"])
+            self.assertEqual(row["n_paths"], expected.get(key, 0))
+            self.assertEqual(row["pattern"], "_".join(key))
+
+    def test_multi_edges_keep_parallel_reactions(self):
+        """parallel reactions between the same compounds are pooled, not overwritten."""
+        nodes_df, edges_df = graph_to_frames(build_test_graph())
+        extra = edges_df[(edges_df["compound1"] == "C1") & (edges_df["compound2"] == "C3")].assign(
+            reaction="rn9", KOs="['K00009']", m_abundance=1.0, h_abundance=2.0)
+        edges_df = pd.concat([edges_df, extra], ignore_index=True)
+
+        res = hrg.two_hop_patterns(nodes_df, edges_df, multi_edges=True)
+        single = hrg.two_hop_patterns(nodes_df, edges_df)
+        self.assertEqual(len(res), len(single))
+
+        c1_c3 = res[(res["compound1_id"] == "C1") & (res["compound2_id"] == "C3")]
+        self.assertTrue((c1_c3["edge1_reaction"] == "['rn1', 'rn9']").all())
+        self.assertTrue((c1_c3["edge1_KOs"] == "['K00001', 'K00009']").all())
+        self.assertTrue((c1_c3["edge1_m_abundance"] == 11.0).all())
+
+    def run_main(self, *args):
+        """Run host_run_graph.py with the given options on placeholder input paths."""
+        argv = ["host_run_graph.py", "--n", "nodes.csv", "--e", "edges.csv", "--o", "out.csv", *args]
+        with mock.patch("sys.argv", argv), mock.patch("sys.stderr"):
+            hrg.main()
+
+    def test_networkx_rejects_pattern(self):
+        """the networkx engine always walks the built-in host pattern, so --pattern is refused."""
+        with self.assertRaises(SystemExit) as ctx:
+            self.run_main("--engine", "networkx", "--pattern", "diet -> microbe -> host")
+        self.assertEqual(ctx.exception.code, 2)
+
+    def test_weights_need_counts(self):
+        with self.assertRaises(SystemExit) as ctx:
+            self.run_main("--weights", "m_abundance", "h_abundance")
+        self.assertEqual(ctx.exception.code, 2)
+
+    def test_score_needs_top(self):
+        with self.assertRaises(SystemExit) as ctx:
+            self.run_main("--score", "compound1_freq")
+        self.assertEqual(ctx.exception.code, 2)
+
+    def test_two_hop_no_false_positives(self):
+        nodes_df, edges_df = graph_to_frames(build_test_graph())
+        res = hrg.two_hop_patterns(nodes_df, edges_df)
+        self.assertTrue(res["compound1_origin"].isin(hrg.VALID_N1).all())
+        self.assertTrue(res["compound2_origin"].isin(hrg.VALID_N2).all())
+        self.assertTrue(res["compound3_origin"].isin(hrg.VALID_N3).all())
+
 def test_node_food_associations(self):
     """compounds with diet origin should have food names and frequency populated."""
     _, microbe_comps, host_comps, all_rxn_comps = hne.build_edges_df(
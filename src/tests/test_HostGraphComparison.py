@@ -18,6 +18,8 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
+from dietmicrobenet.kos import parse_ko_cell
+from dietmicrobenet.similarity import SimilarityCache
 
 from Host import host_GraphComparison as gc
 
@@ -219,6 +221,21 @@ class TestGraphComparisonsEdge(unittest.TestCase):
             self.assertIsInstance(df, pd.DataFrame,
                                   msg=f"'{name}' is not a DataFrame")
 
+    def test_get_graphs_projected_columns_match_full_read(self):
+        paths, names = gc.csv_to_inputs(
+            str(self.metadata_csv), paths_col="paths", names_col="names"
+        )
+        full = gc.subset_graphs(gc.get_graphs(paths, names))
+        projected = gc.subset_graphs(
+            gc.get_graphs(paths, names, columns=gc.LOAD_COLS, workers=2)
+        )
+        for key in full:
+            for edge_col in gc.EDGE_COLS:
+                self.assertEqual(
+                    gc.get_kos_per_edge(projected[key], edge_col=edge_col),
+                    gc.get_kos_per_edge(full[key], edge_col=edge_col),
+                )
+
     def test_get_graphs_duplicate_name_raises(self):
         p = self.graph_paths[0]
         with self.assertRaises(ValueError):
@@ -261,6 +278,45 @@ class TestGraphComparisonsEdge(unittest.TestCase):
             set(self.names)
         )
 
+    def test_subset_graphs_pattern_column_matches_origin_split(self):
+        paths, names = gc.csv_to_inputs(
+            str(self.metadata_csv), paths_col="paths", names_col="names"
+        )
+        graph_dict = gc.get_graphs(paths, names)
+        untagged = gc.subset_graphs({name: df.drop(columns="pattern", errors="ignore") for name, df in graph_dict.items()})
+        tagged = gc.subset_graphs({
+            name: df.assign(pattern=df["compound1_origin"] + "_" + df["compound2_origin"] + "_" + df["compound3_origin"])
+            for name, df in graph_dict.items()
+        })
+        for key in untagged:
+            for name in names:
+                pd.testing.assert_frame_equal(
+                    tagged[key][name].drop(columns="pattern"), untagged[key][name]
+                )
+
+    def test_subset_graphs_matches_origin_masks(self):
+        paths, names = gc.csv_to_inputs(
+            str(self.metadata_csv), paths_col="paths", names_col="names"
+        )
+        graph_dict = {
+            name: df.drop(columns="pattern", errors="ignore")
+            for name, df in gc.get_graphs(paths, names).items()
+        }
+        # rows whose origins are outside PATTERNS or missing belong to no subset
+        extra = graph_dict[names[0]].iloc[:2].copy()
+        extra.loc[:, "compound1_origin"] = ["unknown", None]
+        graph_dict[names[0]] = pd.concat([extra, graph_dict[names[0]]], ignore_index=True)
+
+        pattern_dicts = gc.subset_graphs(graph_dict)
+        for c1, c2, c3, key in gc.PATTERNS:
+            for name, df in graph_dict.items():
+                mask = (
+                    (df["compound1_origin"] == c1) &
+                    (df["compound2_origin"] == c2) &
+                    (df["compound3_origin"] == c3)
+                )
+                pd.testing.assert_frame_equal(pattern_dicts[key][name], df[mask])
+
     def test_subset_graphs_missing_origin_column_raises(self):
         bad_df = pd.DataFrame([{"edge1_KOs": "['K1']", "edge2_KOs": "['K2']"}])
         with self.assertRaises(ValueError):
@@ -360,6 +416,25 @@ class TestGraphComparisonsEdge(unittest.TestCase):
             self.assertEqual(ko_list, sorted(ko_list),
                              msg=f"Aggregate KOs for '{name}' are not sorted")
 
+    def test_ko_incidence_matches_per_pattern_extraction(self):
+        paths, names = gc.csv_to_inputs(
+            str(self.metadata_csv), paths_col="paths", names_col="names"
+        )
+        graph_dict = gc.get_graphs(paths, names)
+        pattern_dicts = gc.subset_graphs(graph_dict)
+        incidence = gc.ko_incidence(graph_dict)
+        for edge_col in gc.EDGE_COLS:
+            self.assertEqual(
+                incidence.ko_sets([gc.FOCAL_PATTERN_KEY], edge_col),
+                gc.get_kos_per_edge(pattern_dicts[gc.FOCAL_PATTERN_KEY], edge_col),
+            )
+            self.assertEqual(
+                incidence.ko_sets(gc.AGGREGATE_PATTERN_KEYS, edge_col),
+                gc.aggregate_kos_across_patterns(
+                    pattern_dicts, gc.AGGREGATE_PATTERN_KEYS, edge_col
+                ),
+            )
+
     # -----------------------------------------------------------------------
     # 7. jaccard
     # -----------------------------------------------------------------------
@@ -432,27 +507,27 @@ class TestGraphComparisonsEdge(unittest.TestCase):
         self.assertEqual(Z.size, 0)
 
     # -----------------------------------------------------------------------
-    # 10. _safe_literal_eval
+    # 10. KO list cells (dietmicrobenet.kos)
     # -----------------------------------------------------------------------
 
-    def test_safe_literal_eval_list_string(self):
-        result = gc._safe_literal_eval("['K00001', 'K00002']")
-        self.assertEqual(result, ["K00001", "K00002"])
+    def test_parse_ko_cell_list_string(self):
+        result = parse_ko_cell("['K00001', 'K00002']")
+        self.assertEqual(result, ("K00001", "K00002"))
 
-    def test_safe_literal_eval_empty_list(self):
-        self.assertEqual(gc._safe_literal_eval("[]"), [])
+    def test_parse_ko_cell_empty_list(self):
+        self.assertEqual(parse_ko_cell("[]"), ())
 
-    def test_safe_literal_eval_none(self):
-        self.assertEqual(gc._safe_literal_eval(None), [])
+    def test_parse_ko_cell_none(self):
+        self.assertEqual(parse_ko_cell(None), ())
 
-    def test_safe_literal_eval_nan(self):
-        self.assertEqual(gc._safe_literal_eval(float("nan")), [])
+    def test_parse_ko_cell_nan(self):
+        self.assertEqual(parse_ko_cell(float("nan")), ())
 
-    def test_safe_literal_eval_empty_string(self):
-        self.assertEqual(gc._safe_literal_eval(""), [])
+    def test_parse_ko_cell_empty_string(self):
+        self.assertEqual(parse_ko_cell(""), ())
 
-    def test_safe_literal_eval_native_list(self):
-        self.assertEqual(gc._safe_literal_eval(["K00001"]), ["K00001"])
+    def test_parse_ko_cell_native_list(self):
+        self.assertEqual(parse_ko_cell(["K00001"]), ("K00001",))
 
     # -----------------------------------------------------------------------
     # 11. fdr_correction
@@ -496,6 +571,26 @@ class TestGraphComparisonsEdge(unittest.TestCase):
         for key in ("pseudo_F", "p_value", "R2", "groups", "n_samples"):
             self.assertIn(key, result)
 
+    def test_stat_test_cache_builds_matrix_once(self):
+        pattern_kos = {
+            "sample1": ["K00001", "K00002"],
+            "sample2": ["K00001", "K00003"],
+            "sample3": ["K00004", "K00005"],
+            "sample4": ["K00004", "K00006"],
+            "sample5": ["K00001"],
+        }
+        metadata = pd.DataFrame(
+            {"groups": ["A", "A", "B", "B", "C"], "other": ["X", "Y", "X", "Y", "X"]},
+            index=["sample1", "sample2", "sample3", "sample4", "sample5"],
+        )
+        cache = SimilarityCache()
+        for group in ("groups", "other"):
+            expected = gc.stat_test(pattern_kos, metadata=metadata, group_col=group, permutations=99, seed=0)
+            cached = gc.stat_test(pattern_kos, metadata=metadata, group_col=group, permutations=99, seed=0,
+                                  cache=cache, cache_key="focal_edge1")
+            self.assertEqual(cached, expected)
+        self.assertEqual(cache.computed, 1)
+
     def test_stat_test_p_value_in_range(self):
         pattern_kos = {
             "sample1": ["K00001", "K00002"],
@@ -532,6 +627,56 @@ class TestGraphComparisonsEdge(unittest.TestCase):
         self.assertGreaterEqual(result["R2"], 0.0)
         self.assertLessEqual(result["R2"], 1.0)
 
+    def test_store_matches_loading_every_sample(self):
+        path_of = dict(zip(self.names, self.graph_paths))
+        loaded = gc.load_comparison_kos(self.names, self.graph_paths)
+        self.assertEqual(list(loaded), [stem for _, stem, _, _ in gc.COMPARISONS])
+
+        def load(samples):
+            return gc.load_comparison_kos(samples, [path_of[s] for s in samples])
+
+        store_dir = str(Path(self.tmpdir) / "store")
+        gc.update_stores(store_dir, list(loaded), self.names[:3], load)
+        stores = gc.update_stores(store_dir, list(loaded), self.names, load)
+        for file_stem, store in stores.items():
+            self.assertEqual(store.ko_sets(self.names), loaded[file_stem])
+            matrix, _ = store.similarity(self.names)
+            expected, _ = gc.calculate_similarity_matrix(loaded[file_stem])
+            np.testing.assert_array_equal(matrix, expected)
+
+    def test_run_stat_tests_same_for_any_worker_count(self):
+        rng = np.random.default_rng(0)
+        names = [f"s{i}" for i in range(12)]
+        pattern_sets = {
+            stem: {name: [f"K{k:05d}" for k in rng.choice(40, size=15)] for name in names}
+            for stem in ("focal_edge1", "aggregated_edge1")
+        }
+        metadata = pd.DataFrame(
+            {"diet": np.repeat(["A", "B", "C"], 4), "site": ["X", "Y"] * 6, "lone": ["Z"] * 12},
+            index=names,
+        )
+        groups = ["diet", "site", "lone"]
+        serial = gc.run_stat_tests(pattern_sets, metadata, groups, permutations=199)
+        parallel = gc.run_stat_tests(pattern_sets, metadata, groups, permutations=199, workers=2)
+        self.assertEqual(serial, parallel)
+        # 'lone' has a single group and is left out
+        self.assertEqual([group for group, _ in serial["focal_edge1"]], ["diet", "site"])
+        # one pattern on its own gets the same results as within the full run
+        alone = gc.run_stat_tests({"focal_edge1": pattern_sets["focal_edge1"]}, metadata, groups, permutations=199)
+        self.assertEqual(alone["focal_edge1"], serial["focal_edge1"])
+        # every test gets the same p-value as calling stat_test on its own
+        for group, res in serial["aggregated_edge1"]:
+            self.assertEqual(res, gc.stat_test(pattern_sets["aggregated_edge1"], metadata, group, permutations=199))
+        # with early stopping the results also report the permutations used
+        stopped = gc.run_stat_tests(pattern_sets, metadata, groups, permutations=5000, early_stop=True,
+                                    engine="native")
+        for _, res in stopped["focal_edge1"]:
+            self.assertLessEqual(res["permutations"], 5000)
+            self.assertNotIn("permutations", dict(serial["focal_edge1"])["diet"])
+        # early stopping is a native engine option
+        with self.assertRaises(ValueError):
+            gc.run_stat_tests(pattern_sets, metadata, groups, early_stop=True)
+
     def test_stat_test_missing_group_column_raises(self):
         pattern_kos = {"s1": ["K1"], "s2": ["K2"]}
         metadata = pd.DataFrame({"groups": ["A", "B"]}, index=["s1", "s2"])
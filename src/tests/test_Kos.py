@@ -0,0 +1,75 @@
+import ast
+import unittest
+import numpy as np
+import pandas as pd
+from dietmicrobenet import kos
+
+
+def literal_reference(item):
+    """What the comparison scripts parsed a KO cell into before dietmicrobenet.kos."""
+    if item is None or (isinstance(item, float) and np.isnan(item)):
+        return []
+    if isinstance(item, (list, tuple, set)):
+        return list(item)
+    text = str(item).strip()
+    if text == '':
+        return []
+    try:
+        parsed = ast.literal_eval(text)
+        if isinstance(parsed, (list, tuple, set)):
+            return list(parsed)
+        return [parsed]
+    except Exception:
+        trimmed = text.strip('[](){} ')
+        return [x.strip().strip("'\"") for x in trimmed.split(',') if x.strip()]
+
+
+class MyTestCase(unittest.TestCase):
+    def test_matches_literal_eval(self):
+        rng = np.random.default_rng(5)
+        ids = [f'K{i:05d}' for i in range(50)]
+        values = [str([str(k) for k in rng.choice(ids, size=rng.integers(0, 4))]) for _ in range(2000)]
+        values += [None, np.nan, '', '[]', "['KO1', 'KO2']", 'KO3', "K00007, K00008", ['K00009'],
+                   "['K00001', 'KO1']", "['K000012']", "['K00001', 'K000012']", "['K00001x', 'K00002']"]
+        expected = [tuple(literal_reference(v)) for v in values]
+        self.assertEqual(kos.ko_lists(values), expected)
+
+    def test_items_are_never_dropped_or_cut(self):
+        self.assertEqual(kos.parse_ko_list("['K00001','KO1']"), ('K00001', 'KO1'))
+        self.assertEqual(kos.parse_ko_list("['K000012']"), ('K000012',))
+        self.assertEqual(kos.ko_union(["['K00001', 'K000012']"]), ['K00001', 'K000012'])
+
+    def test_union_is_sorted_and_distinct(self):
+        column = pd.Series(["['K00002', 'K00001']", "['K00001']", None, "['K00003']"] * 100)
+        self.assertEqual(kos.ko_union(column), ['K00001', 'K00002', 'K00003'])
+        self.assertEqual(kos.ko_union(pd.Series([], dtype=object)), [])
+
+    def test_categorical_column(self):
+        column = pd.Series(["['K00001']", "['K00002', 'K00003']", "['K00001']"], dtype='category')
+        self.assertEqual(kos.ko_lists(column), [('K00001',), ('K00002', 'K00003'), ('K00001',)])
+
+    def test_distinct_strings_parsed_once(self):
+        kos.parse_ko_list.cache_clear()
+        kos.ko_lists(["['K00001']", "['K00002']"] * 500)
+        info = kos.parse_ko_list.cache_info()
+        self.assertEqual(info.misses, 2)
+        self.assertEqual(info.hits, 0)
+
+    def test_incidence_or_reduces_patterns(self):
+        frames = {
+            's1': pd.DataFrame({
+                'pattern': ['a', 'a', 'b', 'c', None],
+                'e1': ["['K00001', 'K00001']", None, "['K00002']", "['K00003']", "['K00004']"],
+            }),
+            's2': pd.DataFrame({'pattern': ['b'], 'other': ['x']}),
+        }
+        positions = {'a': 0, 'b': 1}
+        incidence = kos.KOIncidence.from_frames(
+            frames, lambda df: np.array([positions.get(p, -1) for p in df['pattern']]), ['a', 'b'], ['e1'])
+        self.assertEqual(incidence.ko_sets(['a'], 'e1'), {'s1': ['K00001'], 's2': []})
+        self.assertEqual(incidence.ko_sets(['b', 'a'], 'e1'), {'s1': ['K00001', 'K00002'], 's2': []})
+        self.assertEqual(incidence.incidence(['a', 'b'], 'e1').shape, (2, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from SupplementalFunctions import run_Neo4j as neo
+
+# create dummy data
+nodes_df = pd.DataFrame({
+    'compound': ['C1', 'C2', 'C3', 'C4', 'C2'],
+    'origin': ['food', 'food', 'microbe', 'both', 'both'],
+    'assoc_food': ["['apple']", np.nan, np.nan, "['pear']", "['apple', 'pear']"],
+    'freq': [60.0, 100.0, np.nan, 40.0, 80.0]
+})
+
+edges_df = pd.DataFrame({
+    'compound1': ['C1', 'C2', 'C1', 'C3', 'C9'],
+    'compound2': ['C3', 'C4', 'C3', 'C4', 'C1'],
+    'reaction': ['rn1', 'rn2', 'rn3', 'rn4', 'rn5'],
+    'KOs': ["['K00001']", "['K00002', 'K00003']", "['K00004']", np.nan, "['K00005']"],
+    'organisms': ['org1', 'org2', 'org3', np.nan, 'org5'],
+    'abundance': [1.0, 2.0, 3.0, 4.0, 5.0]
+})
+
+
+class MyTestCase(unittest.TestCase):
+    def test_parse_kos(self):
+        self.assertEqual(neo.parse_kos("['K00002', 'K00003']"), "K00002;K00003")
+        self.assertEqual(neo.parse_kos("K00001"), "K00001")
+        self.assertEqual(neo.parse_kos(np.nan), "")
+        # the same parser as the comparison scripts: tuples and padded lists are read as lists,
+        # and non-KO items are kept whole
+        self.assertEqual(neo.parse_kos(" ['K00001', 'K00002']"), "K00001;K00002")
+        self.assertEqual(neo.parse_kos("('K00001', 'K00002')"), "K00001;K00002")
+        self.assertEqual(neo.parse_kos("['K00001', 'K00002x', 'KO 3']"), "K00001;K00002x;KO 3")
+
+    def test_verify_reports_non_ko_items(self):
+        edges = edges_df.assign(KOs=["['K00001']", "['K00002', 'KO1']", "['K00004']", np.nan, "['K00005']"])
+        with tempfile.TemporaryDirectory() as tmp:
+            neo.export_admin_import(nodes_df, edges, tmp)
+            problems = neo.verify_admin_import(tmp)
+        self.assertEqual(len(problems), 1)
+        self.assertIn('not KO IDs, e.g. KO1', problems[0])
+
+    def test_export_matches_loader_semantics(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            command = neo.export_admin_import(nodes_df, edges_df, tmp)
+            self.assertIn("--array-delimiter", command)
+            self.assertEqual(neo.verify_admin_import(tmp), [])
+
+            nodes = pd.read_csv(os.path.join(tmp, neo.NODE_FILE))
+            edges = pd.read_csv(os.path.join(tmp, neo.EDGE_FILE), keep_default_na=False)
+
+        # repeated compound C2 keeps its last attributes
+        self.assertEqual(list(nodes.columns), neo.NODE_HEADER)
+        self.assertEqual(nodes['c_id:ID(Compound)'].tolist(), ['C1', 'C3', 'C4', 'C2'])
+        self.assertEqual(nodes.loc[nodes['c_id:ID(Compound)'] == 'C2', 'origin'].item(), 'both')
+
+        # repeated pair C1 → C3 keeps its last reaction; C9 is not a node so its edge is dropped
+        self.assertEqual(edges['reaction'].tolist(), ['rn2', 'rn3', 'rn4'])
+        self.assertEqual(edges['KOs:string[]'].tolist(), ['K00002;K00003', 'K00004', ''])
+
+    def test_verify_reports_problems(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            neo.export_admin_import(nodes_df, edges_df, tmp)
+            path = os.path.join(tmp, neo.EDGE_FILE)
+            edges = pd.read_csv(path, keep_default_na=False)
+            edges.loc[0, ':END_ID(Compound)'] = 'C42'
+            edges.loc[1, 'KOs:string[]'] = 'K00004;reaction'
+            edges.to_csv(path, index=False)
+
+            problems = neo.verify_admin_import(tmp)
+        self.assertEqual(len(problems), 2)
+        self.assertTrue(any('not nodes' in p for p in problems))
+        self.assertTrue(any('not KO IDs' in p for p in problems))
+
+    def test_batch_rows_use_none_for_missing(self):
+        rows = neo.to_rows(nodes_df, ['compound', 'assoc_food', 'freq'])
+        self.assertEqual(rows[1], {'compound': 'C2', 'assoc_food': None, 'freq': 100.0})
+        self.assertIsNone(rows[2]['freq'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+import unittest
+from itertools import product
+import numpy as np
+import pandas as pd
+from dietmicrobenet import patterns
+
+
+def random_tables(n_nodes, n_edges, seed, origins=('a', 'b', 'c', 'none')):
+    """Random node and edge tables with repeated compound pairs."""
+    rng = np.random.default_rng(seed)
+    compounds = [f'C{i:04d}' for i in range(n_nodes)]
+    nodes_df = pd.DataFrame({
+        'compound': compounds,
+        'origin': rng.choice(list(origins), size=n_nodes),
+        'freq': rng.integers(0, 10, size=n_nodes).astype(float),
+    })
+    edges_df = pd.DataFrame({
+        'compound1': rng.choice(compounds, size=n_edges),
+        'compound2': rng.choice(compounds, size=n_edges),
+        'reaction': [f'rn{i}' for i in range(n_edges)],
+    })
+    return nodes_df, edges_df
+
+
+def brute_force_paths(graph, spec):
+    """Nested loops over every edge, in edge order."""
+    positions = patterns.parse_pattern(spec)
+    origins = np.array(list(graph.origins) + [None], dtype=object)[graph.origin_codes]
+    out_edges = {}
+    for e, s in enumerate(graph.source):
+        out_edges.setdefault(s, []).append(e)
+
+    paths = [[e] for e in range(len(graph.edges))
+             if origins[graph.source[e]] in positions[0] and origins[graph.target[e]] in positions[1]]
+    for hop in range(1, len(positions) - 1):
+        paths = [p + [e] for p in paths for e in out_edges.get(graph.target[p[-1]], [])
+                 if origins[graph.target[e]] in positions[hop + 1]]
+    return [tuple(p) for p in paths]
+
+
+class MyTestCase(unittest.TestCase):
+    def test_parse_pattern(self):
+        parsed = patterns.parse_pattern('diet|microbediet -> microbe ->host|all')
+        self.assertEqual(parsed, (('diet', 'microbediet'), ('microbe',), ('host', 'all')))
+
+    def test_parse_pattern_errors(self):
+        with self.assertRaises(ValueError):
+            patterns.parse_pattern('diet')
+        with self.assertRaises(ValueError):
+            patterns.parse_pattern('diet -> | -> host')
+
+    def test_host_pattern_expands_to_36(self):
+        expanded = patterns.expand_pattern(patterns.HOST_PATTERN)
+        self.assertEqual(len(expanded), 36)
+        self.assertEqual(expanded[0], ('diet', 'microbe', 'host'))
+        self.assertEqual(expanded[-1], ('all', 'all', 'all'))
+        self.assertEqual(patterns.pattern_key(expanded[0]), 'diet_microbe_host')
+        self.assertEqual(patterns.pattern_label(expanded[0]), 'diet → microbe → host')
+
+    def test_plan_starts_from_most_selective_hop(self):
+        nodes_df = pd.DataFrame({'compound': ['A', 'B', 'C', 'D'], 'origin': ['a', 'b', 'b', 'c']})
+        edges_df = pd.DataFrame({'compound1': ['A', 'A', 'B', 'B', 'C', 'C', 'B'],
+                                 'compound2': ['B', 'C', 'C', 'B', 'B', 'C', 'D']})
+        graph = patterns.GraphTables.from_frames(nodes_df, edges_df)
+        plan = patterns.plan_pattern(graph, 'a -> b -> b -> c')
+        self.assertEqual(plan.estimates, [2, 4, 1])
+        self.assertEqual(plan.order[0], 2)
+        self.assertEqual(sorted(plan.order), [0, 1, 2])
+
+    def test_join_on_keys(self):
+        i, j = patterns.join_on_keys(np.array([3, 1, 3, 7]), np.array([3, 2, 3, 1]))
+        self.assertEqual(list(zip(i, j)), [(0, 0), (0, 2), (1, 3), (2, 0), (2, 2)])
+
+    def test_paths_match_brute_force(self):
+        nodes_df, edges_df = random_tables(n_nodes=60, n_edges=400, seed=11)
+        graph = patterns.GraphTables.from_frames(nodes_df, edges_df)
+        for spec in ['a -> b', 'a|b -> c -> a|c', 'a -> b|c -> c -> a|b|c', 'none -> a']:
+            with self.subTest(spec=spec):
+                paths = patterns.execute_plan(graph, patterns.plan_pattern(graph, spec))
+                self.assertEqual([tuple(p) for p in paths], brute_force_paths(graph, spec))
+
+    def test_match_patterns_union(self):
+        nodes_df, edges_df = random_tables(n_nodes=40, n_edges=200, seed=2)
+        graph = patterns.GraphTables.from_frames(nodes_df, edges_df)
+        union = patterns.match_patterns(graph, ['a -> b', 'a|c -> b', 'c -> c'])
+        expected = sorted(set(brute_force_paths(graph, 'a|c -> b')) | set(brute_force_paths(graph, 'c -> c')))
+        self.assertEqual([tuple(p) for p in union], expected)
+
+        with self.assertRaises(ValueError):
+            patterns.match_patterns(graph, ['a -> b', 'a -> b -> c'])
+
+    def test_iter_paths_chunks_concatenate_to_full_result(self):
+        nodes_df, edges_df = random_tables(n_nodes=50, n_edges=500, seed=4)
+        graph = patterns.GraphTables.from_frames(nodes_df, edges_df)
+        for specs in (['a|b -> b|c -> a|c'], ['a -> b -> c', 'a|c -> b -> c|a'], ['a|b -> b|c -> a|c -> b']):
+            expected = patterns.match_patterns(graph, specs)
+            for chunk_size in (1, 7, 100, 10 ** 6):
+                with self.subTest(specs=specs, chunk_size=chunk_size):
+                    chunks = list(patterns.iter_paths(graph, specs, chunk_size))
+                    np.testing.assert_array_equal(np.vstack(chunks), expected)
+                    self.assertTrue(all(len(chunk) <= chunk_size for chunk in chunks))
+                    if chunk_size >= len(expected):
+                        self.assertEqual(len(chunks), 1)
+
+    def test_count_completions(self):
+        nodes_df, edges_df = random_tables(n_nodes=50, n_edges=500, seed=8)
+        graph = patterns.GraphTables.from_frames(nodes_df, edges_df)
+        plan = patterns.plan_pattern(graph, 'a -> b|c -> c')
+        hop_edges = patterns.filter_hops(graph, plan)
+        paths = patterns.execute_plan(graph, plan, hop_edges)
+        counts = patterns.count_completions(graph, hop_edges)
+        self.assertEqual(counts.sum(), len(paths))
+
+    def test_aggregate_parallel_edges(self):
+        edges_df = pd.DataFrame({
+            'compound1': ['A', 'B', 'A', 'A'],
+            'compound2': ['B', 'C', 'B', 'B'],
+            'reaction': ['R2', 'R3', 'R1', 'R2'],
+            'KOs': ["['K00002']", "['K00003']", "['K00001', 'K00002']", "['K00002']"],
+            'organisms': ["['org1']", np.nan, np.nan, "['org1']"],
+            'abundance': [1.0, 5.0, 2.0, 1.0],
+        })
+        agg = patterns.aggregate_parallel_edges(edges_df)
+        self.assertEqual(agg['compound1'].tolist(), ['A', 'B'])
+        self.assertEqual(agg['reaction'].tolist(), ["['R1', 'R2']", 'R3'])
+        self.assertEqual(agg['KOs'].tolist(), ["['K00001', 'K00002']", "['K00003']"])
+        self.assertEqual(agg['organisms'].iloc[0], "['org1']")
+        self.assertTrue(pd.isna(agg['organisms'].iloc[1]))
+        self.assertEqual(agg['abundance'].tolist(), [4.0, 5.0])
+
+    def test_aggregate_splits_cells_like_parse_ko_cell(self):
+        """tuple strings and padded lists are split the same way as by the comparison scripts."""
+        edges_df = pd.DataFrame({
+            'compound1': ['A', 'A'],
+            'compound2': ['B', 'B'],
+            'reaction': ["('R2', 'R1')", " ['R3']"],
+            'KOs': ["['K00002', 'KO1']", 'K00001'],
+            'abundance': [1.0, 2.0],
+        })
+        agg = patterns.aggregate_parallel_edges(edges_df)
+        self.assertEqual(agg['reaction'].tolist(), ["['R1', 'R2', 'R3']"])
+        self.assertEqual(agg['KOs'].tolist(), ["['K00001', 'K00002', 'KO1']"])
+
+    def test_aggregate_keeps_non_parallel_edges(self):
+        """a pair with one reaction reads the same with and without aggregation."""
+        edges_df = pd.DataFrame({
+            'compound1': ['A', 'B'],
+            'compound2': ['B', 'C'],
+            'reaction': ['R00001', 'R00002'],
+            'KOs': ["['K00001']", "['K00002', 'K00003']"],
+            'organisms': ['org1', np.nan],
+            'abundance': [1.0, 2.0],
+        })
+        pd.testing.assert_frame_equal(patterns.aggregate_parallel_edges(edges_df), edges_df)
+
+    def test_multi_edges_independent_of_edge_order(self):
+        nodes_df, edges_df = random_tables(n_nodes=20, n_edges=300, seed=9)
+        edges_df['KOs'] = [f"['K{i % 7:05d}']" for i in range(len(edges_df))]
+        shuffled = edges_df.sample(frac=1.0, random_state=1)
+
+        results = []
+        for edges in (edges_df, shuffled):
+            graph = patterns.GraphTables.from_frames(nodes_df, edges, multi_edges=True)
+            df = patterns.materialize(graph, patterns.match_patterns(graph, ['a|b -> b|c']), ['origin'], ['reaction', 'KOs'])
+            results.append(df.sort_values(['compound1_id', 'compound2_id']).reset_index(drop=True))
+        pd.testing.assert_frame_equal(results[0], results[1])
+
+        # every reaction of a matching pair is kept
+        n_reactions = sum(len(patterns._parse_list(r)) for r in results[0]['edge1_reaction'])
+        pairs = edges_df.merge(nodes_df[['compound', 'origin']], left_on='compound1', right_on='compound')
+        pairs = pairs.merge(nodes_df[['compound', 'origin']], left_on='compound2', right_on='compound')
+        matching = pairs[pairs['origin_x'].isin(['a', 'b']) & pairs['origin_y'].isin(['b', 'c'])]
+        self.assertEqual(n_reactions, len(matching))
+
+    def test_materialize_columns(self):
+        nodes_df, edges_df = random_tables(n_nodes=30, n_edges=100, seed=5)
+        graph = patterns.GraphTables.from_frames(nodes_df, edges_df)
+        paths = patterns.match_patterns(graph, ['a -> b -> c'])
+        df = patterns.materialize(graph, paths, ['origin', 'freq'], ['reaction'])
+        self.assertEqual(list(df.columns), [
+            'compound1_id', 'compound1_origin', 'compound1_freq', 'edge1_reaction',
+            'compound2_id', 'compound2_origin', 'compound2_freq', 'edge2_reaction',
+            'compound3_id', 'compound3_origin', 'compound3_freq'])
+        self.assertTrue((df['compound1_origin'] == 'a').all())
+        self.assertTrue((df['compound3_origin'] == 'c').all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import unittest
+from fractions import Fraction
+import numpy as np
+from skbio import DistanceMatrix
+from skbio.stats.distance import permanova as skbio_permanova
+from dietmicrobenet import permanova
+from dietmicrobenet.similarity import jaccard_similarity
+
+
+def random_distances(seed, n, n_kos=40):
+    rng = np.random.default_rng(seed)
+    ko_sets = [list(np.flatnonzero(rng.random(n_kos) > 0.5)) for _ in range(n)]
+    return 1.0 - jaccard_similarity(ko_sets)
+
+
+def exact_p_value(tenths, grouping, permutations, seed):
+    """Reference p-value with pseudo-F compared in exact rational arithmetic."""
+    n = len(grouping)
+    labels, codes = np.unique(grouping, return_inverse=True)
+    sizes = np.bincount(codes)
+    d2 = [[Fraction(int(tenths[i, j]) ** 2, 100) for j in range(n)] for i in range(n)]
+    s_T = sum(d2[i][j] for i in range(n) for j in range(n)) / n / 2
+
+    def f_stat(groups):
+        s_W = sum(d2[i][j] / sizes[groups[i]] for i in range(n) for j in range(n) if groups[i] == groups[j]) / 2
+        return ((s_T - s_W) / (len(labels) - 1)) / (s_W / (n - len(labels)))
+
+    observed = f_stat(codes)
+    orders = permanova.permutation_orders(n, permutations, seed)
+    hits = sum(f_stat(codes[order]) >= observed for order in orders)
+    return (hits + 1) / (permutations + 1)
+
+
+class MyTestCase(unittest.TestCase):
+    def assert_matches_skbio(self, distances, grouping, permutations, seed):
+        ids = [str(i) for i in range(len(grouping))]
+        expected = skbio_permanova(DistanceMatrix(distances, ids), grouping, permutations=permutations, seed=seed)
+        result = permanova.permanova(distances, grouping, permutations=permutations, seed=seed)
+        self.assertAlmostEqual(result['test statistic'], expected['test statistic'], places=9)
+        if permutations:
+            self.assertEqual(result['p-value'], expected['p-value'])
+        else:
+            self.assertTrue(np.isnan(result['p-value']))
+        for field in ('sample size', 'number of groups', 'number of permutations'):
+            self.assertEqual(result[field], expected[field])
+
+    def test_matches_skbio(self):
+        rng = np.random.default_rng(0)
+        for seed, (n, k) in enumerate([(8, 2), (25, 3), (70, 4)]):
+            grouping = rng.choice(['a', 'b', 'c', 'd'][:k], size=n)
+            grouping[:k] = ['a', 'b', 'c', 'd'][:k]
+            self.assert_matches_skbio(random_distances(seed, n), grouping, 999, seed=5)
+
+    def test_tied_permutations_match_skbio(self):
+        # 4 samples in 2 pairs: every permutation repeats one of 3 partitions
+        self.assert_matches_skbio(random_distances(1, 4), np.array(['A', 'A', 'B', 'B']), 500, seed=5)
+
+    def test_small_groups_match_skbio(self):
+        # few samples in pairs: the same partitions come up under many permutations
+        rng = np.random.default_rng(9)
+        for n in (4, 6, 8) * 5:
+            points = rng.random((n, 3))
+            distances = np.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=-1))
+            self.assert_matches_skbio(distances, np.repeat(['a', 'b', 'c', 'd'][:n // 2], 2), 199, seed=5)
+
+    def test_tied_statistics_counted_exactly(self):
+        # distances in tenths: distinct groupings often have exactly the same pseudo-F,
+        # which floating-point sums (and so skbio's strict >=) can miss
+        rng = np.random.default_rng(10)
+        for _ in range(25):
+            points = rng.random((8, 3))
+            tenths = np.rint(10 * np.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=-1))).astype(int)
+            distances = tenths / 10
+            grouping = np.repeat(['a', 'b', 'c', 'd'], 2)
+            result = permanova.permanova(distances, grouping, permutations=199, seed=5)
+            self.assertEqual(result['p-value'], exact_p_value(tenths, grouping, 199, seed=5))
+
+    def test_blocks_do_not_change_result(self):
+        distances, grouping = random_distances(2, 30), np.repeat(['x', 'y', 'z'], 10)
+        whole = permanova.permanova(distances, grouping, permutations=300, seed=3)
+        original = permanova.BLOCK_ENTRIES
+        permanova.BLOCK_ENTRIES = 30 * 3 * 7
+        try:
+            blocked = permanova.permanova(distances, grouping, permutations=300, seed=3)
+        finally:
+            permanova.BLOCK_ENTRIES = original
+        self.assertEqual(blocked['p-value'], whole['p-value'])
+
+    def test_generator_seed(self):
+        distances, grouping = random_distances(3, 20), np.repeat(['x', 'y'], 10)
+        from_int = permanova.permanova(distances, grouping, permutations=200, seed=7)
+        from_rng = permanova.permanova(distances, grouping, permutations=200, seed=np.random.default_rng(7))
+        self.assertEqual(from_int['p-value'], from_rng['p-value'])
+
+    def test_many_same_for_any_worker_count(self):
+        tests = [(random_distances(seed, 15), np.repeat(['x', 'y', 'z'], 5)) for seed in range(4)]
+        serial = permanova.permanova_many(tests, permutations=199, seed=5, engine="native")
+        parallel = permanova.permanova_many(tests, permutations=199, seed=5, workers=2, engine="native")
+        # the four tests over 15 samples share one draw of the orders
+        self.assertIn((15, 199, 5), permanova._orders_cache)
+        for (distances, grouping), a, b in zip(tests, serial, parallel):
+            self.assertTrue(a.equals(b))
+            # each test gets the permutations of a single call with the same seed
+            self.assertTrue(a.equals(permanova.permanova(distances, grouping, permutations=199, seed=5)))
+
+    def test_many_defaults_to_skbio(self):
+        # 8 samples in 2 groups of 4 over distances in tenths: only 35 partitions, many tied pseudo-F,
+        # and in one test the native engine counts ties that skbio's sums round away
+        rng = np.random.default_rng(0)
+        tests = []
+        for _ in range(6):
+            tenths = np.triu(rng.integers(1, 11, size=(8, 8)), 1)
+            tests.append(((tenths + tenths.T) / 10.0, np.repeat(['a', 'b'], 4)))
+        serial = permanova.permanova_many(tests, permutations=5000, seed=5)
+        parallel = permanova.permanova_many(tests, permutations=5000, seed=5, workers=2)
+        for (distances, grouping), a, b in zip(tests, serial, parallel):
+            ids = [str(i) for i in range(len(grouping))]
+            expected = skbio_permanova(DistanceMatrix(distances, ids), grouping, permutations=5000, seed=5)
+            self.assertTrue(a.equals(expected))
+            self.assertTrue(b.equals(expected))
+
+    def test_many_engine_options(self):
+        tests = [(random_distances(0, 10), np.repeat(['x', 'y'], 5))]
+        with self.assertRaises(ValueError):
+            permanova.permanova_many(tests, engine="numpy")
+        # early stopping is only in the native engine
+        with self.assertRaises(ValueError):
+            permanova.permanova_many(tests, early_stop=True)
+        stopped, = permanova.permanova_many(tests, permutations=5000, seed=5, engine="native", early_stop=True)
+        self.assertLessEqual(stopped['number of permutations'], 5000)
+
+    def test_many_needs_integer_seed(self):
+        tests = [(random_distances(0, 10), np.repeat(['x', 'y'], 5))]
+        with self.assertRaises(TypeError):
+            permanova.permanova_many(tests, seed=np.random.default_rng(5))
+
+    def test_early_stop_at_exceedances(self):
+        # no group structure: the 20th exceedance comes long before 5000 permutations
+        distances, grouping = random_distances(7, 24), np.repeat(['x', 'y'], 12)
+        result = permanova.permanova(distances, grouping, permutations=5000, seed=5, early_stop=True)
+        used = result['number of permutations']
+        self.assertLess(used, 5000)
+        self.assertEqual(result['p-value'], permanova.EARLY_STOP_EXCEEDANCES / used)
+        # the permutations used are the first of a full run, the last one an exceedance
+        before = permanova.permanova(distances, grouping, permutations=used - 1, seed=5)
+        upto = permanova.permanova(distances, grouping, permutations=used, seed=5)
+        self.assertEqual(before['p-value'], permanova.EARLY_STOP_EXCEEDANCES / used)
+        self.assertEqual(upto['p-value'], (permanova.EARLY_STOP_EXCEEDANCES + 1) / (used + 1))
+
+    def test_early_stop_when_interval_excludes_alpha(self):
+        # two clearly separated groups: no exceedances, stops once the p-value is surely < alpha
+        rng = np.random.default_rng(7)
+        ko_sets = [list(rng.choice(20, 12, replace=False) + (0 if i < 10 else 20)) for i in range(20)]
+        distances, grouping = 1.0 - jaccard_similarity(ko_sets), np.repeat(['x', 'y'], 10)
+        result = permanova.permanova(distances, grouping, permutations=5000, seed=5, early_stop=True)
+        used = result['number of permutations']
+        self.assertLess(used, 5000)
+        self.assertEqual(used % permanova.SEQUENTIAL_BATCH, 0)
+        self.assertEqual(result['p-value'], 1 / (used + 1))
+
+    def test_early_stop_without_stopping_matches_full_run(self):
+        distances, grouping = random_distances(8, 30), np.repeat(['x', 'y', 'z'], 10)
+        full = permanova.permanova(distances, grouping, permutations=450, seed=5)
+        sequential = permanova.permanova(distances, grouping, permutations=450, seed=5, early_stop=True,
+                                         exceedances=10 ** 6, confidence=1.0)
+        self.assertTrue(full.equals(sequential))
+
+    def test_interval_excludes(self):
+        self.assertTrue(permanova.interval_excludes(0, 300, 0.05))
+        self.assertFalse(permanova.interval_excludes(0, 50, 0.05))
+        self.assertTrue(permanova.interval_excludes(60, 200, 0.05))
+        self.assertFalse(permanova.interval_excludes(10, 200, 0.05))
+
+    def test_orders_cache_stays_within_budget(self):
+        original = permanova.ORDERS_CACHE_BYTES
+        permanova.clear_orders_cache()
+        permanova.ORDERS_CACHE_BYTES = 2 * 100 * 30  # two 100 x 30 uint8 order arrays
+        try:
+            first = permanova.permutation_orders(30, 100, 1)
+            self.assertEqual(first.dtype, np.uint8)
+            self.assertIs(permanova.permutation_orders(30, 100, 1), first)
+            for seed in (2, 3):
+                permanova.permutation_orders(30, 100, seed)
+            self.assertLessEqual(sum(o.nbytes for o in permanova._orders_cache.values()), permanova.ORDERS_CACHE_BYTES)
+            # the oldest orders were dropped and are drawn again, identically
+            again = permanova.permutation_orders(30, 100, 1)
+            self.assertIsNot(again, first)
+            np.testing.assert_array_equal(again, first)
+        finally:
+            permanova.ORDERS_CACHE_BYTES = original
+            permanova.clear_orders_cache()
+
+    def test_zero_permutations(self):
+        self.assert_matches_skbio(random_distances(4, 10), np.repeat(['x', 'y'], 5), 0, seed=5)
+
+    def test_invalid_groupings_raise(self):
+        distances = random_distances(5, 4)
+        with self.assertRaises(ValueError):
+            permanova.permanova(distances, ['a', 'b', 'c', 'd'])
+        with self.assertRaises(ValueError):
+            permanova.permanova(distances, ['a'] * 4)
+        with self.assertRaises(ValueError):
+            permanova.permanova(distances, ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from collections import deque
+import numpy as np
+import pandas as pd
+from dietmicrobenet import patterns, reachability
+
+
+def random_graph(n_nodes, n_edges, seed):
+    rng = np.random.default_rng(seed)
+    compounds = [f'C{i:04d}' for i in range(n_nodes)]
+    nodes_df = pd.DataFrame({
+        'compound': compounds,
+        'origin': rng.choice(['diet', 'microbe', 'host', 'none'], size=n_nodes, p=[0.2, 0.5, 0.2, 0.1]),
+    })
+    edges_df = pd.DataFrame({
+        'compound1': rng.choice(compounds, size=n_edges),
+        'compound2': rng.choice(compounds, size=n_edges),
+        'reaction': [f'rn{i}' for i in range(n_edges)],
+    })
+    return patterns.GraphTables.from_frames(nodes_df, edges_df)
+
+
+def brute_force(graph, sources, via, targets, max_hops):
+    """BFS per source over python adjacency lists, counting shortest paths."""
+    origin = np.array(list(graph.origins) + [None], dtype=object)[graph.origin_codes]
+    succ = {}
+    for s, t in zip(graph.source, graph.target):
+        succ.setdefault(s, []).append(t)
+
+    rows = []
+    for s in range(len(graph.node_ids)):
+        if origin[s] not in sources:
+            continue
+        dist, count = {s: 0}, {s: 1}
+        found = {}
+        queue = deque([s])
+        while queue:
+            u = queue.popleft()
+            if dist[u] == max_hops:
+                continue
+            for v in succ.get(u, []):
+                hops = dist[u] + 1
+                if v != s and origin[v] in targets and (v not in found or found[v][0] == hops):
+                    found[v] = (hops, found.get(v, (hops, 0))[1] + count[u])
+                if via is not None and origin[v] not in via:
+                    continue
+                if v not in dist:
+                    dist[v], count[v] = hops, count[u]
+                    queue.append(v)
+                elif dist[v] == hops:
+                    count[v] += count[u]
+        for v, (hops, n) in found.items():
+            rows.append((graph.node_ids[s], graph.node_ids[v], hops, n))
+    return sorted(rows)
+
+
+class MyTestCase(unittest.TestCase):
+    def test_bitsets(self):
+        bits = reachability.bitset(3, 130)
+        reachability.set_bits(bits, np.array([0, 0, 2, 2]), np.array([1, 129, 64, 64]))
+        rows = np.array([0, 0, 1, 2, 2])
+        cols = np.array([1, 129, 1, 64, 63])
+        self.assertEqual(reachability.has_bits(bits, rows, cols).tolist(), [True, True, False, True, False])
+
+    def test_small_chain(self):
+        nodes_df = pd.DataFrame({'compound': ['D', 'M1', 'M2', 'H', 'X'],
+                                 'origin': ['diet', 'microbe', 'microbe', 'host', 'none']})
+        edges_df = pd.DataFrame({'compound1': ['D', 'D', 'M1', 'M2', 'M2', 'D', 'X'],
+                                 'compound2': ['M1', 'M2', 'M2', 'H', 'M1', 'X', 'H'],
+                                 'reaction': list('abcdefg')})
+        graph = patterns.GraphTables.from_frames(nodes_df, edges_df)
+
+        res = reachability.reachable(graph, 'diet -> microbe -> host', max_hops=5)
+        self.assertEqual(list(res.columns), reachability.REACH_COLUMNS)
+        self.assertEqual(res[['source_id', 'target_id', 'min_hops', 'n_paths']].values.tolist(), [['D', 'H', 2, 1]])
+
+        # no via constraint: D → X → H is also a shortest path
+        res = reachability.reachable(graph, 'diet -> host', max_hops=5)
+        self.assertEqual(res[['min_hops', 'n_paths']].values.tolist(), [[2, 2]])
+
+        self.assertEqual(len(reachability.reachable(graph, 'diet -> microbe -> host', max_hops=1)), 0)
+
+    def test_matches_brute_force(self):
+        for seed in range(3):
+            graph = random_graph(n_nodes=150, n_edges=450, seed=seed)
+            for spec, via in [('diet -> microbe -> host', ('microbe',)),
+                              ('diet|microbe -> microbe|host -> host', ('microbe', 'host')),
+                              ('diet -> host', None)]:
+                positions = patterns.parse_pattern(spec)
+                expected = brute_force(graph, positions[0], via, positions[-1], max_hops=4)
+                res = reachability.reachable(graph, spec, max_hops=4, batch_size=16)
+                got = sorted(zip(res['source_id'], res['target_id'], res['min_hops'], res['n_paths']))
+                self.assertEqual(got, expected, f'seed {seed}, {spec}')
+
+    def test_sources_subset(self):
+        graph = random_graph(n_nodes=150, n_edges=450, seed=4)
+        full = reachability.reachable(graph, 'diet -> microbe -> host', max_hops=4)
+        chosen = full['source_id'].unique()[:3]
+        sub = reachability.reachable(graph, 'diet -> microbe -> host', max_hops=4, sources=chosen)
+        pd.testing.assert_frame_equal(sub, full[full['source_id'].isin(chosen)].reset_index(drop=True))
+
+    def test_long_pattern_rejected(self):
+        graph = random_graph(n_nodes=20, n_edges=40, seed=1)
+        with self.assertRaises(ValueError):
+            reachability.reachable(graph, 'diet -> microbe -> microbe -> host', max_hops=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import run_graph as rg
+from dietmicrobenet.results import node_table_path, read_results
+
+# create dummy data
+nodes_df = pd.DataFrame({
+    'compound': ['C1', 'C2', 'C3', 'C4', 'C5', 'C6'],
+    'origin': ['food', 'food', 'microbe', 'both', 'both', 'none'],
+    'assoc_food': ["['apple']", "['apple', 'pear']", np.nan, "['pear']", np.nan, np.nan],
+    'freq': [60.0, 100.0, np.nan, 40.0, np.nan, np.nan]
+})
+
+edges_df = pd.DataFrame({
+    'compound1': ['C1', 'C4', 'C2', 'C1', 'C3', 'C4', 'C6', 'C1'],
+    'compound2': ['C3', 'C5', 'C4', 'C6', 'C4', 'C5', 'C3', 'C4'],
+    'reaction': ['rn1', 'rn2', 'rn3', 'rn4', 'rn5', 'rn6', 'rn7', 'rn8'],
+    'KOs': ["['K00001']", "['K00002']", "['K00003']", "['K00004']",
+            "['K00005']", "['K00006']", "['K00007']", "['K00008']"],
+    'organisms': ['org1', 'org2', 'org3', 'org4', 'org5', 'org6', 'org7', 'org8'],
+    'abundance': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]
+})
+
+
+def random_graph(n_nodes, n_edges, seed):
+    """Random node/edge tables including duplicated compound pairs."""
+    rng = np.random.default_rng(seed)
+    compounds = [f'C{i:05d}' for i in range(n_nodes)]
+    nodes = pd.DataFrame({
+        'compound': compounds,
+        'origin': rng.choice(['food', 'microbe', 'both', 'none'], size=n_nodes),
+        'assoc_food': rng.choice(["['apple']", "['pear']", None], size=n_nodes),
+        'freq': rng.integers(0, 100, size=n_nodes).astype(float)
+    })
+    edges = pd.DataFrame({
+        'compound1': rng.choice(compounds, size=n_edges),
+        'compound2': rng.choice(compounds, size=n_edges),
+        'reaction': [f'rn{i}' for i in range(n_edges)],
+        'KOs': [f"['K{i:05d}']" for i in range(n_edges)],
+        'organisms': rng.choice(['org1', 'org2'], size=n_edges),
+        'abundance': rng.random(n_edges)
+    })
+    return nodes, edges
+
+
+class MyTestCase(unittest.TestCase):
+    def test_frame_columns(self):
+        res = rg.frame_patterns(nodes_df, edges_df)
+        self.assertEqual(list(res.columns), rg.RESULT_COLUMNS)
+        self.assertEqual(len(rg.RESULT_COLUMNS), 12)
+
+    def test_frame_patterns_match(self):
+        res = rg.frame_patterns(nodes_df, edges_df)
+        found = set(zip(res['compound1_origin'], res['compound2_origin']))
+        self.assertEqual(found, {('food', 'microbe'), ('food', 'both'), ('both', 'both')})
+
+        # C3 (microbe) → C4 and anything touching C6 (none) never match
+        self.assertNotIn('rn5', res['reaction'].tolist())
+        self.assertNotIn('rn4', res['reaction'].tolist())
+        self.assertNotIn('rn7', res['reaction'].tolist())
+
+    def test_duplicate_edges_keep_last_attributes(self):
+        """C4 → C5 appears twice; like nx.DiGraph the last reaction wins."""
+        res = rg.frame_patterns(nodes_df, edges_df)
+        both = res[(res['compound1_id'] == 'C4') & (res['compound2_id'] == 'C5')]
+        self.assertEqual(both['reaction'].tolist(), ['rn6'])
+
+    def test_frame_matches_networkx(self):
+        expected = rg.networkx_patterns(nodes_df, edges_df)
+        res = rg.frame_patterns(nodes_df, edges_df)
+        pd.testing.assert_frame_equal(res, expected, check_dtype=False)
+
+    def test_frame_matches_networkx_random(self):
+        nodes, edges = random_graph(n_nodes=200, n_edges=2000, seed=3)
+        expected = rg.networkx_patterns(nodes, edges)
+        res = rg.frame_patterns(nodes, edges)
+        pd.testing.assert_frame_equal(res, expected, check_dtype=False)
+
+    def test_custom_pattern(self):
+        res = rg.frame_patterns(nodes_df, edges_df, specs=['microbe -> both'])
+        self.assertEqual(res['reaction'].tolist(), ['rn5'])
+
+    def test_two_hop_pattern_columns(self):
+        res = rg.frame_patterns(nodes_df, edges_df, specs=['food -> both -> both'])
+        self.assertEqual(res['edge1_reaction'].tolist(), ['rn8', 'rn3'])
+        self.assertEqual(res['edge2_reaction'].tolist(), ['rn6', 'rn6'])
+
+    def test_networkx_rejects_multi_hop_patterns(self):
+        with self.assertRaises(ValueError):
+            rg.networkx_patterns(nodes_df, edges_df, specs=['food -> both -> both'])
+
+    def test_streamed_output_matches_single_write(self):
+        nodes, edges = random_graph(n_nodes=200, n_edges=2000, seed=5)
+        with tempfile.TemporaryDirectory() as tmp:
+            expected = os.path.join(tmp, 'expected.csv')
+            streamed = os.path.join(tmp, 'streamed.csv')
+            rg.frame_patterns(nodes, edges).to_csv(expected, index=False)
+            rg.write_patterns(nodes, edges, streamed, chunk_size=50)
+
+            with open(expected) as fh_expected, open(streamed) as fh_streamed:
+                self.assertEqual(fh_streamed.read(), fh_expected.read())
+
+    def test_workers_output_matches_single_process(self):
+        nodes, edges = random_graph(n_nodes=200, n_edges=2000, seed=7)
+        with tempfile.TemporaryDirectory() as tmp:
+            single = os.path.join(tmp, 'single.csv')
+            pooled = os.path.join(tmp, 'pooled.csv')
+            rg.write_patterns(nodes, edges, single, chunk_size=100)
+            n_rows = rg.write_patterns(nodes, edges, pooled, chunk_size=100, workers=3)
+
+            with open(single) as fh_single, open(pooled) as fh_pooled:
+                self.assertEqual(fh_pooled.read(), fh_single.read())
+            self.assertEqual(n_rows, len(rg.frame_patterns(nodes, edges)))
+
+    def test_compact_output_expands_to_full_output(self):
+        nodes, edges = random_graph(n_nodes=200, n_edges=2000, seed=8)
+        with tempfile.TemporaryDirectory() as tmp:
+            full = os.path.join(tmp, 'full.csv')
+            compact = os.path.join(tmp, 'compact.csv')
+            rg.write_patterns(nodes, edges, full, chunk_size=100)
+            n_rows = rg.write_patterns(nodes, edges, compact, chunk_size=100, compact=True)
+
+            self.assertNotIn('compound1_origin', pd.read_csv(compact).columns)
+            self.assertTrue(node_table_path(compact).exists())
+            self.assertEqual(n_rows, len(pd.read_csv(full)))
+            pd.testing.assert_frame_equal(read_results(compact), read_results(full))
+
+    def test_projected_read_of_compact_output(self):
+        nodes, edges = random_graph(n_nodes=200, n_edges=2000, seed=8)
+        with tempfile.TemporaryDirectory() as tmp:
+            full = os.path.join(tmp, 'full.csv')
+            compact = os.path.join(tmp, 'compact.parquet')
+            rg.write_patterns(nodes, edges, full, chunk_size=100)
+            rg.write_patterns(nodes, edges, compact, chunk_size=100, compact=True)
+
+            columns = ['compound2_origin', 'KOs', 'compound1_origin', 'missing']
+            expected = read_results(full)[columns[:3]].astype('category')
+            for path in (full, compact):
+                pd.testing.assert_frame_equal(read_results(path, columns=columns, categorical=columns), expected,
+                                              check_categorical=False)
+
+    def test_sqlite_matches_frame(self):
+        nodes, edges = random_graph(n_nodes=200, n_edges=2000, seed=9)
+        with tempfile.TemporaryDirectory() as tmp:
+            nodes_csv = os.path.join(tmp, 'nodes.csv')
+            edges_csv = os.path.join(tmp, 'edges.csv')
+            nodes.to_csv(nodes_csv, index=False)
+            edges.to_csv(edges_csv, index=False)
+            expected = os.path.join(tmp, 'frame.csv')
+            rg.frame_patterns(pd.read_csv(nodes_csv), pd.read_csv(edges_csv)).to_csv(expected, index=False)
+
+            out = os.path.join(tmp, 'sqlite.csv')
+            for _ in range(2):  # the second run reuses the loaded database
+                rg.sqlite_patterns(nodes_csv, edges_csv, out, chunk_size=300)
+                with open(expected) as fh_expected, open(out) as fh_out:
+                    self.assertEqual(fh_out.read(), fh_expected.read())
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'edges.sqlite')))
+
+    def test_streamed_empty_output_has_header(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, 'empty.csv')
+            n_rows = rg.write_patterns(nodes_df.assign(origin='none'), edges_df, out)
+            self.assertEqual(n_rows, 0)
+            self.assertEqual(list(pd.read_csv(out).columns), rg.RESULT_COLUMNS)
+
+    def test_no_matches_keeps_columns(self):
+        res = rg.frame_patterns(nodes_df.assign(origin='none'), edges_df)
+        self.assertEqual(len(res), 0)
+        self.assertEqual(list(res.columns), rg.RESULT_COLUMNS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import numpy as np
+from dietmicrobenet import similarity
+
+
+def loop_jaccard(ko_sets):
+    """Reference: one Python set operation per pair, both empty -> 1.0."""
+    sets = [set(kos) for kos in ko_sets]
+    matrix = np.zeros((len(sets), len(sets)))
+    for i, a in enumerate(sets):
+        for j, b in enumerate(sets):
+            union = a | b
+            matrix[i, j] = len(a & b) / len(union) if union else 1.0
+    return matrix
+
+
+class MyTestCase(unittest.TestCase):
+    def test_matches_set_loop(self):
+        rng = np.random.default_rng(3)
+        kos = [f'K{i:05d}' for i in range(80)]
+        ko_sets = [list(rng.choice(kos, size=rng.integers(0, 40))) for _ in range(60)]
+        ko_sets += [[], []]
+        np.testing.assert_array_equal(similarity.jaccard_similarity(ko_sets), loop_jaccard(ko_sets))
+
+    def test_sparse_product_matches_set_loop(self):
+        rng = np.random.default_rng(4)
+        kos = [f'K{i:05d}' for i in range(5000)]
+        ko_sets = [list(rng.choice(kos, size=rng.integers(0, 6))) for _ in range(300)] + [[]]
+        X, _ = similarity.incidence_matrix(ko_sets)
+        self.assertLess(X.nnz / (X.shape[0] * X.shape[1]), similarity.DENSE_DENSITY)
+        np.testing.assert_array_equal(similarity.jaccard_matrix(X), loop_jaccard(ko_sets))
+
+    def test_both_empty_is_one(self):
+        matrix = similarity.jaccard_similarity([[], [], ['K00001']])
+        self.assertEqual(matrix[0, 1], 1.0)
+        self.assertEqual(matrix[0, 2], 0.0)
+        self.assertEqual(matrix[2, 2], 1.0)
+
+    def test_repeated_kos_count_once(self):
+        X, kos = similarity.incidence_matrix([['K1', 'K1', 'K2'], ['K2']])
+        self.assertEqual(list(kos), ['K1', 'K2'])
+        np.testing.assert_array_equal(X.toarray(), [[1, 1], [0, 1]])
+        self.assertEqual(similarity.jaccard_matrix(X)[0, 1], 0.5)
+
+    def test_subset_matrix_slices_by_label(self):
+        matrix = similarity.jaccard_similarity([['K1'], ['K1', 'K2'], ['K3']])
+        sub = similarity.subset_matrix(matrix, ['a', 'b', 'c'], ['c', 'a'])
+        np.testing.assert_array_equal(sub, matrix[np.ix_([2, 0], [2, 0])])
+
+    def test_cache_keys_by_name_and_samples(self):
+        cache = similarity.SimilarityCache()
+        kos = {'a': ['K1'], 'b': ['K1', 'K2']}
+        first, labels = cache.matrix('focal', kos)
+        again, _ = cache.matrix('focal', kos)
+        self.assertIs(again, first)
+        self.assertEqual(labels, ['a', 'b'])
+        cache.matrix('focal', {'b': ['K1', 'K2'], 'a': ['K1']})
+        cache.matrix('aggregate', kos)
+        self.assertEqual(cache.computed, 3)
+
+    def test_cross_block_matches_full_matrix(self):
+        rng = np.random.default_rng(5)
+        kos = [f'K{i:05d}' for i in range(50)]
+        ko_sets = [list(rng.choice(kos, size=rng.integers(0, 20))) for _ in range(20)] + [[]]
+        X, _ = similarity.incidence_matrix(ko_sets)
+        full = similarity.jaccard_matrix(X)
+        np.testing.assert_array_equal(similarity.jaccard_cross(X[15:], X), full[15:])
+
+    def test_cache_put_is_used(self):
+        cache = similarity.SimilarityCache()
+        kos = {'a': ['K1'], 'b': ['K1', 'K2']}
+        stored = np.array([[1.0, 0.5], [0.5, 1.0]])
+        cache.put('focal', stored, ['a', 'b'])
+        matrix, _ = cache.matrix('focal', kos)
+        self.assertIs(matrix, stored)
+        self.assertEqual(cache.computed, 0)
+
+    def test_no_samples(self):
+        self.assertEqual(similarity.jaccard_similarity([]).shape, (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from dietmicrobenet import patterns, snapshot
+
+
+def write_tables(tmp, seed, n_nodes=200, n_edges=2000):
+    """Random node/edge CSVs with missing text and numeric values."""
+    rng = np.random.default_rng(seed)
+    compounds = [f'C{i:05d}' for i in range(n_nodes)]
+    nodes_df = pd.DataFrame({
+        'compound': compounds,
+        'origin': rng.choice(['food', 'microbe', 'both', None], size=n_nodes),
+        'assoc_food': rng.choice(["['apple']", "['pear', 'épinard']", None], size=n_nodes),
+        'freq': rng.choice([1.0, 50.0, np.nan], size=n_nodes),
+    })
+    edges_df = pd.DataFrame({
+        'compound1': rng.choice(compounds + ['C99999'], size=n_edges),
+        'compound2': rng.choice(compounds, size=n_edges),
+        'reaction': [f'rn{i}' for i in range(n_edges)],
+        'KOs': [f"['K{i % 50:05d}']" for i in range(n_edges)],
+        'organisms': rng.choice(['org1', None], size=n_edges),
+        'abundance': rng.random(n_edges),
+    })
+    nodes_csv = os.path.join(tmp, 'nodes.csv')
+    edges_csv = os.path.join(tmp, 'edges.csv')
+    nodes_df.to_csv(nodes_csv, index=False)
+    edges_df.to_csv(edges_csv, index=False)
+    return nodes_csv, edges_csv
+
+
+def all_paths(graph, spec='food|both -> microbe|both -> food|microbe|both'):
+    paths = patterns.match_patterns(graph, [spec])
+    return patterns.materialize(graph, paths, ['origin', 'assoc_food', 'freq'],
+                                ['reaction', 'KOs', 'organisms', 'abundance'])
+
+
+class MyTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            nodes_csv, edges_csv = write_tables(tmp, seed=1)
+            graph = patterns.GraphTables.from_frames(pd.read_csv(nodes_csv), pd.read_csv(edges_csv))
+            path = os.path.join(tmp, 'graph.npz')
+            snapshot.save_snapshot(graph, path)
+            loaded = snapshot.load_snapshot(path)
+
+            np.testing.assert_array_equal(loaded.source, graph.source)
+            np.testing.assert_array_equal(loaded.target, graph.target)
+            np.testing.assert_array_equal(loaded.node_ids, graph.node_ids)
+            self.assertEqual(list(loaded.origins), list(graph.origins))
+            pd.testing.assert_frame_equal(loaded.node_table, graph.node_table)
+            pd.testing.assert_frame_equal(loaded.edges, graph.edges)
+            pd.testing.assert_frame_equal(all_paths(loaded), all_paths(graph))
+
+    def test_load_graph_reuses_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            nodes_csv, edges_csv = write_tables(tmp, seed=2)
+            graph, cached = snapshot.load_graph(nodes_csv, edges_csv)
+            self.assertFalse(cached)
+            self.assertTrue(snapshot.snapshot_path(nodes_csv, edges_csv).exists())
+
+            again, cached = snapshot.load_graph(nodes_csv, edges_csv)
+            self.assertTrue(cached)
+            pd.testing.assert_frame_equal(all_paths(again), all_paths(graph))
+
+    def test_changed_csv_replaces_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            nodes_csv, edges_csv = write_tables(tmp, seed=3)
+            snapshot.load_graph(nodes_csv, edges_csv)
+            snapshot.load_graph(nodes_csv, edges_csv, multi_edges=True)
+            old = snapshot.snapshot_path(nodes_csv, edges_csv)
+
+            write_tables(tmp, seed=4)
+            graph, cached = snapshot.load_graph(nodes_csv, edges_csv)
+            self.assertFalse(cached)
+            self.assertFalse(old.exists())
+            expected = patterns.GraphTables.from_frames(pd.read_csv(nodes_csv), pd.read_csv(edges_csv))
+            pd.testing.assert_frame_equal(all_paths(graph), all_paths(expected))
+
+            # the multi-edge snapshot of the old CSVs is a separate cache entry
+            multi = [f for f in os.listdir(tmp) if '.multigraph-' in f]
+            self.assertEqual(len(multi), 1)
+
+    def test_multi_edges_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            nodes_csv, edges_csv = write_tables(tmp, seed=5)
+            expected = patterns.GraphTables.from_frames(pd.read_csv(nodes_csv), pd.read_csv(edges_csv),
+                                                        multi_edges=True)
+            snapshot.load_graph(nodes_csv, edges_csv, multi_edges=True)
+            graph, cached = snapshot.load_graph(nodes_csv, edges_csv, multi_edges=True)
+            self.assertTrue(cached)
+            pd.testing.assert_frame_equal(all_paths(graph), all_paths(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()